@@ -1,80 +1,141 @@
-import json
-import networkx as nx
-import os
-import matplotlib.pyplot as plt
-from itertools import combinations
-import community as community_louvain
-
-# Define the file path directly
-file_path = "C:\\Users\\annv4\\OneDrive - University of Oklahoma\\Annie's Research Files with Dr. Samuel Cheng\\YouTube Files\\Uz0vRIcJ5kg.txt"
+# Builds the co-commenter graph with NetworkX across any set of videos and finds its communities
+# Commenters are nodes; two commenters are linked, weighted by the number of videos both commented on
+# The videos come from a folder of <video_id>.txt files (all of them, a list of video IDs, or the videos returned
+# for one or more search phrases, see corpus_index.py), from a comment_store.py database, or from an earlier dump
+# The parsed comments are streamed to a newline-delimited JSON dump (networkx_comments.ndjson, see comment_dump.py)
+# as they are read, so the dump costs no extra memory and can be read back lazily with --from-dump
+# Communities and a layout are found without a window (see graph_analysis.py) and written to networkx_partition.csv,
+# networkx_layout.csv and the edge list networkx_edges.npz in the output folder; --draw also shows the graph
+# Examples:
+#   python NetworkX_makeGraph.py --directory "YouTube Files" --videos Uz0vRIcJ5kg vj9W9d72ErE --draw
+#   python NetworkX_makeGraph.py --directory "YouTube Files" --phrase "Russia Ukraine" --phrase "Russia and Ukraine" --top-n 50
+#   python NetworkX_makeGraph.py --store comments.sqlite --phrase "Russia Ukraine" --output results
+#   python NetworkX_makeGraph.py --from-dump results/networkx_comments.ndjson --min-weight 2
+#   python NetworkX_makeGraph.py --edge-list results/networkx_edges.npz --top-k 10 --trace-memory
+# Run python NetworkX_makeGraph.py --help for every option
 
+import argparse
+import os
+import sys
+import networkx as nx
+from comment_dump import dump_video_comments, iter_comment_dump
+from comment_parser import load_comments, video_id_from_path
+from comment_store import CommentStore
+from corpus_index import CorpusIndex, comment_files
+from graph_analysis import StageReport, analyze_edges, cocommenter_edges, load_edge_list, save_edge_list, to_networkx
 
-def parse_comments(file_path):
-    print(f"Reading and parsing file: {file_path}")
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.read().split('--------------------------------------------------\n')
-        for comment_block in lines:
-            comment_data = {}
-            lines_in_block = comment_block.strip().split('\n')
-            for line in lines_in_block:
-                if line.startswith('Author:') and '@' in line:
-                    comment_data['author'] = line.split('@')[1].strip()
-                elif line.startswith('Comment:'):
-                    comment_data['comment'] = line[len('Comment:'):].strip()
-                elif line.startswith('Likes:'):
-                    comment_data['likes'] = int(line[len('Likes:'):].strip())
-                elif line.startswith('Published At:'):
-                    comment_data['published_at'] = line[len('Published At:'):].strip()
-                elif line.startswith('Comment ID:'):
-                    comment_data['comment_id'] = line[len('Comment ID:'):].strip()
-            if 'author' in comment_data:
-                data.append(comment_data)
-    return data
-
-# Process the specific file
-comments_data = parse_comments(file_path)
+# (video_id, [CommentRecord, ...]) for the comment files in a folder picked by the options
+def directory_video_comments(args):
+    if args.phrase or args.videos or args.after or args.before or args.top_n or args.sample:
+        index = CorpusIndex(args.directory)
+        index.save()
+        filenames = index.select(args.phrase or None, args.after, args.before, args.top_n, args.sample, args.seed,
+                                 args.videos)
+    else:
+        filenames = comment_files(args.directory)
+    filenames = filenames[:args.limit]
+    for files_processed, filename in enumerate(filenames, 1):
+        print(f"Reading and parsing file {files_processed}/{len(filenames)}: {filename}")
+        file_path = os.path.join(args.directory, filename)
+        yield video_id_from_path(file_path), load_comments(file_path)
 
-# Save processed comments to a JSON file
-json_filename = os.path.join(os.path.dirname(file_path), 'specific_comments_data.json')
-with open(json_filename, 'w', encoding='utf-8') as json_file:
-    json.dump(comments_data, json_file, ensure_ascii=False, indent=4)
-print(f"Processed comments saved to JSON: {json_filename}")
+# The same from a comment_store.py database; a video returned for several phrases is read once
+def store_video_comments(args):
+    store = CommentStore(args.store)
+    if args.phrase:
+        seen = set()
+        videos = (video for phrase in args.phrase for video in store.iter_video_comments(phrase))
+        videos = (video for video in videos if not (video[0] in seen or seen.add(video[0])))
+        if args.videos:
+            video_ids = set(args.videos)
+            videos = (video for video in videos if video[0] in video_ids)
+    else:
+        videos = store.iter_video_comments(video_ids=args.videos)
+    for files_processed, (video_id, records) in enumerate(videos, 1):
+        if args.limit is not None and files_processed > args.limit:
+            break
+        print(f"Reading comments for video {files_processed}: {video_id}")
+        yield video_id, records
+    store.close()
 
-# Create and visualize the co-commenter network graph
-# (This part remains unchanged, just ensure the data loaded is from 'comments_data' instead of reading from the file again)
+def video_comments(args):
+    if args.from_dump:
+        return iter_comment_dump(args.from_dump)
+    if args.store:
+        return store_video_comments(args)
+    return directory_video_comments(args)
 
-G = nx.Graph()
-print("Creating the co-commenter network graph...")
+def draw_communities(edges, membership, positions):
+    import matplotlib.pyplot as plt  # Only needed with --draw
+    graph = to_networkx(edges)
+    community_count = int(membership.max()) + 1 if len(membership) else 1
+    cmap = plt.get_cmap('viridis')
+    pos = dict(enumerate(positions.tolist()))
+    plt.figure(figsize=(10, 10))
+    nx.draw_networkx_nodes(graph, pos, node_size=20,
+                           node_color=[cmap(community / community_count) for community in membership.tolist()])
+    nx.draw_networkx_edges(graph, pos, alpha=0.5)
+    plt.axis('off')
+    plt.show()
+    print("Visualization complete.")
 
-for comment in comments_data:
-    author = comment.get('author')
-    if author:
-        G.add_node(author)  # Ensure each author is added as a node
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Build the co-commenter graph of a set of videos and find its communities.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--directory', help="folder with the <video_id>.txt comment files")
+    source.add_argument('--store', help="comment_store.py database to read the comments from")
+    source.add_argument('--from-dump', help="comment dump (.ndjson) written by an earlier run")
+    source.add_argument('--edge-list', help="edge list (.npz) written by an earlier run; skips reading comments")
+    parser.add_argument('--videos', nargs='+', help="(--directory, --store) only these video IDs")
+    parser.add_argument('--phrase', action='append', default=[],
+                        help="(--directory, --store) only videos returned for this search phrase (repeatable)")
+    parser.add_argument('--after', help="(--directory) only videos published on or after this date, e.g. 2024-04-01")
+    parser.add_argument('--before', help="(--directory) only videos published on or before this date")
+    parser.add_argument('--top-n', type=int, help="(--directory) only the videos with the most comments")
+    parser.add_argument('--sample', type=int, help="(--directory) a random sample of this many videos")
+    parser.add_argument('--seed', type=int, default=0, help="seed for --sample (default 0)")
+    parser.add_argument('--limit', type=int, help="read at most this many videos")
+    parser.add_argument('--output', default='.', help="folder for the dump, edge list, partition and layout (default: current folder)")
+    parser.add_argument('--no-dump', action='store_true', help="do not write the comment dump")
+    parser.add_argument('--min-weight', type=int, default=1, help="drop edges between commenters sharing fewer videos")
+    parser.add_argument('--top-k', type=int, help="keep only each commenter's top_k heaviest edges")
+    parser.add_argument('--backend', choices=['auto', 'leidenalg', 'igraph', 'networkx'], default='auto',
+                        help="community detection backend (default: the fastest installed)")
+    parser.add_argument('--no-layout', action='store_true', help="skip the layout")
+    parser.add_argument('--keep-isolated', action='store_true',
+                        help="keep commenters without edges (after pruning) in the communities and layout")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="report each stage's peak memory (traced with tracemalloc, which slows every stage down)")
+    parser.add_argument('--draw', action='store_true', help="draw the communities in a window when done")
+    args = parser.parse_args(argv)
+    if args.draw and args.no_layout:
+        parser.error("--draw needs the layout")
+    return args
 
-# Add edges between commenters
-for pair in combinations([comment.get('author') for comment in comments_data if 'author' in comment], 2):
-    if G.has_edge(*pair):
-        G[pair[0]][pair[1]]['weight'] += 1
+def main(argv=None):
+    args = parse_arguments(argv)
+    os.makedirs(args.output, exist_ok=True)
+    report = StageReport(args.trace_memory)
+    if args.edge_list:
+        with report.stage('load edge list'):
+            edges = load_edge_list(args.edge_list)
     else:
-        G.add_edge(*pair, weight=1)
-
-print(f"Graph created with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
+        with report.stage('read comments and edge list'):
+            videos = video_comments(args)
+            if not args.no_dump and not args.from_dump:
+                dump_path = os.path.join(args.output, 'networkx_comments.ndjson')
+                videos = dump_video_comments(videos, dump_path)
+                print(f"Streaming parsed comments to: {dump_path}")
+            edges = cocommenter_edges((video_id, [record.author for record in records]) for video_id, records in videos)
+        # Saved unpruned, so it can be pruned differently later with --edge-list
+        save_edge_list(os.path.join(args.output, 'networkx_edges.npz'), edges)
+    print(f"Graph created with {len(edges.names)} nodes and {len(edges.weights)} edges.")
 
-# Detect communities and visualize the network as before
-# Detect communities using the Louvain method
-print("Detecting communities...")
-partition = community_louvain.best_partition(G)
+    edges, membership, positions, _ = analyze_edges(edges, args.output, 'networkx', args.min_weight, args.top_k, args.backend,
+                                                    not args.no_layout, report=report, drop_isolated=not args.keep_isolated)
+    if args.draw:
+        draw_communities(edges, membership, positions)
+    return 0
 
-# Visualization setup
-print("Visualizing the network...")
-pos = nx.spring_layout(G, k=0.1)
-cmap = plt.get_cmap('viridis')
-plt.figure(figsize=(10, 10))
-for com in set(partition.values()):
-    list_nodes = [nodes for nodes in partition.keys() if partition[nodes] == com]
-    nx.draw_networkx_nodes(G, pos, list_nodes, node_size=20, node_color=[cmap(com / len(set(partition.values())))])
-nx.draw_networkx_edges(G, pos, alpha=0.5)
-plt.axis('off')
-plt.show()
-print("Visualization complete.")
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,82 +4,76 @@
 # This code saves all videos from the search results in a file titled the search phrase and includes the timestamp of the search
 # It runs through and takes each video from the file and saves all of the comments and replies of each video to a file titled the video ID
 # If all comments are saved succesfully to its file, it adds the video to a file called "Video List" 
-# Keeps track of API usage 
+# Keeps track of API usage (see quota_budget.py)
 # Only searches for videos if the search results file doesn't exist yet
 # Continues to save comments from videos in the existing search results list
-# Adds number of comments/videos at the top of each text file
+# Adds number of comments/videos to each text file (comment counts are at the bottom of comment files)
 # Uses pagination to compile more search results
 # New: Removes videos with disabled comments
-# New: Instead of going through the entire search result list to find where it left off, it takes the last video ID in "Video List" and starts queueing the following video
+# New: Instead of going through the entire search result list to find where it left off, it skips every video already in "Video List"
 # New: Prevent duplicate videos in search results
+# New: Harvests several videos and reply threads at once with a bounded worker pool sharing one API client
+# New: Uses the replies embedded in commentThreads responses and only pages through comments().list for truncated threads
+# New: Counts API quota units per endpoint and spends the remaining daily quota on the comment pages with the most comments per unit first
+# New: Keeps processed videos in an indexed ledger (video_ledger.sqlite) and writes "Video List" from it after each run;
+#      videos deleted from "Video List" by hand are harvested again
+# New: Saves each comment thread to a per-video checkpoint as it is fetched, so a crash or quota stop resumes from the same page
+# New: Streams comments to the file as each page arrives instead of holding a whole video in memory
+# New: Can also save searches, videos and comments to a SQLite store (comment_store.py) for the graph scripts to query
+# New: Can run offline against fake_youtube_api.py in any folder (see benchmark_harvest.py for throughput and resume tests)
+# New: Harvests several search phrases as one schedule, each video once, and reuses saved search results until they expire
+# New: Refreshes harvested videos by fetching only the comments and replies added since, newest first
+# New: Searches in publish date windows, split where a query hits YouTube's ~500 result cap, until max_results videos
+# New: Retries search pages that fail with a server error; if a search still stops on errors, the videos found are
+#      saved and harvested, and the next run searches only the date windows left
 
 # You can edit the following:
-# Line 31: API Key
-# Under Line 84: Search Phrase, Max Search Results, and results order
+# Line 55: API Key
+# Lines 56-61: Number of worker threads, pages per scheduled slice, per-worker API call rate, the optional SQLite store
+#              and the output folder
+# Under Line 78: Search Phrases, Max Search Results, results order, publish dates and quota limit of the search,
+#                how long saved search results are reused, and videos to refresh
 
+import math
 import os
-import time
-import json
-from googleapiclient.discovery import build
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from googleapiclient.errors import HttpError
 from datetime import datetime, timedelta
-import pytz  # Ensure pytz is installed for timezone handling
+from youtube_api_pool import YouTubeClientPool
+from video_ledger import VideoLedger
+from harvest_checkpoint import VideoCheckpoint
+from comment_format import append_comment_records, write_comment_count, write_comment_record
+from comment_parser import parse_comment_file
+from comment_store import CommentStore
+from corpus_index import read_search_results
+from search_planner import SearchPlanner, format_window_time
+from quota_budget import ENDPOINT_QUOTA_COSTS, QuotaBudget, QuotaWorkScheduler  # Needs pytz for the quota reset time
 
 # Initialize global variables
-api_usage_counter = 0
-api_daily_limit = 10000  
+api_daily_limit = 10000  # Daily quota in units, not calls (a search page costs 100 units, a comment page 1)
 api_key = "xxxxxx"  # Place your actual API key here
+harvest_workers = 4  # Number of videos harvested at the same time (1 = one video at a time)
+reply_workers = 4  # Number of reply threads fetched at the same time for each video
+pages_per_slice = 10  # commentThreads pages of a video harvested before the scheduler picks the next work again
+worker_calls_per_second = 5  # API call cap for each worker thread (None = no cap)
+comment_store_path = None  # Set to a file name (e.g. "comments.sqlite") to also save everything to a SQLite store
+harvest_directory = None  # Folder for the search results, comment files and "Video List" (None = this script's folder)
 
-# Initialize the YouTube API client
-youtube = build('youtube', 'v3', developerKey=api_key)
+# Initialize the YouTube API client, shared by all worker threads
+youtube_pool = YouTubeClientPool(api_key, calls_per_second=worker_calls_per_second)
 
-# Load API usage counter from file
-def load_api_usage_counter():
-    try:
-        with open('api_usage_counter.json', 'r') as f:
-            data = json.load(f)
-            return data.get('api_usage_counter', 0)
-    except FileNotFoundError:
-        return 0
-
-# Save API usage counter to file
-def save_api_usage_counter():
-    with open('api_usage_counter.json', 'w') as f:
-        json.dump({'api_usage_counter': api_usage_counter}, f)
-
-# Adjusted initialization for the API usage counter
-api_usage_counter = load_api_usage_counter()
-
-# Modified increment_api_usage to save state
-def increment_api_usage():
-    global api_usage_counter
-    api_usage_counter += 1
-    save_api_usage_counter()
-
-# Function to check API limit and sleep if necessary, now considers timezone
-def check_api_limit_and_sleep():
-    global api_usage_counter
-    if api_usage_counter >= api_daily_limit:
-        now = datetime.now(pytz.timezone('US/Pacific'))
-        tomorrow = now + timedelta(days=1)
-        reset_time = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
-        sleep_time = (reset_time - now).total_seconds() + 60  # Adding a 1-minute buffer
-        print(f"API limit reached, sleeping for {sleep_time} seconds until reset...")
-        time.sleep(sleep_time)
-        api_usage_counter = 0  # Reset the counter after waiting
-        save_api_usage_counter()
-
-def save_state(video_id, next_page_token=None):
-    state = {'video_id': video_id, 'next_page_token': next_page_token}
-    with open('api_state.json', 'w') as f:
-        json.dump(state, f)
-
-def load_state():
-    try:
-        with open('api_state.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return None
+video_ledger = None  # Opened on first use, see get_video_ledger
+comment_store = None  # Opened on first use when comment_store_path is set, see get_comment_store
+
+# Quota units used today, saved to api_usage_counter.json in batches
+quota_budget = QuotaBudget('api_usage_counter.json', daily_limit=api_daily_limit)
+
+# Charges one call to the endpoint before it is made, first sleeping until the Pacific-time reset if it no longer
+# fits in today's quota; the check and the charge are one step under the budget lock, so workers calling at the
+# same time can't pass the limit together
+def reserve_api_call(endpoint='commentThreads.list'):
+    quota_budget.reserve(endpoint)
 
 # Define search parameters
 #keyword = "Ukraine War"
@@ -89,318 +83,593 @@ def load_state():
 #keyword = "Russia Ukraine war update today"
 #keyword = "Russia and Ukraine Updates"
 keyword = "Russia and Ukraine"
-max_results = 2000
+keywords = [keyword]  # Search phrases harvested together in one run, e.g. ["Russia Ukraine", "Russia and Ukraine"]
+max_results = 2000  # Most videos kept per search phrase (more than one query's ~500 are found by date windows)
 order = "relevance"  # Can be "relevance", "date", "rating", or "title"
-
+search_published_after = None  # Only videos published on or after this date, e.g. "2022-02-24" (None = any)
+search_published_before = None  # Only videos published before this date (None = until now)
+search_workers = 4  # Date windows searched at the same time
+max_search_units = None  # Most quota units one phrase's search may spend, 100 per page (None = no limit)
+search_cache_hours = None  # Search a phrase again once its saved search results are this old (None = always reuse them)
+refresh_videos = None  # Video IDs from "Video List" (or "all") to check for new comments instead of harvesting new videos
+refresh_all_threads = False  # Also page through older threads for new replies (one more unit per 100 threads)
+
+
+# Every file the harvester writes goes in this folder
+def get_harvest_directory():
+    return harvest_directory or os.path.dirname(os.path.abspath(__file__))
+
+# Processed videos are kept in video_ledger.sqlite; "Video List.txt" is written from it at the end of each run,
+# and videos added to or deleted from "Video List.txt" by hand are added to or removed from it
+def get_video_list_path():
+    current_directory = get_harvest_directory()
+    return os.path.join(current_directory, "Video List.txt")
+
+def get_video_ledger():
+    global video_ledger
+    if video_ledger is None:
+        current_directory = get_harvest_directory()
+        video_ledger = VideoLedger(os.path.join(current_directory, "video_ledger.sqlite"), get_video_list_path())
+    return video_ledger
+
+# Returns None when the store is turned off
+def get_comment_store():
+    global comment_store
+    if comment_store is None and comment_store_path is not None:
+        current_directory = get_harvest_directory()
+        comment_store = CommentStore(os.path.join(current_directory, comment_store_path))
+    return comment_store
 
 def get_last_processed_video_id():
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-    video_list_path = os.path.join(current_directory, "Video List.txt")
-    last_video_id = None
-    try:
-        with open(video_list_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                if line.startswith("Video ID:"):
-                    last_video_id = line.strip().split("Video ID:")[1].strip()
-    except FileNotFoundError:
-        pass  # File does not exist
-    return last_video_id
+    return get_video_ledger().last_video_id()
 
-def save_search_results_to_file(search_results, keyword):
+SEARCH_INCOMPLETE_PREFIX = "Search Incomplete:"  # Header line of each date window a search did not finish
+
+# unsearched_windows are the (start, end) date windows the search could not finish because of errors; they are
+# written to the header, and the next run searches only those (see get_search_results)
+def save_search_results_to_file(search_results, keyword, unsearched_windows=()):
     # Format keyword for filename
     keyword_for_filename = keyword.replace(" ", "_")
-    current_directory = os.path.dirname(os.path.abspath(__file__))
+    current_directory = get_harvest_directory()
     file_path = os.path.join(current_directory, f'{keyword_for_filename}_search_results.txt')
     search_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    store = get_comment_store()
+    if store is not None:
+        store.add_search_run(keyword, search_timestamp, search_results)
     
     with open(file_path, 'w', encoding='utf-8') as file:
         file.write(f"Search Timestamp: {search_timestamp}\n")
         file.write(f"Search Phrase: {keyword}\n")
-        file.write(f"Number of Videos: {len(search_results)}\n\n")  # Write the count of videos
+        file.write(f"Number of Videos: {len(search_results)}\n")  # Write the count of videos
+        for start, end in unsearched_windows:
+            file.write(f"{SEARCH_INCOMPLETE_PREFIX} {start} to {end}\n")
+        file.write("\n")
         for video in search_results:
             file.write(f"Video ID: {video['video_id']}\n")
             file.write(f"Video Title: {video['title']}\n")
             file.write(f"Channel Title: {video['channelTitle']}\n")
             file.write(f"Published At: {video['publishedAt']}\n\n")
 
+# The date windows a search results file's search did not finish, from its header (which ends at the first blank line)
+def read_unsearched_windows(file_path):
+    windows = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                break
+            if line.startswith(SEARCH_INCOMPLETE_PREFIX):
+                start, end = line[len(SEARCH_INCOMPLETE_PREFIX):].split(' to ')
+                windows.append((start.strip(), end.strip()))
+    return windows
+
 def is_video_id_in_list(video_id):
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-    video_list_path = os.path.join(current_directory, "Video List.txt")
-    try:
-        with open(video_list_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                if video_id in line:
-                    return True
-    except FileNotFoundError:
-        # If the file does not exist, no video IDs are in the list
-        return False
-    return False
+    return video_id in get_video_ledger()
 
+# Writes a whole list of comments at once; the harvester itself streams them through its checkpoint
+# The count goes after the records, in the same layout as streamed files (see comment_format.py)
 def save_comments_to_file(comments, video_id):
-    current_directory = os.path.dirname(os.path.abspath(__file__))
+    current_directory = get_harvest_directory()
     file_path = os.path.join(current_directory, f'{video_id}.txt')
     
     with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(f"Number of Comments: {len(comments)}\n\n")  # Write the count of comments
         for comment in comments:
-            if comment['type'] == 'comment':
-                file.write(f"Author: {comment['author']}\n")
-                file.write(f"Comment: {comment['comment']}\n")
-                file.write(f"Likes: {comment['like_count']}\n")
-                file.write(f"Published At: {comment['published_at']}\n")
-                file.write(f"Comment ID: {comment['comment_id']}\n")
-                file.write("--------------------------------------------------\n\n")
-            elif comment['type'] == 'reply':
-                file.write(f"Author: {comment['author']} (Reply to Comment ID: {comment['reply_to']})\n")
-                file.write(f"Reply: {comment['comment']}\n")
-                file.write(f"Likes: {comment['like_count']}\n")
-                file.write(f"Published At: {comment['published_at']}\n")
-                file.write(f"Comment ID: {comment['comment_id']}, Reply to ID: {comment['reply_to']}\n")
-                file.write("--------------------------------------------------\n\n")
+            write_comment_record(file, comment)
+        write_comment_count(file, len(comments))  # Write the count of comments
     
     print(f"Comments for video ID {video_id} saved successfully.")
 
-def compile_and_save_search_results():
-    search_response = youtube.search().list(
+# One search.list page of a date window, for the search planner (called from several threads at once)
+def search_page(keyword, published_after, published_before, page_token):
+    reserve_api_call('search.list')
+    return youtube_pool.execute(youtube_pool.search().list(
         q=keyword,
         part="id,snippet",
         maxResults=50,  # This is the maximum allowed by the API
         order=order,
-        type='video'
-    ).execute()
-    
-    search_results = []
-    seen_video_ids = set()  # Initialize an empty set to track seen video IDs
-
-    while True:
-        for search_result in search_response.get("items", []):
-            if search_result["id"]["kind"] == "youtube#video":
-                video_id = search_result["id"]["videoId"]
-                if video_id not in seen_video_ids:  # Check if the video ID has been seen
-                    title = search_result["snippet"]["title"]
-                    channelTitle = search_result["snippet"]["channelTitle"]
-                    publishedAt = search_result["snippet"]["publishedAt"]
-                    search_results.append({
-                        'video_id': video_id,
-                        'title': title,
-                        'channelTitle': channelTitle,
-                        'publishedAt': publishedAt
-                    })
-                    seen_video_ids.add(video_id)  # Mark this video ID as seen
-
-        # Check for nextPageToken to continue fetching results
-        nextPageToken = search_response.get('nextPageToken')
-        if nextPageToken:
-            search_response = youtube.search().list(
-                q=keyword,
-                part="id,snippet",
-                maxResults=50,
-                order=order,
-                type='video',
-                pageToken=nextPageToken
-            ).execute()
-        else:
-            break  # Exit the loop if there is no nextPageToken
-
-    # Save compiled search results to a file
-    save_search_results_to_file(search_results, keyword)
-    
-    # Now, pass the keyword when calling process_and_save_comments
-    process_and_save_comments(search_results, keyword)  # Updated to pass 'keyword'
+        type='video',
+        publishedAfter=published_after,
+        publishedBefore=published_before,
+        pageToken=page_token
+    ))
+
+# Searches for a phrase, saves the results to <phrase>_search_results.txt and returns them
+# One query stops at about 500 videos, so the search is split into publish date windows until max_results
+# videos are found (see search_planner.py)
+# To continue a search that stopped on errors, pass its results and the windows it left (only those are searched)
+def search_and_save_results(keyword, search_results=(), windows=None):
+    planner = SearchPlanner(lambda published_after, published_before, page_token:
+                            search_page(keyword, published_after, published_before, page_token),
+                            max_results - len(search_results), workers=search_workers, max_units=max_search_units,
+                            order=order)
+    found_video_ids = {video['video_id'] for video in search_results}
+    new_results = planner.search(search_published_after, search_published_before, windows)
+    search_results = list(search_results) + [video for video in new_results if video['video_id'] not in found_video_ids]
+
+    # Save compiled search results to a file; the videos found are harvested even if some date windows failed
+    unsearched_windows = [(format_window_time(start), format_window_time(end)) for start, end, _ in planner.failed_windows]
+    save_search_results_to_file(search_results, keyword, unsearched_windows)
+    return search_results
 
-def process_existing_or_new_search_results():
-    last_video_id = get_last_processed_video_id()
-    found_last_video = last_video_id is None  # If no last video ID, start from the beginning
+def compile_and_save_search_results():
+    process_and_save_comments(search_and_save_results(keyword), keyword)
 
+def get_search_results_path(keyword):
     keyword_for_filename = keyword.replace(" ", "_")
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-    search_results_file_path = os.path.join(current_directory, f'{keyword_for_filename}_search_results.txt')
-
-    if os.path.exists(search_results_file_path):
-        print("Found existing search results. Processing videos starting from the next unprocessed video...")
-        with open(search_results_file_path, 'r', encoding='utf-8') as file:
-            search_results = []
-            for line in file:
-                if line.startswith("Video ID:"):
-                    video_id = line.split("Video ID:")[1].strip()
-                    if found_last_video:
-                        title = next(file).split("Video Title:")[1].strip()
-                        channelTitle = next(file).split("Channel Title:")[1].strip()
-                        publishedAt = next(file).split("Published At:")[1].strip()
-                        search_results.append({
-                            'video_id': video_id,
-                            'title': title,
-                            'channelTitle': channelTitle,
-                            'publishedAt': publishedAt
-                        })
-                    elif video_id == last_video_id:
-                        found_last_video = True  # Next video will be the starting point
-        process_and_save_comments(search_results, keyword)
-    else:
-        print("No existing search results found. Performing search...")
-        compile_and_save_search_results()
+    return os.path.join(get_harvest_directory(), f'{keyword_for_filename}_search_results.txt')
 
-def get_all_comments(api_key, video_id):
-    global api_usage_counter
-    youtube = build('youtube', 'v3', developerKey=api_key)
-    all_comments_grouped = []
-    next_page_token = None
+def is_search_expired(search_timestamp):
+    if search_cache_hours is None:
+        return False
+    if search_timestamp is None:
+        return True
+    age = datetime.now() - datetime.strptime(search_timestamp, "%Y-%m-%d %H:%M:%S")
+    return age > timedelta(hours=search_cache_hours)
+
+# The saved search results of a phrase are its cache: they are reused, at no quota cost, until they are
+# search_cache_hours old, and only then is the phrase searched again (which rewrites the file)
+def get_search_results(keyword):
+    search_results_file_path = get_search_results_path(keyword)
+    if not os.path.exists(search_results_file_path):
+        print(f"No existing search results found for '{keyword}'. Performing search...")
+        return search_and_save_results(keyword)
+
+    _, search_timestamp, search_results = read_search_results(search_results_file_path)
+    unsearched_windows = read_unsearched_windows(search_results_file_path)
+    if unsearched_windows:
+        print(f"The last search for '{keyword}' left {len(unsearched_windows)} date windows unsearched. Searching them...")
+        return search_and_save_results(keyword, search_results, unsearched_windows)
+    if is_search_expired(search_timestamp):
+        print(f"Search results for '{keyword}' are from {search_timestamp}, older than {search_cache_hours} hours. "
+              f"Performing search...")
+        return search_and_save_results(keyword)
+
+    print(f"Found existing search results for '{keyword}' from {search_timestamp}. "
+          f"Processing videos that are not in the Video List yet...")
+    store = get_comment_store()
+    if store is not None:
+        store.import_search_results_file(search_results_file_path)  # Same search timestamp, so stored only once
+    return search_results
+
+# Runs several search phrases as one schedule: every phrase's search results are gathered first (from the cache
+# where possible), then all their videos are harvested in one quota-priority schedule, and a video returned for
+# several phrases is harvested once, under the first phrase that returned it
+# A phrase whose search fails (or whose saved search results can't be read) is skipped, and the others are still
+# harvested; returns the phrases skipped
+def run_harvest_jobs(keywords):
+    last_video_id = get_last_processed_video_id()
+    if last_video_id:
+        print(f"Last processed video: {last_video_id}")
+    phrase_results = []
+    failed_keywords = []
+    for keyword in dict.fromkeys(keywords):
+        try:
+            phrase_results.append((keyword, get_search_results(keyword)))
+        except (HttpError, OSError, ValueError) as e:
+            print(f"Search for '{keyword}' failed, skipping it this run: {e}")
+            failed_keywords.append(keyword)
+    process_and_save_comments_for_phrases(phrase_results)
+    return failed_keywords
+
+# Videos are harvested in quota-priority order rather than search order, so resuming skips every video
+# already in "Video List" instead of starting after the last one added
+def process_existing_or_new_search_results():
+    run_harvest_jobs([keyword])
+
+# Builds the saved record for the top-level comment of a commentThreads response item
+def make_comment_entry(item):
+    top_level_comment = item['snippet']['topLevelComment']['snippet']
+    return {
+        'type': 'comment',
+        'author': top_level_comment['authorDisplayName'],
+        'comment': top_level_comment['textDisplay'],
+        'like_count': top_level_comment['likeCount'],
+        'published_at': top_level_comment['publishedAt'],
+        'comment_id': item['id']
+    }
+
+# Builds the saved record for one reply from a commentThreads or comments response item
+def make_reply_entry(reply, parent_id):
+    reply_snippet = reply['snippet']
+    return {
+        'type': 'reply',
+        'author': reply_snippet['authorDisplayName'],
+        'comment': reply_snippet['textDisplay'],
+        'like_count': reply_snippet['likeCount'],
+        'published_at': reply_snippet['publishedAt'],
+        'comment_id': reply['id'],
+        'reply_to': parent_id  # Indicates the parent comment ID
+    }
+
+# Uses the replies embedded in a commentThreads item when they are complete (the API embeds at most a few per thread)
+# Returns None if the thread was truncated and its replies have to be paged through comments().list
+def get_embedded_replies(item, parent_id):
+    embedded = item.get('replies', {}).get('comments', [])
+    if len(embedded) != item['snippet']['totalReplyCount']:
+        return None
+    return [make_reply_entry(reply, parent_id) for reply in embedded]
+
+# Reply threads are handed to reply_executor when one is given, so the replies of a whole page download at once
+# Each finished thread is saved to the video's checkpoint, so a crash or quota stop resumes from the same page and thread
+# With max_pages, stops after that many commentThreads pages; the next call carries on from the checkpoint
+# Returns the checkpoint, whose partial file becomes <video_id>.txt once checkpoint.complete is set
+def get_all_comments(client, video_id, reply_executor=None, max_pages=None):
+    current_directory = get_harvest_directory()
+    checkpoint = VideoCheckpoint(current_directory, video_id)
     success = True
+    page_threads = []
+    pages_fetched = 0
+
+    if checkpoint.resumed:
+        print(f"Resuming video {video_id} at page {checkpoint.pages_done + 1}, thread {checkpoint.threads_done + 1} "
+              f"({checkpoint.record_count} comments and replies already saved).")
 
     try:
         while True:
-            increment_api_usage()  # Track API usage
-            check_api_limit_and_sleep()  # Sleep if limit is reached
+            reserve_api_call('commentThreads.list')  # Sleep if limit is reached, then track API usage
 
-            request = youtube.commentThreads().list(
+            request = client.comment_threads().list(
                 part='snippet,replies',
                 videoId=video_id,
-                pageToken=next_page_token,
+                pageToken=checkpoint.page_token,
                 textFormat='plainText',
                 maxResults=100
             )
-            response = request.execute()
-
-            for item in response['items']:
-                top_level_comment = item['snippet']['topLevelComment']['snippet']
-                comment_entry = {
-                    'type': 'comment',
-                    'author': top_level_comment['authorDisplayName'],
-                    'comment': top_level_comment['textDisplay'],
-                    'like_count': top_level_comment['likeCount'],
-                    'published_at': top_level_comment['publishedAt'],
-                    'comment_id': item['id']
-                }
-                all_comments_grouped.append(comment_entry)
+            response = client.execute(request)
+            pages_fetched += 1
+            checkpoint.units += ENDPOINT_QUOTA_COSTS['commentThreads.list']
+
+            # (thread ID, comment entry, replies or a future of replies, whether the replies were embedded or None
+            # without replies), kept in page order
+            page_threads = []
+            for item in checkpoint.unsaved_threads(response['items']):  # Threads already saved are skipped
+                comment_entry = make_comment_entry(item)
+                replies = []
+                embedded = None
 
                 # Fetch all replies if there are more than initially returned
                 if item['snippet']['totalReplyCount'] > 0:
-                    all_comments_grouped.extend(fetch_all_replies_for_comment(youtube, item['id'], item['snippet']['topLevelComment']['id']))
+                    parent_id = item['snippet']['topLevelComment']['id']
+                    embedded_replies = get_embedded_replies(item, parent_id)
+                    embedded = embedded_replies is not None
+                    if embedded:
+                        replies = embedded_replies
+                    else:
+                        # One comments().list page per 100 replies
+                        checkpoint.units += -(-item['snippet']['totalReplyCount'] // 100) * ENDPOINT_QUOTA_COSTS['comments.list']
+                        if reply_executor is not None:
+                            replies = reply_executor.submit(fetch_all_replies_for_comment, client, item['id'], parent_id)
+                        else:
+                            replies = fetch_all_replies_for_comment(client, item['id'], parent_id)
+                page_threads.append((item['id'], comment_entry, replies, embedded))
+
+            page_entries = []
+            for thread_id, comment_entry, replies, embedded in page_threads:
+                thread_entries = [comment_entry] + (replies if isinstance(replies, list) else replies.result())
+                checkpoint.write_thread(thread_entries, thread_id, embedded)
+                page_entries.extend(thread_entries)
+            store = get_comment_store()
+            if store is not None:
+                store.upsert_comment_entries(video_id, page_entries)
 
             next_page_token = response.get('nextPageToken')
             if not next_page_token:
+                checkpoint.complete = True
+                break
+            checkpoint.next_page(next_page_token)
+            if max_pages is not None and pages_fetched >= max_pages:
                 break
 
     except HttpError as e:
         success = False
+        for _, _, replies, _ in page_threads:
+            if not isinstance(replies, list):
+                replies.cancel()
         if e.resp.status == 403 and 'commentsDisabled' in str(e):  # Adjust based on the actual API response for disabled comments
             print(f"Comments are disabled for video {video_id}, skipping.")
+            checkpoint.discard()
             return None, False
         elif e.resp.status == 403 and 'quotaExceeded' in str(e):  # Check for quota exceeded error
-            print("API limit reached, please try again later.")
+            print(f"API limit reached, please try again later. Video {video_id} will resume from its checkpoint.")
             return None, False
         else:
             print(f"An error occurred: {e}")
             return None, False
 
-    return all_comments_grouped, success
+    return checkpoint, success
 
-def fetch_all_replies_for_comment(youtube, comment_thread_id, parent_id):
+# Prints how many comments().list calls the embedded replies saved over all of a video's slices; called once, when
+# the video is done (every thread answered from the embedded replies is at least one call not made)
+def report_embedded_replies(video_id, checkpoint):
+    embedded = checkpoint.embedded_reply_threads
+    print(f"Video {video_id}: {embedded}/{checkpoint.reply_threads} reply threads used embedded replies, "
+          f"saved {embedded} API calls ({embedded * ENDPOINT_QUOTA_COSTS['comments.list']} quota units).")
+
+def fetch_all_replies_for_comment(client, comment_thread_id, parent_id):
     replies = []
     next_page_token = None
 
     try:
         while True:
-            replies_request = youtube.comments().list(
+            reserve_api_call('comments.list')  # Sleep if limit is reached, then track API usage
+
+            replies_request = client.comments().list(
                 part='snippet',
                 parentId=comment_thread_id,
                 pageToken=next_page_token,
                 textFormat='plainText',
                 maxResults=100
             )
-            replies_response = replies_request.execute()
+            replies_response = client.execute(replies_request)
 
             for reply in replies_response['items']:
-                reply_snippet = reply['snippet']
-                reply_entry = {
-                    'type': 'reply',
-                    'author': reply_snippet['authorDisplayName'],
-                    'comment': reply_snippet['textDisplay'],
-                    'like_count': reply_snippet['likeCount'],
-                    'published_at': reply_snippet['publishedAt'],
-                    'comment_id': reply['id'],
-                    'reply_to': parent_id  # Indicates the parent comment ID
-                }
-                replies.append(reply_entry)
+                replies.append(make_reply_entry(reply, parent_id))
 
             next_page_token = replies_response.get('nextPageToken')
             if not next_page_token:
                 break
     except HttpError as e:
+        # Passed on to get_all_comments, so the thread is fetched again from the checkpoint instead of saved incomplete
         print(f"An error occurred fetching replies: {e}")
+        raise
 
     return replies
 
-def add_video_to_list(video, keyword):
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-    video_list_path = os.path.join(current_directory, "Video List.txt")
-    add_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Attempt to read the existing video list and count the videos
-    video_lines = []
-    num_videos = 0
-    video_count_line = "Number of Videos: "
+# Fetches only what was added to an already harvested video: threads come newest first (order=time), so paging
+# stops after the page that reaches a thread already in <video_id>.txt; on the pages fetched, replies are only
+# fetched for known threads whose totalReplyCount grew. New replies on threads past that page are only found with
+# all_threads, which pages through every thread but still fetches replies only where the count grew
+# New threads and replies are appended to the file; a video whose file is missing is harvested again in full
+# Returns the number of comments and replies added, or None if the refresh failed (the file is then unchanged)
+def refresh_video(client, video_id, all_threads=False):
+    file_path = os.path.join(get_harvest_directory(), f'{video_id}.txt')
     try:
-        with open(video_list_path, 'r', encoding='utf-8') as file:
-            video_lines = file.readlines()
-            # Find and extract the current number of videos
-            for i, line in enumerate(video_lines):
-                if line.startswith(video_count_line):
-                    num_videos = int(line.strip().split(video_count_line)[-1])
-                    break
+        records = parse_comment_file(file_path)
     except FileNotFoundError:
-        # File does not exist; it will be created below
-        pass
-
-    # Increment the video count since we're adding a new video
-    num_videos += 1
-
-    # Re-write the file with the updated video count and video information
-    with open(video_list_path, 'w', encoding='utf-8') as file:
-        file.write(f"{video_count_line}{num_videos}\n")
-        if len(video_lines) > 1:  # If there were existing videos, keep their details
-            # Skip the first line if it was the count line, preserve the rest
-            start_index = 1 if video_lines[0].startswith(video_count_line) else 0
-            file.writelines(video_lines[start_index:])
-        # Now add the new video details
-        file.write(f"Added Timestamp: {add_timestamp}\n")
-        file.write(f"Search Phrase: {keyword}\n")
-        file.write(f"Video ID: {video['video_id']}\n")
-        file.write(f"Video Title: {video['title']}\n")
-        file.write(f"Channel Title: {video['channelTitle']}\n")
-        file.write(f"Published At: {video['publishedAt']}\n\n")
+        print(f"{video_id}.txt is missing, harvesting video {video_id} again.")
+        return harvest_missing_video(client, video_id)
+    except OSError as e:
+        print(f"Could not read {video_id}.txt, video {video_id} was not refreshed: {e}")
+        return None
+    known_ids = {record.comment_id for record in records}
+    reply_counts = Counter(record.reply_to for record in records if record.reply_to)
+    new_entries = []
+    pages = 0
+    checked_threads = 0
+    next_page_token = None
+
+    try:
+        while True:
+            reserve_api_call('commentThreads.list')
+            response = client.execute(client.comment_threads().list(
+                part='snippet,replies',
+                videoId=video_id,
+                pageToken=next_page_token,
+                textFormat='plainText',
+                maxResults=100,
+                order='time'
+            ))
+            pages += 1
+
+            reached_known = False
+            for item in response['items']:
+                parent_id = item['snippet']['topLevelComment']['id']
+                total_reply_count = item['snippet']['totalReplyCount']
+                if item['id'] in known_ids:
+                    reached_known = True
+                    if total_reply_count <= reply_counts[parent_id]:
+                        continue  # No new replies (fewer means some were deleted; the file keeps them)
+                    checked_threads += 1
+                else:
+                    new_entries.append(make_comment_entry(item))
+                    if total_reply_count == 0:
+                        continue
+                replies = get_embedded_replies(item, parent_id)
+                if replies is None:
+                    replies = fetch_all_replies_for_comment(client, item['id'], parent_id)
+                new_entries.extend(reply for reply in replies if reply['comment_id'] not in known_ids)
+
+            next_page_token = response.get('nextPageToken')
+            if (reached_known and not all_threads) or not next_page_token:
+                break
+
+    except HttpError as e:
+        if e.resp.status == 403 and 'commentsDisabled' in str(e):
+            print(f"Comments are now disabled for video {video_id}, keeping the saved comments.")
+        elif e.resp.status == 403 and 'quotaExceeded' in str(e):
+            print(f"API limit reached, video {video_id} was not refreshed.")
+        else:
+            print(f"An error occurred refreshing video {video_id}: {e}")
+        return None
+
+    if new_entries:
+        comment_count = append_comment_records(file_path, new_entries)
+        store = get_comment_store()
+        if store is not None:
+            store.upsert_comment_entries(video_id, new_entries)
+    else:
+        comment_count = len(records)
+    print(f"Video {video_id}: {len(new_entries)} new comments and replies from {pages} pages and {checked_threads} "
+          f"threads with new replies, {comment_count} in total.")
+    return len(new_entries)
+
+# Harvests every page of a video in "Video List" whose comment file is missing; an unfinished harvest keeps its
+# checkpoint, so the next refresh continues it
+# Returns the number of comments and replies saved, or None if the harvest did not finish
+def harvest_missing_video(client, video_id):
+    checkpoint, success = get_all_comments(client, video_id)
+    if not success:
+        return None
+    report_embedded_replies(video_id, checkpoint)
+    checkpoint.promote()
+    print(f"Comments for video ID {video_id} saved successfully.")
+    return checkpoint.record_count
+
+# Refreshes videos already in "Video List" ("all" for every one), several at a time
+def refresh_harvested_videos(video_ids):
+    ledger = get_video_ledger()
+    if video_ids == 'all':
+        video_ids = [video['video_id'] for video in ledger.videos()]
+    else:
+        for video_id in video_ids:
+            if video_id not in ledger:
+                print(f"Video ID {video_id} is not in the Video List yet. Skipping.")
+        video_ids = [video_id for video_id in video_ids if video_id in ledger]
 
-    print(f"Video ID {video['video_id']} added to list. Total videos now: {num_videos}.")
+    with ThreadPoolExecutor(max_workers=harvest_workers) as video_executor:
+        added = list(video_executor.map(lambda video_id: refresh_video(youtube_pool, video_id, refresh_all_threads),
+                                        video_ids))
+    refreshed = [count for count in added if count is not None]
+    print(f"Refreshed {len(refreshed)}/{len(video_ids)} videos, {sum(refreshed)} new comments and replies.")
+
+def add_video_to_list(video, keyword):
+    ledger = get_video_ledger()
+    ledger.add(video, keyword)
+    print(f"Video ID {video['video_id']} added to list. Total videos now: {len(ledger)}.")
+
+# Looks up comment counts for the pending videos, 50 videos per quota unit
+# Returns {video_id: count}, with None for videos whose comments are disabled; videos missing from the result are unknown
+def get_comment_counts(client, video_ids):
+    comment_counts = {}
+    for start in range(0, len(video_ids), 50):
+        batch = video_ids[start:start + 50]
+        reserve_api_call('videos.list')
+        try:
+            response = client.execute(client.videos().list(part='statistics', id=','.join(batch), maxResults=50))
+        except HttpError as e:
+            print(f"An error occurred looking up comment counts: {e}")
+            continue
+        for item in response.get('items', []):
+            comment_count = item.get('statistics', {}).get('commentCount')
+            comment_counts[item['id']] = int(comment_count) if comment_count is not None else None
+    return comment_counts
+
+# Estimated (pages, quota units, comments and replies) of the next slice of a video, at most pages_per_slice
+# commentThreads pages; comment_count is the video's commentCount (math.inf if unknown)
+# A video not started yet is probed with its first page (one unit, up to 100 threads); after that the units and
+# comments per page seen so far, including the reply pages of truncated threads, give the cost and yield of the rest
+def estimate_next_slice(comment_count, checkpoint=None):
+    if checkpoint is None or not checkpoint.pages_done:
+        return 1, 1, min(comment_count, 100)
+    units_per_page = checkpoint.units / checkpoint.pages_done
+    comments_per_page = max(1, checkpoint.record_count / checkpoint.pages_done)
+    remaining = max(comment_count - checkpoint.record_count, comments_per_page)  # commentCount can lag behind
+    remaining = min(remaining, pages_per_slice * comments_per_page)  # Also caps an unknown (infinite) count
+    pages = min(pages_per_slice, math.ceil(remaining / comments_per_page))
+    return pages, max(1, math.ceil(pages * units_per_page)), remaining
+
+# Saves one harvested video; called as each harvest finishes
+def save_harvested_video(video, harvest, keyword):
+    video_id = video['video_id']
+    checkpoint, success = harvest.result()
+
+    if not success:  # Comments are disabled or the harvest stopped early (get_all_comments printed why)
+        return  # Skip this video entirely
+
+    # The partial file only becomes <video_id>.txt now that the whole video is done
+    report_embedded_replies(video_id, checkpoint)
+    checkpoint.promote()
+    print(f"Comments for video ID {video_id} saved successfully.")
+    add_video_to_list(video, keyword)  # This function updates "Video List" with the processed video.
+    print(f'Comments saved to {video_id}.txt and video added to the list.')
 
 def process_and_save_comments(search_results, keyword):
-    global api_usage_counter
-    
-    for video in search_results:
-        video_id = video['video_id']
-        
-        # Check if video is already processed
-        if not is_video_id_in_list(video_id):
-            all_comments, success = get_all_comments(api_key, video_id)
-
-            if all_comments is None:  # Indicates comments are disabled
-                continue  # Skip this video entirely
-            
-            if success:
-                save_comments_to_file(all_comments, video_id)
-                add_video_to_list(video, keyword)  # This function updates "Video List" with the processed video.
-                print(f'Comments saved to {video_id}.txt and video added to the list.')
-                    
-                # Increment the API usage counter based on the number of calls made
-                # This should be adjusted based on actual API calls made
-                increment_api_usage()
-            
+    process_and_save_comments_for_phrases([(keyword, search_results)])
+
+# phrase_results is [(search phrase, search results), ...]; one set of seen video IDs is shared by all the phrases,
+# so a video is scheduled once and added to "Video List" under the first phrase that returned it
+# Videos are harvested a slice of pages at a time, best comments-per-unit first among the slices that fit in the
+# remaining quota, so a nearly used-up budget still goes to the richest comment pages; the harvester only sleeps
+# when nothing pending fits
+def process_and_save_comments_for_phrases(phrase_results):
+    pending_videos = []  # (video, keyword)
+    seen_video_ids = set()
+    for keyword, search_results in phrase_results:
+        for video in search_results:
+            # Check if video is already processed
+            if is_video_id_in_list(video['video_id']):
+                print(f"Video ID {video['video_id']} has already been processed. Skipping.")
+            elif video['video_id'] in seen_video_ids:
+                print(f"Video ID {video['video_id']} was also returned for an earlier phrase. Skipping it for '{keyword}'.")
             else:
-                print(f'Failed to fetch comments for video {video_id}. Skipping.')
+                seen_video_ids.add(video['video_id'])
+                pending_videos.append((video, keyword))
+
+    comment_counts = get_comment_counts(youtube_pool, [video['video_id'] for video, _ in pending_videos])
+    scheduler = QuotaWorkScheduler(quota_budget)
+
+    # Queues the next slice of a video, estimated from its checkpoint once it has one
+    def schedule_slice(video, keyword, checkpoint=None):
+        pages, units, expected_comments = estimate_next_slice(comment_counts.get(video['video_id'], math.inf), checkpoint)
+        scheduler.add((video, keyword, pages), units, expected_comments)
+
+    for video, keyword in pending_videos:
+        if comment_counts.get(video['video_id'], 0) is None:
+            print(f"Comments are disabled for video {video['video_id']}, skipping.")
         else:
-            print(f'Video ID {video_id} has already been processed. Skipping.')
-        
-        # Check if approaching the API limit after each video is fully processed
-        check_api_limit_and_sleep()
+            schedule_slice(video, keyword)
+
+    try:
+        max_in_flight = harvest_workers * 2  # Bounds how many videos are queued for the workers at once
+        with ThreadPoolExecutor(max_workers=harvest_workers) as video_executor, \
+                ThreadPoolExecutor(max_workers=reply_workers) as reply_executor:
+            in_flight = {}  # harvest future -> ((video, keyword, pages), estimated units)
+            reserved_units = 0  # Estimated units of the slices still running
+
+            # Slices are handled as soon as they finish, whatever order they were started in, and their estimated
+            # units are released then; a video with pages left goes back to the scheduler, a finished one is saved
+            def save_finished(harvests):
+                nonlocal reserved_units
+                for harvest in harvests:
+                    (video, keyword, _), units = in_flight.pop(harvest)
+                    reserved_units -= units
+                    checkpoint, success = harvest.result()
+                    if success and not checkpoint.complete:
+                        schedule_slice(video, keyword, checkpoint)
+                    else:
+                        save_harvested_video(video, harvest, keyword)
+
+            while scheduler or in_flight:
+                save_finished([harvest for harvest in in_flight if harvest.done()])
+                next_video = scheduler.next_item(reserved_units) if len(in_flight) < max_in_flight else None
+                if next_video is None:
+                    # Nothing else fits (or the window is full); wait for the first running slice to finish
+                    if in_flight:
+                        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        save_finished(finished)
+                    continue
+
+                (video, keyword, pages), units = next_video
+                harvest = video_executor.submit(get_all_comments, youtube_pool, video['video_id'], reply_executor, pages)
+                in_flight[harvest] = ((video, keyword, pages), units)
+                reserved_units += units
+    finally:
+        # Written even when the run stops early (e.g. Ctrl+C or an error), so the list has every video saved
+        get_video_ledger().export_video_list()
 
 # Execute the workflow
-process_existing_or_new_search_results()
+if __name__ == '__main__':
+    if refresh_videos:
+        refresh_harvested_videos(refresh_videos)
+    else:
+        run_harvest_jobs(keywords)
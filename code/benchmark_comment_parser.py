@@ -0,0 +1,142 @@
+# Times the shared record parser (comment_parser.parse_comment_file) against the line scanners the graph scripts used
+# before it, on the comment files in the sample_comments folder (search results files are skipped)
+# Each parser reads every file several times and the best run is reported, in milliseconds and MB/s
+# Each legacy scanner is compared with the comment_parser function its script uses now: the videocommenter and
+# cocommenter scanners with load_comment_authors, the commentercomment scanner with load_comment_author_texts and
+# the NetworkX scanner with load_comments, all reading the parse cache, and with the scan each does on a cache miss
+# The cached rows each use their own temporary cache folder, written on the first run
+# Run: python benchmark_comment_parser.py [folder] [repeats]
+
+import os
+import sys
+import tempfile
+import time
+from comment_parser import (load_comment_author_texts, load_comment_authors, load_comments, parse_comment_author_texts,
+                            parse_comment_authors, parse_comment_file)
+from corpus_index import comment_files
+
+# The per-script parsers as they were before comment_parser.py, kept here only to compare against
+def legacy_videocommenter_parse(file_path):
+    data = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('Author:') and '@' in line:
+                author = line.split('@')[1].strip()
+                if author:
+                    data.append(author)
+    return data
+
+def legacy_cocommenter_parse(file_path):
+    data = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        comment_data = {}
+        for line in file:
+            line = line.strip()
+            if line.startswith('Author:') and '@' in line:
+                if 'author' in comment_data:
+                    data.append(comment_data)
+                comment_data = {'author': line.split('@')[1].strip(), 'video_id': os.path.basename(file_path).replace('.txt', '')}
+            elif line.startswith('Comment:') or line.startswith('Likes:') or line.startswith('Published At:') or line.startswith('Comment ID:'):
+                key = line.split(':')[0].strip().lower()
+                comment_data[key] = line[len(key)+1:].strip()
+    if 'author' in comment_data:
+        data.append(comment_data)
+    return data
+
+def legacy_commentercomment_parse(file_path):
+    data = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        author = None
+        for line in file:
+            line = line.strip()
+            if line.startswith('Author:') and '@' in line:
+                author = line.split('@')[1].strip()
+            elif line.startswith('Comment:') and author:
+                comment = line[len('Comment:'):].strip()
+                data.append((author, comment))
+    return data
+
+def legacy_networkx_parse(file_path):
+    data = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        lines = file.read().split('--------------------------------------------------\n')
+        for comment_block in lines:
+            comment_data = {}
+            lines_in_block = comment_block.strip().split('\n')
+            for line in lines_in_block:
+                if line.startswith('Author:') and '@' in line:
+                    comment_data['author'] = line.split('@')[1].strip()
+                elif line.startswith('Comment:'):
+                    comment_data['comment'] = line[len('Comment:'):].strip()
+                elif line.startswith('Likes:'):
+                    comment_data['likes'] = int(line[len('Likes:'):].strip())
+                elif line.startswith('Published At:'):
+                    comment_data['published_at'] = line[len('Published At:'):].strip()
+                elif line.startswith('Comment ID:'):
+                    comment_data['comment_id'] = line[len('Comment ID:'):].strip()
+            if 'author' in comment_data:
+                data.append(comment_data)
+    return data
+
+PARSERS = [
+    ('comment_parser (records)', parse_comment_file),
+    ('comment_parser (authors)', parse_comment_authors),
+    ('comment_parser (author, text)', parse_comment_author_texts),
+    ('legacy videocommenter', legacy_videocommenter_parse),
+    ('legacy cocommenter', legacy_cocommenter_parse),
+    ('legacy commentercomment', legacy_commentercomment_parse),
+    ('legacy NetworkX', legacy_networkx_parse),
+]
+
+# The cached loaders, each timed against its own cache folder
+CACHED_LOADERS = [
+    ('cached (records)', load_comments),
+    ('cached (authors)', load_comment_authors),
+    ('cached (author, text)', load_comment_author_texts),
+]
+
+# The comment_parser loader each legacy scanner's script uses now, and the scan it falls back to on a cache miss
+REPLACED_BY = {
+    'legacy videocommenter': ('cached (authors)', 'comment_parser (authors)'),
+    'legacy cocommenter': ('cached (authors)', 'comment_parser (authors)'),
+    'legacy commentercomment': ('cached (author, text)', 'comment_parser (author, text)'),
+    'legacy NetworkX': ('cached (records)', 'comment_parser (records)'),
+}
+
+def find_comment_files(directory_path):
+    return [os.path.join(directory_path, filename) for filename in comment_files(directory_path)]
+
+def time_parser(parse, file_paths, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for file_path in file_paths:
+            parse(file_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_benchmark(directory_path, repeats=100):
+    file_paths = find_comment_files(directory_path)
+    total_bytes = sum(os.path.getsize(file_path) for file_path in file_paths)
+    print(f"{len(file_paths)} comment files, {total_bytes / 1e6:.2f} MB, best of {repeats} runs")
+    results = {}
+    parsers = list(PARSERS)
+    for name, load in CACHED_LOADERS:
+        cache_directory = tempfile.mkdtemp(prefix='parse_cache_')
+        parsers.append((name, lambda file_path, load=load, cache_directory=cache_directory: load(file_path, cache_directory=cache_directory)))
+    for name, parse in parsers:
+        elapsed = time_parser(parse, file_paths, repeats)
+        results[name] = elapsed
+        print(f"{name:<30} {elapsed * 1000:8.2f} ms  {total_bytes / 1e6 / elapsed:8.1f} MB/s")
+    for name, (cached, scan) in REPLACED_BY.items():
+        print(f"{name[len('legacy '):]} scanner: {cached} is {results[name] / results[cached]:.2f}x as fast, "
+              f"{scan} on a cache miss {results[name] / results[scan]:.2f}x")
+    return results
+
+if __name__ == '__main__':
+    default_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample_comments')
+    directory_path = sys.argv[1] if len(sys.argv) > 1 else default_directory
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    run_benchmark(directory_path, repeats)
@@ -0,0 +1,246 @@
+# Load-tests the comment harvester offline: "Scheduled YouTube Video Comments.py" is run in a temporary folder
+# against fake_youtube_api.py, which serves a synthetic corpus (or the recorded comment files of --source) with the
+# chosen latency, page sizes, quota and injected errors, so no API quota is spent
+# When a run stops early (quota exceeded, injected errors) the fake's quota is reset and the harvester is run
+# again, like the next scheduled run would, until every video is done or --max-runs is reached; each run prints its
+# time, API calls, quota units and errors
+# At the end every harvested <video_id>.txt is checked against the fake's data, so comments lost or saved twice
+# when a harvest resumes from its checkpoint show up as a failed check; with --refresh-share new comments are added
+# to the fake after the harvest and every video is refreshed before the check, so the refresh is checked as well
+# Run: python benchmark_harvest.py [--videos 50] [--mean-comments 200] [--latency 0.05] [--harvest-workers 4]
+#      python benchmark_harvest.py --source "YouTube Files" --daily-quota 300 --error-rate 0.01
+# Run python benchmark_harvest.py --help for every option
+
+import argparse
+import atexit
+import importlib.util
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from functools import partial
+from benchmark_pipeline import quiet
+from comment_parser import parse_comment_file
+from corpus_index import read_search_results
+from fake_youtube_api import FAKE_API_SETTINGS, FakeYouTubeService
+from quota_budget import QuotaBudget
+from synthetic_corpus import CORPUS_SETTINGS
+from search_planner import SearchPlanner
+from youtube_api_pool import YouTubeClientPool
+
+HARVESTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Scheduled YouTube Video Comments.py')
+
+# Imports the harvester script as a module (its file name has spaces) and points it at the fake API and a folder
+def load_harvester(service, directory_path, keywords, harvest_workers, reply_workers, calls_per_second=None,
+                   max_results=None):
+    spec = importlib.util.spec_from_file_location('scheduled_youtube_video_comments', HARVESTER_PATH)
+    harvester = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(harvester)
+    atexit.unregister(harvester.quota_budget.flush)  # Its usage file is the real one, in the current folder
+    harvester.harvest_directory = directory_path
+    harvester.keyword = keywords[0]
+    harvester.keywords = keywords
+    harvester.harvest_workers = harvest_workers
+    if max_results is not None:
+        harvester.max_results = max_results
+    # The search planner splits date windows at the fake's result cap instead of the real API's
+    harvester.SearchPlanner = partial(SearchPlanner, result_cap=service.settings['search_result_cap'])
+    harvester.reply_workers = reply_workers
+    harvester.youtube_pool = YouTubeClientPool(service=service, calls_per_second=calls_per_second)
+    # The fake enforces the daily quota; the harvester's own budget must never sleep until the real reset
+    harvester.quota_budget = QuotaBudget(os.path.join(directory_path, 'api_usage_counter.json'), daily_limit=10 ** 12)
+    atexit.unregister(harvester.quota_budget.flush)
+    return harvester
+
+# Compares the harvested comment file of each video in video_ids with the comments the fake serves
+# Comments in may_be_missing (new replies on older threads, which a refresh without all_threads does not look for)
+# can be absent from a complete file
+# Returns {'videos', 'complete', 'missing_files', 'wrong_files', 'disabled', 'not_looked_for'}
+def check_harvest(service, directory_path, video_ids, may_be_missing=()):
+    summary = Counter()
+    for video_id in video_ids:
+        video = service.video_data[video_id]
+        if video_id in service.comments_disabled:
+            summary['disabled'] += 1
+            continue
+        summary['videos'] += 1
+        file_path = os.path.join(directory_path, f'{video_id}.txt')
+        if not os.path.exists(file_path):
+            summary['missing_files'] += 1
+            continue
+        expected = Counter(entry['comment_id'] for comment, replies in video['threads'] for entry in [comment] + replies)
+        harvested = Counter(record.comment_id for record in parse_comment_file(file_path))
+        missing = expected - harvested
+        not_looked_for = sum(count for comment_id, count in missing.items() if comment_id in may_be_missing)
+        if not harvested - expected and sum(missing.values()) == not_looked_for:
+            summary['complete'] += 1
+            summary['not_looked_for'] += not_looked_for
+        else:
+            summary['wrong_files'] += 1
+            print(f"Video {video_id}: {sum((expected - harvested).values())} comments missing, "
+                  f"{sum((harvested - expected).values())} extra or duplicated")
+    return dict(summary)
+
+# Videos in the search results the harvester saved for its phrases; which of the served videos these are depends
+# on max_results and on how the search planner split the searches
+def searched_video_ids(harvester):
+    video_ids = []
+    for keyword in harvester.keywords:
+        search_results_path = harvester.get_search_results_path(keyword)
+        if os.path.exists(search_results_path):
+            video_ids.extend(video['video_id'] for video in read_search_results(search_results_path)[2])
+    return list(dict.fromkeys(video_ids))
+
+# Runs the harvester until every searched video is done (or max_runs); returns the report of each run
+def run_harvests(harvester, service, max_runs=10, show_output=False):
+    runs = []
+    for run in range(1, max_runs + 1):
+        service.reset_quota()
+        before = service.stats()
+        start = time.perf_counter()
+        if show_output:
+            skipped = harvester.run_harvest_jobs(harvester.keywords)
+        else:
+            with quiet():
+                skipped = harvester.run_harvest_jobs(harvester.keywords)
+        seconds = time.perf_counter() - start
+        after = service.stats()
+        calls = {endpoint: count - before['calls'].get(endpoint, 0) for endpoint, count in after['calls'].items()}
+        errors = {reason: count - before['errors'].get(reason, 0) for reason, count in after['errors'].items()}
+        done = len(harvester.get_video_ledger())
+        runs.append({'run': run, 'seconds': round(seconds, 3), 'videos_done': done, 'calls': calls,
+                     'quota_units': after['quota_used'], 'errors': {k: v for k, v in errors.items() if v},
+                     'searches_skipped': skipped})
+        print(f"Run {run}: {seconds:.2f} s, {done} videos done, {sum(calls.values())} calls "
+              f"({calls.get('search.list', 0)} searches), "
+              f"{after['quota_used']} quota units, errors {runs[-1]['errors'] or 'none'}"
+              + (f", searches skipped for {', '.join(skipped)}" if skipped else ""))
+        pending = len(set(searched_video_ids(harvester)) - service.comments_disabled) - done
+        if pending <= 0 and not skipped:
+            break
+    return runs
+
+# Adds comments to the fake and refreshes every harvested video; returns the refresh report and the new replies
+# the refresh is not expected to find
+def run_refresh(harvester, service, share, all_threads=False, show_output=False):
+    added = service.add_new_comments(share)
+    may_be_missing = set() if all_threads else {entry['comment_id'] for entry in added if entry['type'] == 'reply'}
+    harvester.refresh_all_threads = all_threads
+    service.reset_quota()
+    before = service.stats()
+    start = time.perf_counter()
+    if show_output:
+        harvester.refresh_harvested_videos('all')
+    else:
+        with quiet():
+            harvester.refresh_harvested_videos('all')
+    seconds = time.perf_counter() - start
+    after = service.stats()
+    calls = {endpoint: count - before['calls'].get(endpoint, 0) for endpoint, count in after['calls'].items()}
+    print(f"Refresh: {len(added)} comments and replies added to the fake, {seconds:.2f} s, {sum(calls.values())} calls, "
+          f"{after['quota_used']} quota units")
+    return {'added': len(added), 'seconds': round(seconds, 3), 'calls': calls, 'quota_units': after['quota_used']}, may_be_missing
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the comment harvester offline against a fake YouTube API.")
+    parser.add_argument('--source', help="folder of recorded comment files to serve (default: a synthetic corpus)")
+    parser.add_argument('--videos', type=int, default=50, help="(synthetic) number of videos")
+    parser.add_argument('--mean-comments', type=int, default=CORPUS_SETTINGS['mean_comments'],
+                        help="(synthetic) mean comments per video")
+    parser.add_argument('--reply-ratio', type=float, default=CORPUS_SETTINGS['reply_ratio'], help="(synthetic) share of replies")
+    parser.add_argument('--phrase', nargs='+', help="search phrases harvested together (default: the corpus's first "
+                        "phrase); synthetic videos are shared out among several phrases with overlaps")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per API call")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="random extra seconds per call, up to this")
+    parser.add_argument('--search-page-size', type=int, default=FAKE_API_SETTINGS['search_page_size'])
+    parser.add_argument('--search-result-cap', type=int, default=FAKE_API_SETTINGS['search_result_cap'],
+                        help="most results one search query returns")
+    parser.add_argument('--max-results', type=int, help="the harvester's max_results (videos kept per phrase)")
+    parser.add_argument('--thread-page-size', type=int, default=FAKE_API_SETTINGS['thread_page_size'])
+    parser.add_argument('--reply-page-size', type=int, default=FAKE_API_SETTINGS['reply_page_size'])
+    parser.add_argument('--embedded-replies', type=int, default=FAKE_API_SETTINGS['embedded_replies'])
+    parser.add_argument('--daily-quota', type=int, help="quota units per run before calls fail with quotaExceeded")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of calls failing with a 500 backendError")
+    parser.add_argument('--disabled-share', type=float, default=0.0, help="share of videos with comments disabled")
+    parser.add_argument('--seed', type=int, default=1, help="seed for the corpus and the injected errors")
+    parser.add_argument('--harvest-workers', type=int, default=4, help="videos harvested at the same time")
+    parser.add_argument('--reply-workers', type=int, default=4, help="reply threads fetched at the same time per video")
+    parser.add_argument('--calls-per-second', type=float, help="API call cap per worker thread")
+    parser.add_argument('--refresh-share', type=float,
+                        help="after harvesting, add about this share of new comments and refresh every video")
+    parser.add_argument('--refresh-all-threads', action='store_true',
+                        help="refresh through every thread, so new replies on older threads are found too")
+    parser.add_argument('--max-runs', type=int, default=10, help="most harvester runs (default 10)")
+    parser.add_argument('--show-output', action='store_true', help="show what the harvester prints")
+    parser.add_argument('--keep', action='store_true', help="keep the harvest folder")
+    parser.add_argument('--output', help="save the report as JSON to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    settings = {
+        'latency': args.latency, 'latency_jitter': args.latency_jitter, 'search_page_size': args.search_page_size,
+        'search_result_cap': args.search_result_cap,
+        'thread_page_size': args.thread_page_size, 'reply_page_size': args.reply_page_size,
+        'embedded_replies': args.embedded_replies, 'daily_quota': args.daily_quota, 'error_rate': args.error_rate,
+        'seed': args.seed,
+    }
+    if args.source:
+        service = FakeYouTubeService.from_directory(args.source, **settings)
+    else:
+        service = FakeYouTubeService.from_synthetic_corpus(
+            {'num_videos': args.videos, 'mean_comments': args.mean_comments, 'reply_ratio': args.reply_ratio,
+             'seed': args.seed}, args.phrase if args.phrase and len(args.phrase) > 1 else None, **settings)
+    phrases = args.phrase or [next(iter(service.search_results), CORPUS_SETTINGS['search_phrase'])]
+    directory_path = tempfile.mkdtemp(prefix='benchmark_harvest_')
+    harvester = load_harvester(service, directory_path, phrases, args.harvest_workers, args.reply_workers,
+                               args.calls_per_second, args.max_results)
+    video_ids = list(dict.fromkeys(video_id for phrase in phrases for video_id in service.search_video_ids(phrase)))
+    disabled_count = int(round(len(video_ids) * args.disabled_share))
+    service.comments_disabled = set(random.Random(args.seed).sample(sorted(video_ids), disabled_count))
+    comment_count = sum(service.comment_count(video_id) for video_id in video_ids)
+    print(f"Serving {len(video_ids)} videos with {comment_count} comments for {', '.join(map(repr, phrases))} "
+          f"({disabled_count} with comments disabled)")
+
+    runs = run_harvests(harvester, service, args.max_runs, args.show_output)
+    video_ids = searched_video_ids(harvester)
+    harvested_comments = sum(service.comment_count(video_id) for video_id in video_ids
+                             if os.path.exists(os.path.join(directory_path, f'{video_id}.txt')))
+    refresh, may_be_missing = None, set()
+    if args.refresh_share:
+        refresh, may_be_missing = run_refresh(harvester, service, args.refresh_share, args.refresh_all_threads,
+                                              args.show_output)
+    harvester.get_video_ledger().close()
+    check = check_harvest(service, directory_path, video_ids, may_be_missing)
+
+    seconds = sum(run['seconds'] for run in runs)
+    print(f"Harvested {check.get('complete', 0)}/{check.get('videos', 0)} videos completely in {len(runs)} runs, "
+          f"{seconds:.2f} s: {harvested_comments / seconds if seconds else 0:.0f} comments/s, "
+          f"{sum(sum(run['calls'].values()) for run in runs) / seconds if seconds else 0:.1f} calls/s")
+    if check.get('missing_files') or check.get('wrong_files'):
+        print(f"Check FAILED: {check.get('missing_files', 0)} videos missing, {check.get('wrong_files', 0)} wrong")
+    else:
+        print("Check passed: every harvested file has exactly the comments served")
+        if check.get('not_looked_for'):
+            print(f"({check['not_looked_for']} new replies on older threads were not looked for; "
+                  f"see --refresh-all-threads)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'settings': settings, 'harvest_workers': args.harvest_workers, 'reply_workers': args.reply_workers,
+                       'phrases': phrases, 'videos': len(video_ids), 'comments': comment_count, 'runs': runs, 'refresh': refresh,
+                       'check': check},
+                      file, indent=2)
+        print(f"Report saved to {args.output}")
+    if args.keep:
+        print(f"Harvest folder kept in {directory_path}")
+    else:
+        shutil.rmtree(directory_path)
+    return 0 if not (check.get('missing_files') or check.get('wrong_files')) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
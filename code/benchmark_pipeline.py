@@ -0,0 +1,221 @@
+# Times and memory-profiles each stage of the harvest-to-graph pipeline on synthetic corpora of several sizes
+# For every scale a corpus is generated with synthetic_corpus.py (same layout as the harvester's files), then each
+# stage is run: the parsers, process_files of the gephi scripts, the NetworkX graph build and community detection,
+# and the bot-like/spam, near-duplicate and burst detection
+# Each stage is timed without memory tracing (best of --repeats runs) and then run once more under tracemalloc for
+# its peak memory, with its printed output discarded; the gephi scripts run with a warm parse cache
+# Results are saved as JSON with the commit, Python version and corpus settings, and --compare prints how a run
+# differs from an earlier results file, so slowdowns between commits show up
+# Run: python benchmark_pipeline.py [--scales 10 50 200] [--mean-comments 100] [--output benchmark_results.json]
+#      python benchmark_pipeline.py --compare old_results.json
+# Needs numpy, scipy and networkx
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from comment_parser import load_comments, parse_comment_file, video_id_from_path
+from corpus_index import comment_files
+from graph_analysis import cocommenter_edges, detect_communities, to_networkx
+from near_duplicates import near_duplicate_clusters
+from synthetic_corpus import CORPUS_SETTINGS, write_corpus
+from temporal_bursts import CommentTimes, author_bursts, synchronized_pairs, video_bursts
+import gephi_all_networks
+import gephi_burst_network
+import gephi_cocommenter_network
+import gephi_commentercomment_network
+import gephi_videocommenter_network
+
+ALL_VIDEOS = 10 ** 9
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+# Best wall time over repeats and the peak traced memory of one more run (None without trace_memory)
+# setup runs untimed before every run, e.g. to empty a cache
+def measure(function, repeats=1, trace_memory=True, setup=None):
+    best = None
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        gc.collect()
+        with quiet():
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if trace_memory:
+        if setup is not None:
+            setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with quiet():
+                function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+# (stage name, function, setup) for one corpus; the inputs of the detection stages are built here, untimed
+def pipeline_stages(directory_path):
+    filenames = comment_files(directory_path)
+    file_paths = [os.path.join(directory_path, filename) for filename in filenames]
+    cold_cache = os.path.join(directory_path, 'benchmark_cache')
+    with quiet():
+        video_records = [(video_id_from_path(file_path), load_comments(file_path)) for file_path in file_paths]
+
+    video_commenters = [(video_id, [record.author for record in records]) for video_id, records in video_records]
+    comment_counts = gephi_commentercomment_network.CommentCounts()
+    for _, records in video_records:
+        for record in records:
+            comment_counts.add(record.author, record.comment)
+    comment_pairs = comment_counts.grouped_pairs()
+    comment_order = np.arange(len(comment_counts.comments))
+    texts = [comment_counts.comments[comment] for comment in comment_order]
+    text_weights = np.bincount(comment_pairs[1], minlength=len(texts)).tolist()
+    comments = [(video_id, record.author, record.published_at) for video_id, records in video_records for record in records]
+    edges = cocommenter_edges(video_commenters)
+
+    def parse_all(parse):
+        return lambda: [parse(file_path) for file_path in file_paths]
+
+    def detect_bursts():
+        times = CommentTimes(comments)
+        list(video_bursts(times))
+        list(author_bursts(times))
+        list(synchronized_pairs(times))
+
+    return [
+        ('parse_comment_file', parse_all(parse_comment_file), None),
+        ('load_comments (writing cache)', parse_all(lambda path: load_comments(path, cache_directory=cold_cache)),
+         lambda: shutil.rmtree(cold_cache, ignore_errors=True)),
+        ('load_comments (cached)', parse_all(load_comments), None),
+        ('parse_comments videocommenter', parse_all(gephi_videocommenter_network.parse_comments), None),
+        ('parse_comments cocommenter', parse_all(gephi_cocommenter_network.parse_comments), None),
+        ('parse_comments commentercomment', parse_all(gephi_commentercomment_network.parse_comments), None),
+        ('parse_comments burst', parse_all(gephi_burst_network.parse_comments), None),
+        ('process_files videocommenter', lambda: gephi_videocommenter_network.process_files(directory_path, ALL_VIDEOS), None),
+        ('process_files cocommenter', lambda: gephi_cocommenter_network.process_files(directory_path, ALL_VIDEOS), None),
+        ('process_files commentercomment',
+         lambda: gephi_commentercomment_network.process_files(directory_path, ALL_VIDEOS), None),
+        ('process_files burst', lambda: gephi_burst_network.process_files(directory_path, ALL_VIDEOS), None),
+        ('process_files all three in one pass', lambda: gephi_all_networks.process_files(directory_path, ALL_VIDEOS, [
+            gephi_all_networks.VideoCommenterGraph(), gephi_all_networks.CoCommenterGraph(),
+            gephi_all_networks.CommenterCommentGraph()]), None),
+        ('networkx graph build', lambda: to_networkx(cocommenter_edges(video_commenters)), None),
+        ('communities', lambda: detect_communities(edges), None),
+        ('detect bot-like and spam', lambda: (
+            gephi_commentercomment_network.detect_bot_like_behavior(comment_counts, comment_pairs, comment_order),
+            gephi_commentercomment_network.detect_spam_comments(comment_counts, comment_pairs)), None),
+        ('near-duplicate clusters', lambda: near_duplicate_clusters(texts, text_weights), None),
+        ('bursts and synchronized pairs', detect_bursts, None),
+    ]
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Runs every stage (or those whose name contains one of stage_filters) at each number of videos in scales
+def run_benchmark(scales, corpus_settings=None, repeats=1, trace_memory=True, stage_filters=None, keep_corpora=False):
+    corpus_settings = dict(CORPUS_SETTINGS, **(corpus_settings or {}))
+    corpus_settings.pop('num_videos')  # Set by each scale
+    results = []
+    for num_videos in scales:
+        directory_path = tempfile.mkdtemp(prefix=f'benchmark_{num_videos}_videos_')
+        write_corpus(directory_path, **dict(corpus_settings, num_videos=num_videos))
+        comment_count = sum(len(parse_comment_file(os.path.join(directory_path, filename)))
+                            for filename in comment_files(directory_path))
+        for name, function, setup in pipeline_stages(directory_path):
+            if stage_filters and not any(stage_filter in name for stage_filter in stage_filters):
+                continue
+            seconds, peak = measure(function, repeats, trace_memory, setup)
+            results.append({'videos': num_videos, 'comments': comment_count, 'stage': name, 'seconds': round(seconds, 6),
+                            'peak_mb': round(peak / 2**20, 3) if peak is not None else None})
+            memory = f"{peak / 2**20:9.1f} MB" if peak is not None else ""
+            print(f"{num_videos:>6} videos {comment_count:>9} comments  {name:<34} {seconds:9.3f} s {memory}")
+        if keep_corpora:
+            print(f"Corpus kept in {directory_path}")
+        else:
+            shutil.rmtree(directory_path)
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeats': repeats,
+        'corpus_settings': corpus_settings,
+        'results': results,
+    }
+
+# Prints each stage's time and memory next to the same stage and scale in an earlier results file
+def compare_results(old, new):
+    old_results = {(result['videos'], result['stage']): result for result in old['results']}
+    print(f"Comparing with {old.get('commit') or 'unknown commit'} ({old.get('timestamp')})")
+    print(f"{'videos':>6}  {'stage':<34} {'old s':>9} {'new s':>9} {'ratio':>6} {'old MB':>8} {'new MB':>8}")
+    for result in new['results']:
+        before = old_results.get((result['videos'], result['stage']))
+        if before is None:
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('nan')
+        old_peak = f"{before['peak_mb']:8.1f}" if before.get('peak_mb') is not None else f"{'':>8}"
+        new_peak = f"{result['peak_mb']:8.1f}" if result.get('peak_mb') is not None else f"{'':>8}"
+        print(f"{result['videos']:>6}  {result['stage']:<34} {before['seconds']:9.3f} {result['seconds']:9.3f} "
+              f"{ratio:6.2f} {old_peak} {new_peak}")
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the harvest-to-graph pipeline on synthetic corpora.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[10, 50, 200], help="numbers of videos to benchmark")
+    parser.add_argument('--mean-comments', type=int, default=100, help="mean comments per video")
+    parser.add_argument('--comment-spread', type=float, default=CORPUS_SETTINGS['comment_spread'],
+                        help="sigma of the lognormal comments-per-video distribution (0 = all the same)")
+    parser.add_argument('--shared-authors', type=int, default=CORPUS_SETTINGS['shared_authors'],
+                        help="commenters active across videos")
+    parser.add_argument('--author-overlap', type=float, default=CORPUS_SETTINGS['author_overlap'],
+                        help="share of comments written by the shared commenters")
+    parser.add_argument('--reply-ratio', type=float, default=CORPUS_SETTINGS['reply_ratio'], help="share of replies")
+    parser.add_argument('--campaign-ratio', type=float, default=CORPUS_SETTINGS['campaign_ratio'],
+                        help="share of copy-pasted campaign comments")
+    parser.add_argument('--seed', type=int, default=CORPUS_SETTINGS['seed'], help="corpus seed")
+    parser.add_argument('--repeats', type=int, default=1, help="timed runs per stage (the best is kept)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run of each stage")
+    parser.add_argument('--stages', nargs='+', help="only stages whose name contains one of these")
+    parser.add_argument('--output', default='benchmark_results.json', help="results file (default benchmark_results.json)")
+    parser.add_argument('--compare', help="earlier results file to compare with")
+    parser.add_argument('--keep-corpora', action='store_true', help="keep the generated corpora")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    corpus_settings = {
+        'mean_comments': args.mean_comments, 'comment_spread': args.comment_spread, 'shared_authors': args.shared_authors,
+        'author_overlap': args.author_overlap, 'reply_ratio': args.reply_ratio, 'campaign_ratio': args.campaign_ratio,
+        'seed': args.seed,
+    }
+    report = run_benchmark(args.scales, corpus_settings, args.repeats, not args.no_memory, args.stages, args.keep_corpora)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results saved to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            compare_results(json.load(file), report)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
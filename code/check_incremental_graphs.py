@@ -0,0 +1,97 @@
+# Checks that the gephi scripts' incremental mode (process_files_incremental) gives the same CSVs as a full rebuild
+# The comment files of a folder are copied into a temporary folder in steps: half of the videos, all of them, one
+# video changed, one video removed. After each step the graphs are updated incrementally in that folder and built
+# from scratch in a fresh copy of it, and the CSV rows are compared (sorted, since the row order can differ)
+# Small bot-like and spam thresholds are used so the behavior labels are exercised on small samples
+# Run: python check_incremental_graphs.py [folder]
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+from comment_format import COMMENT_SEPARATOR
+from corpus_index import comment_files
+import gephi_cocommenter_network
+import gephi_commentercomment_network
+import gephi_videocommenter_network
+
+ALL_VIDEOS = 10 ** 9
+
+# (name, CSV file prefix, full build, incremental build)
+GRAPHS = [
+    ('videocommenter', 'videocommenter',
+     lambda path: gephi_videocommenter_network.process_files(path, ALL_VIDEOS),
+     lambda path: gephi_videocommenter_network.process_files_incremental(path, ALL_VIDEOS)),
+    ('cocommenter', 'cocommenter',
+     lambda path: gephi_cocommenter_network.process_files(path, ALL_VIDEOS),
+     lambda path: gephi_cocommenter_network.process_files_incremental(path, ALL_VIDEOS)),
+    ('cocommenter (top_k=3)', 'cocommenter',
+     lambda path: gephi_cocommenter_network.process_files(path, ALL_VIDEOS, top_k=3),
+     lambda path: gephi_cocommenter_network.process_files_incremental(path, ALL_VIDEOS, top_k=3)),
+    ('commentercomment', 'commentercomment',
+     lambda path: gephi_commentercomment_network.process_files(path, ALL_VIDEOS, 1, 1),
+     lambda path: gephi_commentercomment_network.process_files_incremental(path, ALL_VIDEOS, 1, 1)),
+]
+
+# Keeps the first half of a comment file's records
+def truncate_comment_file(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        records = file.read().split(f"{COMMENT_SEPARATOR}\n\n")
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(f"{COMMENT_SEPARATOR}\n\n".join(records[:max(len(records) // 2, 1)]) + f"{COMMENT_SEPARATOR}\n\n")
+
+def read_rows(file_path):
+    with open(file_path, 'r', encoding='utf-8', newline='') as file:
+        lines = file.read().split('\r\n')
+    return lines[0], sorted(lines[1:])
+
+def compare_graphs(incremental_directory, step):
+    failures = 0
+    full_directory = tempfile.mkdtemp(prefix='full_graph_')
+    for filename in comment_files(incremental_directory):
+        shutil.copy2(os.path.join(incremental_directory, filename), full_directory)
+    for name, prefix, build_full, build_incremental in GRAPHS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_incremental(incremental_directory)
+            build_full(full_directory)
+        for suffix in ('_nodes.csv', '_edges.csv'):
+            incremental_rows = read_rows(os.path.join(incremental_directory, prefix + suffix))
+            full_rows = read_rows(os.path.join(full_directory, prefix + suffix))
+            same = incremental_rows == full_rows
+            failures += not same
+            print(f"{step:<24} {name:<24} {suffix[1:]:<10} {len(full_rows[1]):>8} rows  {'same' if same else 'DIFFERENT'}")
+    shutil.rmtree(full_directory)
+    return failures
+
+def run_check(source_directory):
+    filenames = comment_files(source_directory)
+    if len(filenames) < 2:
+        print("Need at least two comment files to check incremental updates")
+        return 1
+    directory_path = tempfile.mkdtemp(prefix='incremental_graph_')
+    half = len(filenames) // 2
+    failures = 0
+
+    for filename in filenames[:half]:
+        shutil.copy2(os.path.join(source_directory, filename), directory_path)
+    failures += compare_graphs(directory_path, f"{half} videos")
+
+    for filename in filenames[half:]:
+        shutil.copy2(os.path.join(source_directory, filename), directory_path)
+    failures += compare_graphs(directory_path, f"{len(filenames)} videos")
+
+    truncate_comment_file(os.path.join(directory_path, filenames[0]))
+    failures += compare_graphs(directory_path, f"{filenames[0]} changed")
+
+    os.remove(os.path.join(directory_path, filenames[-1]))
+    failures += compare_graphs(directory_path, f"{filenames[-1]} removed")
+
+    shutil.rmtree(directory_path)
+    print("Incremental graphs match full rebuilds" if not failures else f"{failures} CSV files differ from a full rebuild")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    default_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample_comments')
+    sys.exit(run_check(sys.argv[1] if len(sys.argv) > 1 else default_directory))
@@ -0,0 +1,156 @@
+# Co-commenter edges from a sparse commenter x video matrix, for gephi_cocommenter_network.py and NetworkX_makeGraph.py
+# Commenters and videos are numbered, and A[commenter, video] = 1 when the commenter commented on the video
+# A * A^T then holds, for every pair of commenters, the number of videos they both commented on (the edge weight),
+# so each pair is one weighted edge instead of one row per shared video
+# The product is formed a block of commenters at a time and written out as it goes, so memory stays bounded
+# Edges can be pruned to a minimum weight and to each commenter's top_k heaviest edges
+# Needs numpy and scipy (pip install numpy scipy)
+
+import csv
+from array import array
+import numpy as np
+from scipy import sparse
+from string_table import StringTable
+
+DEFAULT_BLOCK_SIZE = 4096  # Commenters per block of A * A^T
+
+# Collects the commenter x video matrix one video at a time; commenters are interned (see string_table.py) and the
+# (commenter, video) entries kept as 32-bit integer arrays until the matrix is built
+class IncidenceBuilder:
+    def __init__(self):
+        self.authors = StringTable()
+        self.video_ids = []
+        self.rows = array('i')
+        self.columns = array('i')
+
+    # Repeated commenters count once per video
+    def add_video(self, video_id, commenters):
+        column = len(self.video_ids)
+        self.video_ids.append(video_id)
+        for commenter in set(commenters):
+            if commenter:
+                self.rows.append(self.authors.intern(commenter))
+                self.columns.append(column)
+
+    # Returns the commenter x video matrix with the sorted commenter names and the video IDs for its rows and columns
+    def incidence(self):
+        # Renumber commenters in name order so the output does not depend on the order files were read
+        authors = sorted(self.authors.strings)
+        renumber = np.empty(len(authors), dtype=np.int64)
+        renumber[[self.authors.ids[author] for author in authors]] = np.arange(len(authors))
+        rows = renumber[np.frombuffer(self.rows, dtype=np.int32)]
+        columns = np.frombuffer(self.columns, dtype=np.int32).astype(np.int64)
+        data = np.ones(len(rows), dtype=np.int32)
+        incidence = sparse.csr_matrix((data, (rows, columns)), shape=(len(authors), len(self.video_ids)))
+        return incidence, authors, self.video_ids
+
+# video_commenters yields (video_id, [commenter, ...]) for each video; repeated commenters count once per video
+# Returns the commenter x video matrix with the sorted commenter names and the video IDs for its rows and columns
+def build_incidence(video_commenters):
+    builder = IncidenceBuilder()
+    for video_id, commenters in video_commenters:
+        builder.add_video(video_id, commenters)
+    return builder.incidence()
+
+# Adds A * A^T of the added videos to a stored product and takes out that of the removed ones, so it need not be
+# multiplied out again from every video; added and removed are lists of commenter lists, one per video
+# author_ids numbers the commenters, new ones are numbered as they appear; returns the updated product
+def update_product(product, author_ids, added, removed):
+    def incidence_of(video_commenters):
+        rows = [author_ids.setdefault(commenter, len(author_ids))
+                for commenters in video_commenters for commenter in set(commenters) if commenter]
+        columns = [column for column, commenters in enumerate(video_commenters)
+                   for commenter in set(commenters) if commenter]
+        return rows, columns
+
+    added_rows, added_columns = incidence_of(added)
+    removed_rows, removed_columns = incidence_of(removed)
+    size = len(author_ids)
+    if product is None:
+        product = sparse.csr_matrix((size, size), dtype=np.int64)
+    elif product.shape[0] < size:
+        product = product.tocsr(copy=True)
+        product.resize((size, size))
+    for rows, columns, sign in ((added_rows, added_columns, 1), (removed_rows, removed_columns, -1)):
+        if rows:
+            incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns)), shape=(size, max(columns) + 1))
+            product = product + sign * (incidence @ incidence.T)
+    product.eliminate_zeros()
+    return product.tocsr()
+
+# Yields (rows, columns, weights) arrays of A * A^T one block of commenter rows at a time, self-pairs left out
+def iter_product_blocks(incidence, block_size=DEFAULT_BLOCK_SIZE):
+    transposed = incidence.T.tocsr()
+    for start in range(0, incidence.shape[0], block_size):
+        block = (incidence[start:start + block_size] @ transposed).tocoo()
+        rows = block.row.astype(np.int64) + start
+        keep = block.col != rows
+        yield rows[keep], block.col[keep].astype(np.int64), block.data[keep]
+
+# The same blocks from an already computed A * A^T (such as the one graph_state.py keeps up to date)
+def iter_weight_blocks(product, block_size=DEFAULT_BLOCK_SIZE):
+    product = product.tocsr()
+    for start in range(0, product.shape[0], block_size):
+        block = product[start:start + block_size].tocoo()
+        rows = block.row.astype(np.int64) + start
+        keep = block.col != rows
+        yield rows[keep], block.col[keep].astype(np.int64), block.data[keep]
+
+# Blocks of A * A^T, multiplied out from the incidence matrix unless the product is given
+def iter_blocks(incidence, block_size=DEFAULT_BLOCK_SIZE, product=None):
+    if product is not None:
+        return iter_weight_blocks(product, block_size)
+    return iter_product_blocks(incidence, block_size)
+
+# Weight of each commenter's top_k-th heaviest edge (0 when they have top_k edges or fewer)
+def top_k_thresholds(incidence, top_k, block_size=DEFAULT_BLOCK_SIZE, product=None):
+    thresholds = np.zeros((product if product is not None else incidence).shape[0], dtype=np.int64)
+    for rows, _, weights in iter_blocks(incidence, block_size, product):
+        if not len(rows):
+            continue
+        order = np.lexsort((-weights, rows))
+        sorted_rows = rows[order]
+        sorted_weights = weights[order]
+        row_ids, first, counts = np.unique(sorted_rows, return_index=True, return_counts=True)
+        full = counts >= top_k
+        thresholds[row_ids[full]] = sorted_weights[first[full] + top_k - 1]
+    return thresholds
+
+# Yields (rows, columns, weights) arrays of the co-commenter edges, each pair once with row < column
+# An edge is kept when it weighs at least min_weight and, with top_k set, is among the top_k heaviest
+# edges of either commenter (edges tied with the top_k-th are kept too)
+# product can be a precomputed A * A^T to use instead of multiplying out incidence (which may then be None)
+def iter_cocommenter_edges(incidence, min_weight=1, top_k=None, block_size=DEFAULT_BLOCK_SIZE, product=None):
+    thresholds = top_k_thresholds(incidence, top_k, block_size, product) if top_k else None
+    for rows, columns, weights in iter_blocks(incidence, block_size, product):
+        keep = (columns > rows) & (weights >= min_weight)
+        if thresholds is not None:
+            keep &= (weights >= thresholds[rows]) | (weights >= thresholds[columns])
+        rows, columns, weights = rows[keep], columns[keep], weights[keep]
+        order = np.lexsort((columns, rows))
+        yield rows[order], columns[order], weights[order]
+
+# A name as csv.writer would write it (quoted when needed), so edge rows can be joined without going through csv.writer
+def csv_field(name):
+    if ',' in name or '"' in name or '\r' in name or '\n' in name:
+        return '"' + name.replace('"', '""') + '"'
+    return name
+
+# Writes the edges to a Gephi edge CSV (Source, Target, Weight) as they are computed; returns the number of edges
+def write_cocommenter_edges(edge_csv_path, incidence, authors, min_weight=1, top_k=None, block_size=DEFAULT_BLOCK_SIZE,
+                            product=None):
+    fields = [csv_field(author) for author in authors]
+    edge_count = 0
+    with open(edge_csv_path, 'w', newline='', encoding='utf-8') as edge_file:
+        csv.writer(edge_file).writerow(['Source', 'Target', 'Weight'])
+        for rows, columns, weights in iter_cocommenter_edges(incidence, min_weight, top_k, block_size, product):
+            edge_file.write(''.join([f"{fields[i]},{fields[j]},{weight}\r\n"
+                                     for i, j, weight in zip(rows.tolist(), columns.tolist(), weights.tolist())]))
+            edge_count += len(rows)
+    return edge_count
+
+# The same edges as (commenter, commenter, weight) tuples, e.g. for networkx's add_weighted_edges_from
+def cocommenter_edge_list(incidence, authors, min_weight=1, top_k=None, block_size=DEFAULT_BLOCK_SIZE):
+    for rows, columns, weights in iter_cocommenter_edges(incidence, min_weight, top_k, block_size):
+        for i, j, weight in zip(rows.tolist(), columns.tolist(), weights.tolist()):
+            yield authors[i], authors[j], weight
@@ -0,0 +1,37 @@
+# Newline-delimited JSON dump of parsed comments, written by NetworkX_makeGraph.py
+# One comment or reply per line: {"video_id": ..., "author": ..., "comment": ..., "likes": ..., "published_at": ...,
+# "comment_id": ..., "reply_to": ...}, with fields the record does not have left out
+# Lines are written as each video is parsed, so the dump never has to be held in memory, and it is read back
+# lazily one video at a time; the comments of a video are always on consecutive lines
+
+import json
+from comment_parser import CommentRecord
+
+def record_line(video_id, record):
+    values = {'video_id': video_id}
+    values.update((key, value) for key, value in record._asdict().items() if value is not None)
+    return json.dumps(values, ensure_ascii=False) + '\n'
+
+# Passes (video_id, [CommentRecord, ...]) pairs through unchanged, writing each video's comments to the dump on the way
+def dump_video_comments(video_comments, dump_path):
+    with open(dump_path, 'w', encoding='utf-8', newline='\n') as dump_file:
+        for video_id, records in video_comments:
+            dump_file.write(''.join([record_line(video_id, record) for record in records]))
+            yield video_id, records
+
+# Reads a dump back as (video_id, [CommentRecord, ...]) pairs, one video at a time
+def iter_comment_dump(dump_path):
+    current_video_id = None
+    records = []
+    with open(dump_path, 'r', encoding='utf-8') as dump_file:
+        for line in dump_file:
+            values = json.loads(line)
+            video_id = values.pop('video_id')
+            if video_id != current_video_id:
+                if records:
+                    yield current_video_id, records
+                current_video_id = video_id
+                records = []
+            records.append(CommentRecord(*(values.get(field) for field in CommentRecord._fields)))
+    if records:
+        yield current_video_id, records
@@ -0,0 +1,73 @@
+# Layout of the <video_id>.txt comment files written by the harvester
+# Each comment or reply is a record ending in a separator line and a blank line
+# The harvester streams records to the file as pages arrive, so the comment count is written as a trailer line
+# after the last record; files written before that have it as a header line instead, and readers accept both
+# A refresh appends the new records of an already harvested video with append_comment_records
+
+import os
+
+COMMENT_SEPARATOR = "--------------------------------------------------"
+COMMENT_COUNT_PREFIX = "Number of Comments: "
+
+def write_comment_record(file, comment):
+    if comment['type'] == 'comment':
+        file.write(f"Author: {comment['author']}\n")
+        file.write(f"Comment: {comment['comment']}\n")
+        file.write(f"Likes: {comment['like_count']}\n")
+        file.write(f"Published At: {comment['published_at']}\n")
+        file.write(f"Comment ID: {comment['comment_id']}\n")
+        file.write(f"{COMMENT_SEPARATOR}\n\n")
+    elif comment['type'] == 'reply':
+        file.write(f"Author: {comment['author']} (Reply to Comment ID: {comment['reply_to']})\n")
+        file.write(f"Reply: {comment['comment']}\n")
+        file.write(f"Likes: {comment['like_count']}\n")
+        file.write(f"Published At: {comment['published_at']}\n")
+        file.write(f"Comment ID: {comment['comment_id']}, Reply to ID: {comment['reply_to']}\n")
+        file.write(f"{COMMENT_SEPARATOR}\n\n")
+
+def write_comment_count(file, comment_count):
+    file.write(f"{COMMENT_COUNT_PREFIX}{comment_count}\n")
+
+# Reads the comment count from the trailer (streamed files) or the header (older files) without reading the records
+# Returns None if the file has neither, e.g. a harvest that has not finished
+def read_comment_count(file_path):
+    with open(file_path, 'rb') as file:
+        first_line = file.readline().decode('utf-8', errors='replace')
+        if first_line.startswith(COMMENT_COUNT_PREFIX):
+            return int(first_line[len(COMMENT_COUNT_PREFIX):])
+        file.seek(0, os.SEEK_END)
+        file.seek(max(file.tell() - 256, 0))
+        tail = file.read().decode('utf-8', errors='replace')
+    last_line = tail.rstrip('\n').rsplit('\n', 1)[-1]
+    if last_line.startswith(COMMENT_COUNT_PREFIX):
+        return int(last_line[len(COMMENT_COUNT_PREFIX):])
+    return None
+
+# Adds records to the end of a finished comment file and updates its count; the existing records are copied byte
+# for byte (a header count moves to the trailer) and the file is replaced in one step, so a crash leaves the old file
+def append_comment_records(file_path, comments):
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    prefix = COMMENT_COUNT_PREFIX.encode('utf-8')
+    comment_count = None
+    if data.startswith(prefix):
+        header_end = data.find(b'\n') + 1 or len(data)
+        comment_count = int(data[len(prefix):header_end])
+        data = data[header_end:].lstrip(b'\r\n')
+    else:
+        trailer_start = data.rstrip(b'\r\n').rfind(b'\n') + 1
+        if data[trailer_start:].startswith(prefix):
+            comment_count = int(data[trailer_start + len(prefix):])
+            data = data[:trailer_start]
+    if comment_count is None:  # No count yet: count the records by their separator lines
+        comment_count = sum(1 for line in data.split(b'\n') if line.rstrip(b'\r') == COMMENT_SEPARATOR.encode('utf-8'))
+
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    with open(temp_path, 'a', encoding='utf-8') as file:
+        for comment in comments:
+            write_comment_record(file, comment)
+        write_comment_count(file, comment_count + len(comments))
+    os.replace(temp_path, file_path)
+    return comment_count + len(comments)
@@ -0,0 +1,230 @@
+# Shared parser for the <video_id>.txt comment files, used by all of the graph scripts
+# parse_comment_file reads a file in one streaming pass into compact CommentRecord tuples; records are split on the
+# separator lines the harvester writes, so comments and replies that span several lines are kept whole, and
+# replies carry the ID of the comment they answer in reply_to
+# parse_comment_authors and parse_comment_author_texts find the same records but only keep the author (and text),
+# for the graph scripts that need no more
+# load_comments does the same through a per-file cache: the parsed columns are saved with numpy to
+# parse_cache/<video_id>.npz next to the text files, and reused as long as the text file's modification
+# time and size are unchanged, so rebuilding a graph does not parse files that have not changed;
+# load_comment_authors and load_comment_author_texts do the same for the two faster scans
+# Without numpy installed the cache is skipped and every file is parsed from text
+
+import os
+import re
+import zipfile
+from collections import namedtuple
+from operator import itemgetter
+from comment_format import COMMENT_SEPARATOR
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CommentRecord = namedtuple('CommentRecord', ['author', 'comment', 'likes', 'published_at', 'comment_id', 'reply_to'])
+
+CACHE_DIRECTORY_NAME = 'parse_cache'
+CACHE_VERSION = 3  # Bump when the parsing rules change so old cache files are parsed again
+STRING_FIELDS = ('author', 'comment', 'published_at', 'comment_id', 'reply_to')
+
+RECORD_END = '\n' + COMMENT_SEPARATOR + '\n'
+REPLY_AUTHOR_MARKER = ' (Reply to Comment ID: '
+REPLY_ID_MARKER = ', Reply to ID: '
+
+def video_id_from_path(file_path):
+    return os.path.basename(file_path).replace('.txt', '')
+
+# Author name as the graphs use it, from the text after "Author:": without the reply marker or a leading '@'
+# Authors written without an '@' (names from before YouTube handles) are kept as they are
+def clean_author(author):
+    author = author.strip()
+    marker_index = author.find(REPLY_AUTHOR_MARKER)
+    if marker_index >= 0:
+        author = author[:marker_index]
+    if author.startswith('@'):
+        author = author[1:]
+    return author
+
+# Comment or reply text from the lines after the "Author:" line, without its "Comment:"/"Reply:" prefix
+def clean_text(body):
+    if body.startswith('Comment:'):
+        body = body[8:]  # len('Comment:')
+    elif body.startswith('Reply:'):
+        body = body[6:]  # len('Reply:')
+    return body.strip()
+
+# One whole record: its "Author:" line, at least one more line, the Likes/Published At/Comment ID lines and the
+# separator; the text is matched lazily, so a record ends at the first separator whose last lines are a record's
+# (a separator inside a comment is just part of the text) and a block that never ends that way is joined to the next
+# The authors-only and author-and-text patterns find the same records but capture less, for scripts that need less
+RECORD_TAIL = 'Likes:(.*)\nPublished At:(.*)\nComment ID:(.*)' + re.escape(RECORD_END)
+RECORD_PATTERN = re.compile('^Author:(.*)\n((?:.*\n)+?)' + RECORD_TAIL, re.MULTILINE)
+AUTHOR_TEXT_PATTERN = re.compile('^Author:(.*)\n((?:.*\n)+?)' + RECORD_TAIL.replace('(.*)', '.*'), re.MULTILINE)
+
+# The authors-only pattern also does clean_author's work, so no Python runs per record: the name is what is left
+# after the whitespace str.strip removes (re's \s leaves some of it out), a leading '@' and the reply marker
+WHITESPACE = ''.join(character for character in map(chr, range(0x3001)) if character.isspace())
+SPACE = '[' + re.escape(WHITESPACE.replace('\n', '')) + ']*'  # Whitespace within a line
+TEXT = SPACE + '[^' + re.escape(WHITESPACE) + ']'  # Something other than whitespace later on the line
+AUTHOR_PATTERN = re.compile(
+    '^Author:' + SPACE + '@?(.*?)(?: \\(Reply to Comment ID: ' + TEXT + '.*|' + SPACE + ')\n(?:.*\n)+?'
+    + RECORD_TAIL.replace('(.*)', '.*'), re.MULTILINE)
+
+def make_record(match):
+    author, body, likes, published_at, comment_id = match.groups()
+    likes = likes.strip()
+    comment_id = comment_id.strip()
+    reply_to = None
+    if REPLY_ID_MARKER in comment_id:
+        comment_id, reply_to = comment_id.split(REPLY_ID_MARKER, 1)
+    return CommentRecord(clean_author(author), clean_text(body), int(likes) if likes.isdigit() else None,
+                         published_at.strip(), comment_id, reply_to)
+
+def make_author_text(match):
+    author, body = match.groups()
+    return clean_author(author), clean_text(body)
+
+make_author = itemgetter(1)  # AUTHOR_PATTERN has already cleaned it
+
+# Reads the file in large chunks and finds whole records in each with pattern, so the text is scanned by the regex
+# engine instead of line by line in Python; make turns each match into what is returned, a chunk at a time
+# Carriage returns are dropped: comments saved on Windows end their text lines in '\r\r\n',
+# which universal newlines would read as an extra blank line
+def read_comment_records(file, pattern=RECORD_PATTERN, make=make_record, chunk_size=1 << 20):
+    records = []
+    pending = ''  # Text after the last whole record
+    while True:
+        chunk = file.read(chunk_size)
+        text = pending + chunk.replace('\r', '')
+        matches = list(pattern.finditer(text))
+        if matches:
+            records.extend(map(make, matches))
+            text = text[matches[-1].end():]
+        pending = text
+        if not chunk:
+            break
+    # A file whose last record has no separator yet, such as one still being written
+    pending = pending.strip('\n')
+    start = 0 if pending.startswith('Author:') else pending.find('\nAuthor:') + 1
+    if pending and (start > 0 or pending.startswith('Author:')):
+        match = pattern.fullmatch(pending[start:] + RECORD_END)
+        if match is not None:
+            records.append(make(match))
+    return records
+
+def parse_comment_file(file_path, pattern=RECORD_PATTERN, make=make_record):
+    with open(file_path, 'r', encoding='utf-8', newline='') as file:
+        return read_comment_records(file, pattern, make)
+
+# Only the author of each record, in file order (faster than parsing whole records)
+def parse_comment_authors(file_path):
+    return parse_comment_file(file_path, AUTHOR_PATTERN, make_author)
+
+# Only (author, text) of each record, in file order
+def parse_comment_author_texts(file_path):
+    return parse_comment_file(file_path, AUTHOR_TEXT_PATTERN, make_author_text)
+
+# The cache holds the likes column as an int64 array and the string columns, one after another, as a single
+# UTF-8 blob of the values joined by a separator, with missing values written as a marker character; reading
+# a file back is one np.load, one decode and one split, which is several times faster than parsing the text
+# A script that only needs some columns (e.g. the authors) caches only those; 'fields' names the string columns
+# a cache holds (caches without it hold all of them), and a script needing more parses the file and caches it all
+COLUMN_SEPARATOR = '\x1f'
+MISSING_VALUE = '\x1e'
+
+def cache_path_for(file_path, cache_directory=None):
+    if cache_directory is None:
+        cache_directory = os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIRECTORY_NAME)
+    return os.path.join(cache_directory, video_id_from_path(file_path) + '.npz')
+
+def source_key(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_mtime_ns, stat.st_size, CACHE_VERSION]
+
+# Returns {field: values} for the string fields (and 'likes') asked for, or None if the cache is missing, out of
+# date or does not hold them all; only the string columns up to the last one asked for are split
+def read_cache(cache_path, key, fields=STRING_FIELDS + ('likes',)):
+    string_fields = [field for field in fields if field != 'likes']
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            if cache['key'].tolist() != key:
+                return None
+            stored = cache['fields'].tobytes().decode('ascii').split(',') if 'fields' in cache.files else list(STRING_FIELDS)
+            if any(field not in stored for field in string_fields) or ('likes' in fields and 'likes' not in cache.files):
+                return None
+            count = int(cache['count'][0]) if 'count' in cache.files else len(cache['likes'])
+            likes = cache['likes'].tolist() if 'likes' in fields else None
+            text = cache['text'].tobytes().decode('utf-8')
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None  # Missing or unreadable cache; parse the text instead
+    needed = count * (max(stored.index(field) for field in string_fields) + 1) if string_fields else 0
+    values = text.split(COLUMN_SEPARATOR, needed)[:needed] if needed else []
+    columns = {}
+    for field in string_fields:
+        start = stored.index(field) * count
+        columns[field] = [None if value == MISSING_VALUE else value for value in values[start:start + count]]
+    if likes is not None:
+        columns['likes'] = [value if value >= 0 else None for value in likes]
+    return columns
+
+# columns is {field: values} for some of the string fields and optionally 'likes', all of the same length
+def write_cache(cache_path, key, columns):
+    fields = [field for field in STRING_FIELDS if field in columns]
+    count = len(columns[fields[0]])
+    values = [MISSING_VALUE if value is None else value for field in fields for value in columns[field]]
+    text = COLUMN_SEPARATOR.join(values)
+    if text.count(COLUMN_SEPARATOR) != max(len(values) - 1, 0):
+        return  # A comment contains the separator character; this file is always parsed from text
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    arrays = {
+        'key': np.array(key, dtype=np.int64),
+        'count': np.array([count], dtype=np.int64),
+        'fields': np.frombuffer(','.join(fields).encode('ascii'), dtype=np.uint8),
+        'text': np.frombuffer(text.encode('utf-8'), dtype=np.uint8),
+    }
+    if 'likes' in columns:
+        arrays['likes'] = np.array([-1 if value is None else value for value in columns['likes']], dtype=np.int64)
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'wb') as cache_file:
+        np.savez(cache_file, **arrays)
+    os.replace(temp_path, cache_path)  # Another run never sees a half-written cache file
+
+def load_comments(file_path, use_cache=True, cache_directory=None):
+    if not use_cache or np is None:
+        return parse_comment_file(file_path)
+    key = source_key(file_path)
+    cache_path = cache_path_for(file_path, cache_directory)
+    columns = read_cache(cache_path, key)
+    if columns is not None:
+        return list(map(CommentRecord._make, zip(*(columns[field] for field in CommentRecord._fields))))
+    records = parse_comment_file(file_path)
+    write_cache(cache_path, key, {field: [getattr(record, field) for record in records] for field in CommentRecord._fields})
+    return records
+
+# The authors of a file's records from the cache, or from parse_comment_authors (caching only the authors)
+def load_comment_authors(file_path, use_cache=True, cache_directory=None):
+    if not use_cache or np is None:
+        return parse_comment_authors(file_path)
+    key = source_key(file_path)
+    cache_path = cache_path_for(file_path, cache_directory)
+    columns = read_cache(cache_path, key, ('author',))
+    if columns is not None:
+        return columns['author']
+    authors = parse_comment_authors(file_path)
+    write_cache(cache_path, key, {'author': authors})
+    return authors
+
+# (author, text) of a file's records from the cache, or from parse_comment_author_texts (caching only those two)
+def load_comment_author_texts(file_path, use_cache=True, cache_directory=None):
+    if not use_cache or np is None:
+        return parse_comment_author_texts(file_path)
+    key = source_key(file_path)
+    cache_path = cache_path_for(file_path, cache_directory)
+    columns = read_cache(cache_path, key, ('author', 'comment'))
+    if columns is not None:
+        return list(zip(columns['author'], columns['comment']))
+    author_texts = parse_comment_author_texts(file_path)
+    write_cache(cache_path, key, {'author': [author for author, _ in author_texts],
+                                  'comment': [text for _, text in author_texts]})
+    return author_texts
@@ -0,0 +1,183 @@
+# Optional SQLite store for harvested comments, written alongside the <video_id>.txt files
+# Tables: videos, search_runs (one row per search), search_results (which videos a search returned),
+# and comments (comments and replies, keyed by comment ID and indexed by author and video)
+# Writes are upserts, so harvesting a video again updates its rows instead of duplicating them
+# The graph scripts can read from the store directly, e.g. only the videos returned for one search phrase,
+# instead of rescanning every text file
+# Existing text files can be loaded with: python comment_store.py <store file> <folder with .txt files>
+
+import os
+import sqlite3
+import sys
+import threading
+from comment_parser import CommentRecord, load_comments, video_id_from_path
+from corpus_index import is_comment_file, is_search_results_file, read_search_results
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    title TEXT,
+    channel_title TEXT,
+    published_at TEXT
+);
+CREATE TABLE IF NOT EXISTS search_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    search_phrase TEXT NOT NULL,
+    search_timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS search_results (
+    run_id INTEGER NOT NULL REFERENCES search_runs(run_id),
+    video_id TEXT NOT NULL REFERENCES videos(video_id),
+    position INTEGER,
+    PRIMARY KEY (run_id, video_id)
+);
+CREATE TABLE IF NOT EXISTS comments (
+    comment_id TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    author TEXT,
+    text TEXT,
+    likes INTEGER,
+    published_at TEXT,
+    reply_to TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_by_video ON comments(video_id);
+CREATE INDEX IF NOT EXISTS comments_by_author ON comments(author);
+CREATE INDEX IF NOT EXISTS search_results_by_video ON search_results(video_id);
+CREATE INDEX IF NOT EXISTS search_runs_by_phrase ON search_runs(search_phrase);
+"""
+
+COMMENT_UPSERT = (
+    "INSERT INTO comments (comment_id, video_id, author, text, likes, published_at, reply_to) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT(comment_id) DO UPDATE SET author = excluded.author, text = excluded.text, likes = excluded.likes,"
+    " published_at = excluded.published_at, reply_to = excluded.reply_to"
+)
+
+VIDEO_UPSERT = (
+    "INSERT INTO videos (video_id, title, channel_title, published_at) VALUES (?, ?, ?, ?)"
+    " ON CONFLICT(video_id) DO UPDATE SET title = excluded.title, channel_title = excluded.channel_title,"
+    " published_at = excluded.published_at"
+)
+
+# Video IDs returned by any search for the phrase, used as a subquery
+PHRASE_VIDEOS = (
+    "SELECT DISTINCT search_results.video_id FROM search_results"
+    " JOIN search_runs ON search_runs.run_id = search_results.run_id WHERE search_runs.search_phrase = ?"
+)
+
+class CommentStore:
+    def __init__(self, db_path):
+        self.lock = threading.Lock()  # The harvester's worker threads share one connection
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    # Search results as the harvester keeps them: dicts with video_id, title, channelTitle and publishedAt
+    # Storing the same search (phrase and timestamp) again reuses its run
+    def add_search_run(self, search_phrase, search_timestamp, search_results):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT run_id FROM search_runs WHERE search_phrase = ? AND search_timestamp IS ?",
+                (search_phrase, search_timestamp)).fetchone()
+            if row is not None:
+                run_id = row[0]
+            else:
+                cursor = self.connection.execute(
+                    "INSERT INTO search_runs (search_phrase, search_timestamp) VALUES (?, ?)", (search_phrase, search_timestamp))
+                run_id = cursor.lastrowid
+            self.connection.executemany(VIDEO_UPSERT, [
+                (video['video_id'], video['title'], video['channelTitle'], video['publishedAt']) for video in search_results])
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO search_results (run_id, video_id, position) VALUES (?, ?, ?)",
+                [(run_id, video['video_id'], position) for position, video in enumerate(search_results)])
+            self.connection.commit()
+        return run_id
+
+    # Comment and reply entries as the harvester builds them (type, author, comment, like_count, ...)
+    def upsert_comment_entries(self, video_id, entries):
+        rows = [(entry['comment_id'], video_id, entry['author'], entry['comment'], entry['like_count'],
+                 entry['published_at'], entry.get('reply_to')) for entry in entries]
+        with self.lock:
+            self.connection.executemany(COMMENT_UPSERT, rows)
+            self.connection.commit()
+
+    def upsert_comment_records(self, video_id, records):
+        rows = [(record.comment_id, video_id, record.author, record.comment, record.likes,
+                 record.published_at, record.reply_to) for record in records]
+        with self.lock:
+            self.connection.executemany(COMMENT_UPSERT, rows)
+            self.connection.commit()
+
+    def import_comment_file(self, file_path):
+        records = load_comments(file_path)
+        self.upsert_comment_records(video_id_from_path(file_path), records)
+        return len(records)
+
+    # Reads a <phrase>_search_results.txt file written by the harvester into a search run
+    def import_search_results_file(self, file_path):
+        search_phrase, search_timestamp, search_results = read_search_results(file_path)
+        if search_phrase is None:
+            return None
+        return self.add_search_run(search_phrase, search_timestamp, search_results)
+
+    def search_phrases(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT search_phrase FROM search_runs ORDER BY search_phrase")]
+
+    def video_ids(self, search_phrase=None):
+        if search_phrase is None:
+            query, parameters = "SELECT DISTINCT video_id FROM comments ORDER BY video_id", ()
+        else:
+            query, parameters = PHRASE_VIDEOS + " ORDER BY search_results.video_id", (search_phrase,)
+        return [row[0] for row in self.connection.execute(query, parameters)]
+
+    def authors(self, search_phrase=None):
+        if search_phrase is None:
+            query, parameters = "SELECT DISTINCT author FROM comments ORDER BY author", ()
+        else:
+            query, parameters = f"SELECT DISTINCT author FROM comments WHERE video_id IN ({PHRASE_VIDEOS}) ORDER BY author", (search_phrase,)
+        return [row[0] for row in self.connection.execute(query, parameters)]
+
+    # Yields (video_id, [CommentRecord, ...]) per video, in video ID order, the same records the text parser gives
+    def iter_video_comments(self, search_phrase=None, video_ids=None):
+        query = "SELECT video_id, author, text, likes, published_at, comment_id, reply_to FROM comments"
+        parameters = ()
+        if search_phrase is not None:
+            query += f" WHERE video_id IN ({PHRASE_VIDEOS})"
+            parameters = (search_phrase,)
+        elif video_ids is not None:
+            query += f" WHERE video_id IN ({','.join('?' * len(video_ids))})"
+            parameters = tuple(video_ids)
+        query += " ORDER BY video_id, rowid"
+        current_video_id = None
+        records = []
+        for video_id, author, text, likes, published_at, comment_id, reply_to in self.connection.execute(query, parameters):
+            if video_id != current_video_id:
+                if records:
+                    yield current_video_id, records
+                current_video_id = video_id
+                records = []
+            records.append(CommentRecord(author, text, likes, published_at, comment_id, reply_to))
+        if records:
+            yield current_video_id, records
+
+    def close(self):
+        self.connection.close()
+
+# Loads every comment file and search results file in a folder into the store
+def import_directory(store, directory_path):
+    for filename in sorted(os.listdir(directory_path)):
+        file_path = os.path.join(directory_path, filename)
+        if is_search_results_file(filename):
+            store.import_search_results_file(file_path)
+            print(f"Imported search results: {filename}")
+        elif is_comment_file(filename):
+            count = store.import_comment_file(file_path)
+            print(f"Imported {count} comments: {filename}")
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python comment_store.py <store file> <folder with .txt files>")
+        sys.exit(1)
+    store = CommentStore(sys.argv[1])
+    import_directory(store, sys.argv[2])
+    store.close()
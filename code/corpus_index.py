@@ -0,0 +1,197 @@
+# Index of the harvested corpus in a folder, for picking which videos a graph is built from
+# Built from "Video List.txt", the <phrase>_search_results.txt files and the <video_id>.txt comment files:
+# one entry per video with its search phrases, title, channel, publish date and comment count
+# The index is saved as corpus_index.json next to the files; on the next load only files that are new or changed
+# (by modification time and size) are read again, and comment counts come from the count line of each comment file
+# select() gives a reproducible list of comment files, always in video ID order: by search phrase, publish date
+# range, the top_n videos by number of comments, and/or a random sample of a given size and seed
+# The gephi scripts take these as selection={'search_phrase': ..., 'top_n': ...} (see select_comment_files)
+# Summary of a folder: python corpus_index.py [folder]
+
+import json
+import os
+import random
+import sys
+from comment_format import COMMENT_SEPARATOR, read_comment_count
+from video_ledger import read_video_list
+
+INDEX_VERSION = 1
+VIDEO_LIST_FILENAME = 'Video List.txt'
+SEARCH_RESULTS_SUFFIX = '_search_results'
+
+def is_search_results_file(filename):
+    return SEARCH_RESULTS_SUFFIX in filename and filename.endswith('.txt')
+
+# Comment files are the <video_id>.txt files; search results and "Video List.txt" are not videos
+def is_comment_file(filename):
+    return filename.endswith('.txt') and not is_search_results_file(filename) and filename != VIDEO_LIST_FILENAME
+
+# Every comment file in a folder, in video ID order
+def comment_files(directory_path):
+    return sorted(filename for filename in os.listdir(directory_path) if is_comment_file(filename))
+
+# Reads a <phrase>_search_results.txt file written by the harvester
+# Returns (search phrase, search timestamp, [{'video_id', 'title', 'channelTitle', 'publishedAt'}, ...])
+def read_search_results(file_path):
+    search_phrase = search_timestamp = None
+    search_results = []
+    fields = {"Video ID:": 'video_id', "Video Title:": 'title', "Channel Title:": 'channelTitle', "Published At:": 'publishedAt'}
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("Search Timestamp:"):
+                search_timestamp = line[len("Search Timestamp:"):].strip()
+            elif line.startswith("Search Phrase:"):
+                search_phrase = line[len("Search Phrase:"):].strip()
+            else:
+                for prefix, key in fields.items():
+                    if line.startswith(prefix):
+                        if key == 'video_id':
+                            search_results.append({'title': None, 'channelTitle': None, 'publishedAt': None})
+                        search_results[-1][key] = line[len(prefix):].strip()
+                        break
+    return search_phrase, search_timestamp, search_results
+
+# Number of comments and replies in a comment file: its count line, or the records counted if it has none
+def count_comments(file_path):
+    comment_count = read_comment_count(file_path)
+    if comment_count is None:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            comment_count = sum(1 for line in file if line.rstrip('\n') == COMMENT_SEPARATOR)
+    return comment_count
+
+class CorpusIndex:
+    def __init__(self, directory_path, index_path=None):
+        self.directory_path = directory_path
+        self.index_path = index_path or os.path.join(directory_path, 'corpus_index.json')
+        self.sources = {}  # filename -> {'stat': [mtime_ns, size], 'data': what was read from the file}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+            if saved.get('version') == INDEX_VERSION:
+                self.sources = saved['sources']
+        except FileNotFoundError:
+            pass
+        self.refresh()
+
+    # Reads the files that are new or changed since the index was saved and drops the ones that are gone
+    def refresh(self):
+        sources = {}
+        for filename in sorted(os.listdir(self.directory_path)):
+            if not filename.endswith('.txt'):
+                continue
+            stat = os.stat(os.path.join(self.directory_path, filename))
+            stat = [stat.st_mtime_ns, stat.st_size]
+            source = self.sources.get(filename)
+            if source is None or source['stat'] != stat:
+                source = {'stat': stat, 'data': self.read_source(filename)}
+            sources[filename] = source
+        self.sources = sources
+        self.videos = self.build_videos()
+
+    def read_source(self, filename):
+        file_path = os.path.join(self.directory_path, filename)
+        if filename == VIDEO_LIST_FILENAME:
+            return read_video_list(file_path)
+        if is_search_results_file(filename):
+            search_phrase, _, search_results = read_search_results(file_path)
+            return {'search_phrase': search_phrase, 'videos': search_results}
+        return {'comment_count': count_comments(file_path)}
+
+    # video_id -> {'video_id', 'filename', 'search_phrases', 'title', 'channel', 'published_at', 'comment_count'}
+    # Videos only seen in search results have no filename and comment_count None
+    def build_videos(self):
+        videos = {}
+
+        def entry(video_id):
+            return videos.setdefault(video_id, {'video_id': video_id, 'filename': None, 'search_phrases': [],
+                                                'title': None, 'channel': None, 'published_at': None, 'comment_count': None})
+
+        def add_details(video, search_phrase, title, channel, published_at):
+            if search_phrase and search_phrase not in video['search_phrases']:
+                video['search_phrases'].append(search_phrase)
+            video['title'] = video['title'] or title
+            video['channel'] = video['channel'] or channel
+            video['published_at'] = video['published_at'] or published_at
+
+        for filename, source in self.sources.items():
+            data = source['data']
+            if filename == VIDEO_LIST_FILENAME:
+                for listed in data:
+                    add_details(entry(listed['video_id']), listed.get('search_phrase'), listed.get('title'),
+                                listed.get('channelTitle'), listed.get('publishedAt'))
+            elif is_search_results_file(filename):
+                for result in data['videos']:
+                    add_details(entry(result['video_id']), data['search_phrase'], result['title'],
+                                result['channelTitle'], result['publishedAt'])
+            else:
+                video = entry(filename[:-len('.txt')])
+                video['filename'] = filename
+                video['comment_count'] = data['comment_count']
+        for video in videos.values():
+            video['search_phrases'].sort()
+        return videos
+
+    def search_phrases(self):
+        return sorted({phrase for video in self.videos.values() for phrase in video['search_phrases']})
+
+    # Comment files of the videos that match every filter given, in video ID order
+    # search_phrase can be one phrase or a list of them (videos returned for any); video_ids limits to those videos
+    # published_after and published_before are dates or timestamps ('2024-04-01' or '2024-04-01T12:00:00Z'), both
+    # inclusive; top_n keeps the videos with the most comments; sample then picks that many of them at random with seed
+    def select(self, search_phrase=None, published_after=None, published_before=None, top_n=None, sample=None, seed=0,
+               video_ids=None):
+        videos = [video for video in self.videos.values() if video['filename'] is not None]
+        if search_phrase is not None:
+            phrases = {search_phrase} if isinstance(search_phrase, str) else set(search_phrase)
+            videos = [video for video in videos if phrases.intersection(video['search_phrases'])]
+        if video_ids is not None:
+            video_ids = set(video_ids)
+            videos = [video for video in videos if video['video_id'] in video_ids]
+        if published_after is not None:
+            videos = [video for video in videos if video['published_at'] and video['published_at'] >= published_after]
+        if published_before is not None:
+            videos = [video for video in videos
+                      if video['published_at'] and video['published_at'][:len(published_before)] <= published_before]
+        videos.sort(key=lambda video: video['video_id'])
+        if top_n is not None:
+            videos = sorted(videos, key=lambda video: -(video['comment_count'] or 0))[:top_n]  # Stable, so ties keep ID order
+            videos.sort(key=lambda video: video['video_id'])
+        if sample is not None and sample < len(videos):
+            videos = sorted(random.Random(seed).sample(videos, sample), key=lambda video: video['video_id'])
+        return [video['filename'] for video in videos]
+
+    # Written to a temporary file first so a crash never leaves half an index behind
+    def save(self):
+        temporary_path = self.index_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': INDEX_VERSION, 'sources': self.sources}, file)
+        os.replace(temporary_path, self.index_path)
+
+# The comment files a gephi script reads: with no selection every comment file in the folder, otherwise the files
+# CorpusIndex.select(**selection) picks; either way in video ID order and at most num_videos of them
+def select_comment_files(directory_path, num_videos, selection=None):
+    if selection is None:
+        return comment_files(directory_path)[:num_videos]
+    index = CorpusIndex(directory_path)
+    index.save()
+    return index.select(**selection)[:num_videos]
+
+def print_summary(index):
+    videos = list(index.videos.values())
+    harvested = [video for video in videos if video['filename'] is not None]
+    dates = sorted(video['published_at'] for video in harvested if video['published_at'])
+    print(f"{len(harvested)} harvested videos, {len(videos) - len(harvested)} more in search results")
+    print(f"{sum(video['comment_count'] or 0 for video in harvested)} comments")
+    if dates:
+        print(f"Published {dates[0]} to {dates[-1]}")
+    for phrase in index.search_phrases():
+        phrase_videos = [video for video in harvested if phrase in video['search_phrases']]
+        print(f"Search phrase '{phrase}': {len(phrase_videos)} harvested videos, "
+              f"{sum(video['comment_count'] or 0 for video in phrase_videos)} comments")
+
+if __name__ == '__main__':
+    directory_path = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    corpus_index = CorpusIndex(directory_path)
+    corpus_index.save()
+    print_summary(corpus_index)
@@ -0,0 +1,300 @@
+# Offline stand-in for the YouTube Data API, for load-testing and checking the harvester without spending quota
+# FakeYouTubeService has the same search(), commentThreads(), comments() and videos() resources as the
+# googleapiclient service, and their list(...) requests return responses shaped like the real ones, page by page
+# It is passed to the harvester through YouTubeClientPool(service=...) (see benchmark_harvest.py)
+# The videos come from recorded comment files in a folder (with their <phrase>_search_results.txt files), or are
+# generated in memory with synthetic_corpus.py
+# Settings (FAKE_API_SETTINGS):
+#   latency and latency_jitter: seconds every call takes, plus a random extra up to latency_jitter
+#   search_page_size, thread_page_size, reply_page_size: the most items per page (maxResults is capped by these)
+#   embedded_replies: replies embedded in each commentThreads item (the real API embeds a few)
+#   search_result_cap: the most results one search returns across all its pages (about 500 for the real API)
+#   daily_quota: quota units served before every call fails with 403 quotaExceeded (None = unlimited)
+#   error_rate: the share of calls that fail with a 500 backendError, drawn from a seeded random generator
+#   comments_disabled: video IDs whose commentThreads calls fail with 403 commentsDisabled
+# Calls, quota units and errors are counted per endpoint (stats()); add_new_comments() simulates comments arriving
+# after a harvest, for testing refreshes
+
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlencode
+import httplib2
+from googleapiclient.errors import HttpError
+from comment_parser import parse_comment_file, video_id_from_path
+from corpus_index import comment_files, is_search_results_file, read_search_results
+from quota_budget import ENDPOINT_QUOTA_COSTS
+from synthetic_corpus import START_TIME, SyntheticCorpus, format_time, random_id
+
+FAKE_API_SETTINGS = {
+    'latency': 0.0,
+    'latency_jitter': 0.0,
+    'search_page_size': 50,
+    'thread_page_size': 100,
+    'reply_page_size': 100,
+    'embedded_replies': 5,
+    'search_result_cap': 500,
+    'daily_quota': None,
+    'error_rate': 0.0,
+    'comments_disabled': (),
+    'seed': 1,
+}
+
+ERROR_MESSAGES = {
+    'quotaExceeded': (403, "The request cannot be completed because you have exceeded your quota."),
+    'commentsDisabled': (403, "The video identified by the videoId parameter has disabled comments."),
+    'videoNotFound': (404, "The video identified by the videoId parameter could not be found."),
+    'commentNotFound': (404, "One or more of the comments identified by the parentId parameter could not be found."),
+    'backendError': (500, "Backend Error"),
+}
+
+# Raised by the list_* methods with the API's error reason; serve() turns it into an HttpError
+class FakeApiError(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+# An HttpError like the one googleapiclient raises, with the reason in its details
+def make_http_error(reason, endpoint, params):
+    status, message = ERROR_MESSAGES[reason]
+    content = json.dumps({'error': {'code': status, 'message': message,
+                                    'errors': [{'message': message, 'domain': 'youtube', 'reason': reason}]}})
+    uri = f"https://youtube.googleapis.com/youtube/v3/{endpoint.split('.')[0]}?{urlencode(params)}"
+    return HttpError(httplib2.Response({'status': status}), content.encode('utf-8'), uri=uri)
+
+# Recorded entries become (comment entry, [reply entries]) threads; replies whose comment is missing are dropped
+def group_threads(entries):
+    threads = {}
+    for entry in entries:
+        if entry.get('reply_to'):
+            if entry['reply_to'] in threads:
+                threads[entry['reply_to']][1].append(entry)
+        else:
+            threads[entry['comment_id']] = (entry, [])
+    return list(threads.values())
+
+def record_entry(record):
+    return {'type': 'reply' if record.reply_to else 'comment', 'author': record.author, 'comment': record.comment,
+            'like_count': record.likes or 0, 'published_at': record.published_at, 'comment_id': record.comment_id,
+            'reply_to': record.reply_to}
+
+def comment_resource(entry, video_id):
+    snippet = {'videoId': video_id, 'authorDisplayName': entry['author'], 'textDisplay': entry['comment'],
+               'textOriginal': entry['comment'], 'likeCount': entry['like_count'],
+               'publishedAt': entry['published_at'], 'updatedAt': entry['published_at']}
+    if entry.get('reply_to'):
+        snippet['parentId'] = entry['reply_to']
+    return {'kind': 'youtube#comment', 'id': entry['comment_id'], 'snippet': snippet}
+
+class FakeRequest:
+    def __init__(self, service, endpoint, params):
+        self.service = service
+        self.endpoint = endpoint
+        self.params = {key: value for key, value in params.items() if value is not None}
+
+    # http is accepted (and ignored) like googleapiclient's HttpRequest.execute
+    def execute(self, http=None, num_retries=0):
+        return self.service.serve(self.endpoint, self.params)
+
+class FakeResource:
+    def __init__(self, service, endpoint):
+        self.service = service
+        self.endpoint = endpoint
+
+    def list(self, **params):
+        return FakeRequest(self.service, self.endpoint, params)
+
+class FakeYouTubeService:
+    # videos: {video_id: {'video': search result dict, 'threads': [(comment entry, [reply entries]), ...]}}
+    # search_results: {search phrase: [video_id, ...]}; any other phrase returns every video
+    def __init__(self, videos, search_results=None, settings=FAKE_API_SETTINGS):
+        self.settings = dict(FAKE_API_SETTINGS, **settings)
+        self.video_data = videos
+        self.search_results = search_results or {}
+        self.reply_threads = {}  # Thread ID -> (video_id, replies)
+        for video_id, video in videos.items():
+            # commentThreads pages come newest thread first, like the API's default order=time
+            video['threads'].sort(key=lambda thread: thread[0]['published_at'], reverse=True)
+            for comment, replies in video['threads']:
+                self.reply_threads[comment['comment_id']] = (video_id, replies)
+        self.comments_disabled = set(self.settings['comments_disabled'])
+        self.rng = random.Random(self.settings['seed'])
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.quota_used = 0
+
+    # Serves the videos in a folder of recorded comment files
+    @classmethod
+    def from_directory(cls, directory_path, **settings):
+        videos = {}
+        for filename in comment_files(directory_path):
+            file_path = os.path.join(directory_path, filename)
+            video_id = video_id_from_path(file_path)
+            threads = group_threads([record_entry(record) for record in parse_comment_file(file_path)])
+            published_at = min((comment['published_at'] for comment, _ in threads), default=format_time(START_TIME))
+            videos[video_id] = {'video': {'video_id': video_id, 'title': f"Video {video_id}", 'channelTitle': "Unknown",
+                                          'publishedAt': published_at}, 'threads': threads}
+        search_results = {}
+        for filename in sorted(os.listdir(directory_path)):
+            if is_search_results_file(filename):
+                phrase, _, results = read_search_results(os.path.join(directory_path, filename))
+                for result in results:
+                    if result['video_id'] in videos:
+                        videos[result['video_id']]['video'] = result
+                video_ids = [result['video_id'] for result in results if result['video_id'] in videos]
+                if video_ids:  # A phrase can have several files (e.g. an older search); their videos are merged
+                    search_results[phrase] = list(dict.fromkeys(search_results.get(phrase, []) + video_ids))
+        return cls(videos, search_results, settings)
+
+    # Serves a corpus generated in memory with synthetic_corpus.py (same settings and seed, same comments)
+    # Each of search_phrases returns its own seeded sample of phrase_share of the videos, so phrases overlap
+    # like related real searches; without them the corpus's search phrase returns every video
+    @classmethod
+    def from_synthetic_corpus(cls, corpus_settings=None, search_phrases=None, phrase_share=0.6, **settings):
+        corpus = SyntheticCorpus(corpus_settings or {})
+        videos = {video['video_id']: {'video': video, 'threads': group_threads(comments)}
+                  for video, comments in corpus.iter_videos()}
+        if not search_phrases:
+            return cls(videos, {corpus.settings['search_phrase']: list(videos)}, settings)
+        rng = random.Random(corpus.settings['seed'])
+        sample_size = max(1, int(round(len(videos) * phrase_share)))
+        return cls(videos, {phrase: rng.sample(list(videos), min(sample_size, len(videos))) for phrase in search_phrases},
+                   settings)
+
+    # Videos a search for the phrase returns, before the search_result_cap
+    def search_video_ids(self, phrase):
+        return self.search_results.get(phrase, list(self.video_data))
+
+    # Adds comments as if time had passed: about share new threads per video, newer than every thread before them,
+    # and one new reply on about share of the existing threads; returns the new entries
+    def add_new_comments(self, share=0.1, seed=None):
+        # Not the corpus's own seed, which would draw the same comment IDs again
+        rng = random.Random(f"new comments {self.settings['seed'] if seed is None else seed}")
+        added = []
+        with self.lock:
+            for video_id, video in self.video_data.items():
+                threads = video['threads']
+                if not threads:
+                    continue
+                count = max(1, int(round(len(threads) * share)))
+                for comment, replies in rng.sample(threads, min(count, len(threads))):
+                    replies.append(dict(rng.choice(threads)[0], type='reply', reply_to=comment['comment_id'],
+                                        comment_id=f"{comment['comment_id']}.{random_id(rng, 22)}"))
+                    added.append(replies[-1])
+                for _ in range(count):
+                    comment = dict(rng.choice(threads)[0], comment_id='Ug' + random_id(rng, 24),
+                                   published_at=format_time(datetime.now()))
+                    threads.insert(0, (comment, []))  # Newest first
+                    self.reply_threads[comment['comment_id']] = (video_id, threads[0][1])
+                    added.append(comment)
+        return added
+
+    def comment_count(self, video_id):
+        return sum(1 + len(replies) for _, replies in self.video_data[video_id]['threads'])
+
+    def stats(self):
+        with self.lock:
+            return {'calls': dict(self.calls), 'errors': dict(self.errors), 'quota_used': self.quota_used}
+
+    # Starts a new quota day
+    def reset_quota(self):
+        with self.lock:
+            self.quota_used = 0
+
+    def search(self):
+        return FakeResource(self, 'search.list')
+
+    def commentThreads(self):
+        return FakeResource(self, 'commentThreads.list')
+
+    def comments(self):
+        return FakeResource(self, 'comments.list')
+
+    def videos(self):
+        return FakeResource(self, 'videos.list')
+
+    # Charges the call, waits out its latency and returns its page, or raises the injected error
+    def serve(self, endpoint, params):
+        with self.lock:
+            self.calls[endpoint] += 1
+            daily_quota = self.settings['daily_quota']
+            cost = ENDPOINT_QUOTA_COSTS[endpoint]
+            if daily_quota is not None and self.quota_used + cost > daily_quota:
+                reason = 'quotaExceeded'
+            else:
+                self.quota_used += cost
+                reason = 'backendError' if self.rng.random() < self.settings['error_rate'] else None
+            delay = self.settings['latency'] + self.rng.random() * self.settings['latency_jitter']
+        if delay:
+            time.sleep(delay)  # Outside the lock, so concurrent calls overlap like real requests
+        if reason is None:
+            try:
+                return getattr(self, 'list_' + endpoint.split('.')[0])(params)
+            except FakeApiError as error:
+                reason = error.reason
+        with self.lock:
+            self.errors[reason] += 1
+        raise make_http_error(reason, endpoint, params)
+
+    # Page of items starting at pageToken, capped by maxResults and the page size setting
+    def page(self, items, params, page_size_setting):
+        start = int(params['pageToken']) if params.get('pageToken') else 0
+        page_size = min(int(params.get('maxResults', 5)), self.settings[page_size_setting])
+        response = {'items': items[start:start + page_size],
+                    'pageInfo': {'totalResults': len(items), 'resultsPerPage': page_size}}
+        if start + page_size < len(items):
+            response['nextPageToken'] = str(start + page_size)
+        return response
+
+    def list_search(self, params):
+        videos = [self.video_data[video_id]['video'] for video_id in self.search_video_ids(params.get('q'))]
+        if params.get('publishedAfter'):
+            videos = [video for video in videos if video['publishedAt'] >= params['publishedAfter']]
+        if params.get('publishedBefore'):
+            videos = [video for video in videos if video['publishedAt'] < params['publishedBefore']]
+        if params.get('order') == 'date':
+            videos.sort(key=lambda video: video['publishedAt'], reverse=True)
+        items = [{'kind': 'youtube#searchResult', 'id': {'kind': 'youtube#video', 'videoId': video['video_id']},
+                  'snippet': {'title': video['title'], 'channelTitle': video['channelTitle'],
+                              'publishedAt': video['publishedAt']}}
+                 for video in videos[:self.settings['search_result_cap']]]
+        response = self.page(items, params, 'search_page_size')
+        response['pageInfo']['totalResults'] = len(videos)  # Like the API, more than can be paged through
+        return response
+
+    def list_commentThreads(self, params):
+        video_id = params['videoId']
+        if video_id not in self.video_data:
+            raise FakeApiError('videoNotFound')
+        if video_id in self.comments_disabled:
+            raise FakeApiError('commentsDisabled')
+        embed = 'replies' in params.get('part', '')
+        items = []
+        for comment, replies in self.video_data[video_id]['threads']:
+            item = {'kind': 'youtube#commentThread', 'id': comment['comment_id'],
+                    'snippet': {'videoId': video_id, 'topLevelComment': comment_resource(comment, video_id),
+                                'totalReplyCount': len(replies), 'canReply': True}}
+            if embed and replies:
+                item['replies'] = {'comments': [comment_resource(reply, video_id)
+                                                for reply in replies[:self.settings['embedded_replies']]]}
+            items.append(item)
+        return self.page(items, params, 'thread_page_size')
+
+    def list_comments(self, params):
+        if params.get('parentId') not in self.reply_threads:
+            raise FakeApiError('commentNotFound')
+        video_id, replies = self.reply_threads[params['parentId']]
+        return self.page([comment_resource(reply, video_id) for reply in replies], params, 'reply_page_size')
+
+    def list_videos(self, params):
+        items = []
+        for video_id in params.get('id', '').split(','):
+            if video_id in self.video_data:
+                statistics = {} if video_id in self.comments_disabled else {'commentCount': str(self.comment_count(video_id))}
+                items.append({'kind': 'youtube#video', 'id': video_id, 'statistics': statistics})
+        return {'items': items, 'pageInfo': {'totalResults': len(items), 'resultsPerPage': len(items)}}
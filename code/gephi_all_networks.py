@@ -0,0 +1,143 @@
+# Builds the video-commenter, co-commenter and commenter-comment graphs together, reading each comment file once
+# Running gephi_videocommenter_network.py, gephi_cocommenter_network.py and gephi_commentercomment_network.py one
+# after the other lists the folder and parses every <video_id>.txt three times; here each file is parsed once into
+# how many times each (author, comment) pair appears in it, and that one stream of (video_id, pair counts) is fed
+# to an aggregator for each graph
+# Each aggregator keeps only what its graph needs and writes the same CSVs as its script (it calls the script's own
+# writer), so the files can be imported into Gephi as described in that script's README
+# Another graph can be added with a class that has add_video(video_id, pair_counts) and write(directory_path)
+# (pair_counts is a Counter of (author, comment) pairs, in the order they first appear in the file)
+
+# You can edit the following:
+# Line 125: Number of videos to process
+# Lines 126-128: Which graphs to build
+# Lines 129-133: Co-commenter edge pruning and the bot-like, spam and near-duplicate thresholds
+# Line 134: workers = number of processes to parse the files in (see parallel_parse.py)
+# Line 135: selection = which videos to build the graphs from (see corpus_index.py)
+# Or call process_store(store_path, output_directory, graphs, search_phrase) to build the graphs from a comment_store.py database
+
+import os
+from collections import Counter
+from cocommenter_matrix import IncidenceBuilder  # Needs numpy and scipy
+from comment_parser import load_comment_author_texts, video_id_from_path
+from comment_store import CommentStore
+from corpus_index import select_comment_files
+from parallel_parse import map_shards
+import gephi_cocommenter_network
+import gephi_commentercomment_network
+import gephi_videocommenter_network
+
+# How many times each (author, comment) pair appears in one file; replies are included with their full text
+def parse_pair_counts(file_path):
+    return Counter(load_comment_author_texts(file_path))
+
+# Commenter and video nodes, an edge from each commenter to every video they commented on
+class VideoCommenterGraph:
+    def __init__(self):
+        self.all_videos = set()
+        self.all_commenters = set()
+        self.edges = set()
+
+    def add_video(self, video_id, pair_counts):
+        self.all_videos.add(video_id)
+        for author, _ in pair_counts:
+            self.all_commenters.add(author)
+            self.edges.add((author, video_id))
+
+    def write(self, directory_path):
+        gephi_videocommenter_network.write_csv_files(directory_path, self.all_videos, self.all_commenters, self.edges)
+
+# Commenter nodes, one edge per pair of commenters weighted by the number of videos both commented on
+class CoCommenterGraph:
+    def __init__(self, min_weight=1, top_k=None):
+        self.min_weight = min_weight
+        self.top_k = top_k
+        self.incidence = IncidenceBuilder()
+
+    def add_video(self, video_id, pair_counts):
+        self.incidence.add_video(video_id, [author for author, _ in pair_counts])
+
+    def write(self, directory_path):
+        gephi_cocommenter_network.write_graph(directory_path, *self.incidence.incidence(), self.min_weight, self.top_k)
+
+# Commenter and comment nodes for bot-like and spam comments, an edge from each commenter to their comment
+class CommenterCommentGraph:
+    def __init__(self, bot_like_threshold=gephi_commentercomment_network.BOT_LIKE_THRESHOLD,
+                 spam_threshold=gephi_commentercomment_network.SPAM_THRESHOLD, near_duplicate_threshold=None):
+        self.bot_like_threshold = bot_like_threshold
+        self.spam_threshold = spam_threshold
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.comment_counts = gephi_commentercomment_network.CommentCounts()
+
+    def add_video(self, video_id, pair_counts):
+        for (author, comment), count in pair_counts.items():
+            self.comment_counts.add(author, comment, count)
+
+    def write(self, directory_path):
+        gephi_commentercomment_network.detect_and_write(directory_path, self.comment_counts, self.bot_like_threshold,
+                                                        self.spam_threshold, self.near_duplicate_threshold)
+
+# Feeds every (video_id, pair counts) of video_pairs to each graph, then writes each graph's CSVs
+def build_graphs(video_pairs, directory_path, graphs):
+    for video_id, pair_counts in video_pairs:
+        for graph in graphs:
+            graph.add_video(video_id, pair_counts)
+    for graph in graphs:
+        graph.write(directory_path)
+
+# workers > 1 parses the files in that many processes (None = one per CPU core); the graphs are the same
+# selection picks the videos by search phrase, publish date, comment count or a seeded sample (see corpus_index.py)
+def process_files(directory_path, num_videos, graphs, workers=1, selection=None):
+    print(f"Processing {num_videos} videos for {len(graphs)} graphs...")
+    txt_files = select_comment_files(directory_path, num_videos, selection)  # Limit to the number of videos specified
+    total_files = len(txt_files)
+
+    def video_pairs():
+        files_processed = 0
+        for filename in txt_files:
+            files_processed += 1
+            print(f"Processing file {files_processed}/{total_files}: {filename}")
+            file_path = os.path.join(directory_path, filename)
+            yield video_id_from_path(file_path), parse_pair_counts(file_path)
+
+    if workers == 1:
+        build_graphs(video_pairs(), directory_path, graphs)
+    else:
+        shards = map_shards(parse_shard, directory_path, txt_files, workers)
+        build_graphs((video for shard in shards for video in shard), directory_path, graphs)
+
+# Worker side of process_files(..., workers): (video_id, pair counts) for each file of a shard
+def parse_shard(directory_path, filenames):
+    return [(video_id_from_path(filename), parse_pair_counts(os.path.join(directory_path, filename)))
+            for filename in filenames]
+
+# Same graphs from a comment_store.py database, optionally only the videos returned for one search phrase
+def process_store(store_path, output_directory, graphs, search_phrase=None):
+    store = CommentStore(store_path)
+    video_pairs = ((video_id, Counter((record.author, record.comment) for record in records))
+                   for video_id, records in store.iter_video_comments(search_phrase))
+    build_graphs(video_pairs, output_directory, graphs)
+    store.close()
+
+# Example usage
+if __name__ == '__main__':
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    num_videos = 1000
+    videocommenter = True  # Build videocommenter_nodes.csv and videocommenter_edges.csv
+    cocommenter = True  # Build cocommenter_nodes.csv and cocommenter_edges.csv
+    commentercomment = True  # Build commentercomment_nodes.csv and commentercomment_edges.csv
+    min_weight = 1  # Minimum number of shared videos for a co-commenter edge
+    top_k = None  # Keep only each commenter's top_k heaviest co-commenter edges (None = keep all)
+    bot_like_threshold = gephi_commentercomment_network.BOT_LIKE_THRESHOLD
+    spam_threshold = gephi_commentercomment_network.SPAM_THRESHOLD
+    near_duplicate_threshold = None  # e.g. gephi_commentercomment_network.NEAR_DUPLICATE_THRESHOLD (None = exact text only)
+    workers = 1  # Processes to parse the files in (None = one per CPU core)
+    selection = None  # e.g. {'search_phrase': 'Russia Ukraine', 'top_n': 50} (None = every comment file)
+    graphs = []
+    if videocommenter:
+        graphs.append(VideoCommenterGraph())
+    if cocommenter:
+        graphs.append(CoCommenterGraph(min_weight, top_k))
+    if commentercomment:
+        graphs.append(CommenterCommentGraph(bot_like_threshold, spam_threshold, near_duplicate_threshold))
+    process_files(directory_path, num_videos, graphs, workers, selection)
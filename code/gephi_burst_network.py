@@ -0,0 +1,121 @@
+# This script is to build a graph of coordinated posting times: commenters and videos are nodes
+# Edges connect a commenter to a video they posted on during a burst (many comments within a short window), and
+# connect two commenters who repeatedly posted within the same short time bucket on the same videos
+# Every edge has an Interval column with the times it was active, for Gephi's timeline (dynamic graph playback)
+# Commenters who posted many comments within a short window across all videos get the Behavior 'Rapid posting'
+# Produces 2 csv files 'burst_nodes.csv' and 'burst_edges.csv' to import into Gephi
+# csv files will save to the same location as the code
+
+# You can edit the following:
+# Lines 115-119: Number of videos to process and the burst and synchronization windows
+# Line 120: selection = which videos to build the graph from (see corpus_index.py)
+# Or call process_store(store_path, output_directory, search_phrase) to build the graph from a comment_store.py database
+
+import os
+import csv
+from comment_parser import load_comments, video_id_from_path
+from comment_store import CommentStore
+from corpus_index import select_comment_files
+from temporal_bursts import (CommentTimes, author_bursts, format_intervals, merge_intervals, synchronized_pairs,
+                             video_bursts)  # Needs numpy and scipy
+
+BURST_SETTINGS = {
+    'burst_seconds': 60,  # A video burst is at least burst_comments comments within burst_seconds
+    'burst_comments': 20,
+    'rapid_seconds': 300,  # Rapid posting is at least rapid_comments comments by one commenter within rapid_seconds
+    'rapid_comments': 10,
+    'sync_seconds': 60,  # Two commenters are in sync when they post in the same sync_seconds bucket of a video,
+    'sync_windows': 3,  # at least sync_windows times
+}
+
+def parse_comments(file_path):
+    video_id = video_id_from_path(file_path)
+    return [(video_id, record.author, record.published_at) for record in load_comments(file_path)]
+
+# selection picks the videos by search phrase, publish date, comment count or a seeded sample (see corpus_index.py)
+def process_files(directory_path, num_videos, settings=BURST_SETTINGS, selection=None):
+    print(f"Processing {num_videos} videos...")
+    txt_files = select_comment_files(directory_path, num_videos, selection)  # Limit to the number of videos specified
+    total_files = len(txt_files)
+
+    def comments():
+        files_processed = 0
+        for filename in txt_files:
+            files_processed += 1
+            print(f"Processing file {files_processed}/{total_files}: {filename}")
+            yield from parse_comments(os.path.join(directory_path, filename))
+
+    build_graph(comments(), directory_path, settings)
+
+# Same graph from a comment_store.py database, optionally only the videos returned for one search phrase
+def process_store(store_path, output_directory, search_phrase=None, settings=BURST_SETTINGS):
+    store = CommentStore(store_path)
+    comments = ((video_id, record.author, record.published_at)
+                for video_id, records in store.iter_video_comments(search_phrase) for record in records)
+    build_graph(comments, output_directory, settings)
+    store.close()
+
+# comments yields (video_id, author, published_at) for every comment and reply
+def build_graph(comments, directory_path, settings=BURST_SETTINGS):
+    times = CommentTimes(comments)
+    print(f"Checking {len(times)} comments for bursts and synchronized posting...")
+
+    burst_edges = {}  # (commenter, video_id) -> [comments, intervals]
+    burst_count = 0
+    for video_id, start, end, author_counts in video_bursts(times, settings['burst_seconds'], settings['burst_comments']):
+        burst_count += 1
+        print(f"Burst detected on video {video_id}: {sum(author_counts.values())} comments by {len(author_counts)} commenters.")
+        for author, count in author_counts.items():
+            edge = burst_edges.setdefault((author, video_id), [0, []])
+            edge[0] += count
+            edge[1].append((start, end))
+
+    rapid_posters = {}
+    for author, start, end, count in author_bursts(times, settings['rapid_seconds'], settings['rapid_comments']):
+        print(f"Rapid posting detected: {count} comments by {author}.")
+        rapid_posters.setdefault(author, []).append((start, end))
+
+    sync_edges = list(synchronized_pairs(times, settings['sync_seconds'], settings['sync_windows']))
+
+    print("Detected behaviors:")
+    print(f"Total bursts detected: {burst_count}")
+    print(f"Total rapid posters detected: {len(rapid_posters)}")
+    print(f"Total synchronized commenter pairs detected: {len(sync_edges)}")
+
+    node_csv_path = os.path.join(directory_path, 'burst_nodes.csv')
+    edge_csv_path = os.path.join(directory_path, 'burst_edges.csv')
+
+    commenters = {author for author, _ in burst_edges}
+    commenters.update(author for pair in sync_edges for author in pair[:2])
+    commenters.update(rapid_posters)
+    videos = {video_id for _, video_id in burst_edges}
+
+    with open(node_csv_path, 'w', newline='', encoding='utf-8') as node_file:
+        writer = csv.writer(node_file)
+        writer.writerow(['Id', 'Label', 'Type', 'Behavior', 'Interval'])
+        for video_id in sorted(videos):
+            writer.writerow([video_id, video_id, 'Video', '', ''])
+        for commenter in sorted(commenters):
+            if commenter in rapid_posters:
+                writer.writerow([commenter, commenter, 'Commenter', 'Rapid posting', format_intervals(rapid_posters[commenter])])
+            else:
+                writer.writerow([commenter, commenter, 'Commenter', '', ''])
+
+    with open(edge_csv_path, 'w', newline='', encoding='utf-8') as edge_file:
+        writer = csv.writer(edge_file)
+        writer.writerow(['Source', 'Target', 'Weight', 'Relation', 'Interval'])
+        for (author, video_id), (count, intervals) in sorted(burst_edges.items()):
+            writer.writerow([author, video_id, count, 'Burst', format_intervals(merge_intervals(intervals))])
+        for author, other, weight, intervals in sync_edges:
+            writer.writerow([author, other, weight, 'Synchronized', format_intervals(intervals)])
+
+# Example usage
+if __name__ == '__main__':
+    directory_path = os.path.dirname(os.path.abspath(__file__))
+    num_videos = 1000
+    settings = dict(BURST_SETTINGS)
+    settings['burst_comments'] = 20  # Comments within settings['burst_seconds'] that make a burst
+    settings['sync_seconds'] = 60  # Width of the synchronization buckets in seconds
+    settings['sync_windows'] = 3  # Shared buckets two commenters need to be linked
+    selection = None  # e.g. {'search_phrase': 'Russia Ukraine', 'top_n': 50} (None = every comment file)
+    process_files(directory_path, num_videos, settings, selection)
@@ -3,58 +3,118 @@
 # This script is to build a graph with all nodes being unique commenters; edges connect a commenter to another commenter that commented on the same video(s)
 # Refer to Figure 5 in the "Analyzing Disinformation and Crowd Manipulation Tactics on YouTube" Article
 # Produces 2 csv files 'cocommenter_nodes.csv' and 'cocommenter_edges.csv' to import into Gephi
+# Each pair of commenters is one edge, weighted by the number of videos both commented on
 # csv files will save to the same location as the code
 
 # You can edit the following:
-# Line 75: Number of videos to process
+# Line 132: Number of videos to process
+# Lines 133-134: Minimum edge weight and top_k pruning
+# Or call process_store(store_path, output_directory, search_phrase) to build the graph from a comment_store.py database
+# Line 135: incremental = True to only parse files added or changed since the last run (see graph_state.py)
+# Line 136: workers = number of processes to parse the files in (see parallel_parse.py)
+# Line 137: selection = which videos to build the graph from (see corpus_index.py)
 
 import os
 import csv
-from itertools import combinations
+from collections import Counter
+import numpy as np
+from comment_parser import load_comment_authors, video_id_from_path
+from comment_store import CommentStore
+from corpus_index import select_comment_files
+from cocommenter_matrix import build_incidence, update_product, write_cocommenter_edges  # Needs numpy and scipy
+from graph_state import GraphState
+from parallel_parse import map_shards
 
+# Only the author of each comment is kept; the video is known from the file
 def parse_comments(file_path):
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        comment_data = {}
-        for line in file:
-            line = line.strip()
-            if line.startswith('Author:') and '@' in line:
-                if 'author' in comment_data:
-                    data.append(comment_data)
-                comment_data = {'author': line.split('@')[1].strip(), 'video_id': os.path.basename(file_path).replace('.txt', '')}
-            elif line.startswith('Comment:') or line.startswith('Likes:') or line.startswith('Published At:') or line.startswith('Comment ID:'):
-                key = line.split(':')[0].strip().lower()
-                comment_data[key] = line[len(key)+1:].strip()
-    if 'author' in comment_data:
-        data.append(comment_data)
-    return data
-
-def process_files(directory_path, num_videos):
-    all_commenters = set()
-    edge_data = []
+    return load_comment_authors(file_path)
 
+# workers > 1 parses the files in that many processes (None = one per CPU core); the graph is the same
+# selection picks the videos by search phrase, publish date, comment count or a seeded sample (see corpus_index.py)
+def process_files(directory_path, num_videos, min_weight=1, top_k=None, workers=1, selection=None):
+    txt_files = select_comment_files(directory_path, num_videos, selection)  # Limit to the number of videos specified
+    total_files = len(txt_files)
+
+    def video_commenters():
+        files_processed = 0
+        for filename in txt_files:
+            file_path = os.path.join(directory_path, filename)
+            files_processed += 1
+            commenters = parse_comments(file_path)
+            print(f"Processing file {files_processed}/{total_files}: {filename}")
+            yield video_id_from_path(file_path), commenters
+
+    if workers == 1:
+        build_graph(video_commenters(), directory_path, min_weight, top_k)
+    else:
+        shards = map_shards(parse_shard, directory_path, txt_files, workers)
+        build_graph((video for shard in shards for video in shard), directory_path, min_weight, top_k)
+
+# Worker side of process_files(..., workers): (video_id, [commenter, ...]) for each file of a shard, each commenter once
+def parse_shard(directory_path, filenames):
+    video_commenters = []
+    for filename in filenames:
+        file_path = os.path.join(directory_path, filename)
+        video_commenters.append((video_id_from_path(file_path), list(dict.fromkeys(parse_comments(file_path)))))
+    return video_commenters
+
+# Same graph from a comment_store.py database, optionally only the videos returned for one search phrase
+def process_store(store_path, output_directory, search_phrase=None, min_weight=1, top_k=None):
+    store = CommentStore(store_path)
+    video_commenters = ((video_id, [record.author for record in records])
+                        for video_id, records in store.iter_video_comments(search_phrase))
+    build_graph(video_commenters, output_directory, min_weight, top_k)
+    store.close()
+
+# video_commenters yields (video_id, [commenter, ...]) for each video
+# Each pair of commenters gets one edge weighted by the number of videos they both commented on;
+# edges lighter than min_weight are dropped, and with top_k set each commenter keeps only its top_k heaviest edges
+def build_graph(video_commenters, directory_path, min_weight=1, top_k=None):
+    write_graph(directory_path, *build_incidence(video_commenters), min_weight, top_k)
+
+# Writes the graph of a commenter x video matrix from build_incidence or IncidenceBuilder.incidence
+def write_graph(directory_path, incidence, all_commenters, video_ids, min_weight=1, top_k=None):
+    print(f"Building co-commenter edges for {len(all_commenters)} commenters on {len(video_ids)} videos...")
+    write_csv_files(directory_path, all_commenters, incidence, None, min_weight, top_k)
+
+# Same graph as process_files, but keeps the edge weights in cocommenter_state.pickle and only parses the files
+# that are new or changed since the last run; the CSVs are rewritten in full and match a full rebuild
+def process_files_incremental(directory_path, num_videos, min_weight=1, top_k=None, selection=None):
+    txt_files = select_comment_files(directory_path, num_videos, selection)  # Limit to the number of videos specified
+    state = GraphState(os.path.join(directory_path, 'cocommenter_state.pickle'), 'cocommenter')
+    author_ids = state.totals.setdefault('author_ids', {})  # Commenter -> row and column of the edge weight matrix
+    commenter_videos = state.totals.setdefault('commenter_videos', Counter())
+    changed, removed = state.file_changes(directory_path, txt_files)
+    print(f"Processing {len(changed)} new or changed videos, removing {len(removed)}, {len(txt_files) - len(changed)} unchanged...")
+
+    removed_commenters = [commenters for commenters in map(state.forget, removed + changed) if commenters is not None]
+    added_commenters = []
+    for filename in changed:
+        print(f"Processing file: {filename}")
+        commenters = sorted({commenter for commenter in parse_comments(os.path.join(directory_path, filename)) if commenter})
+        state.remember(directory_path, filename, commenters)
+        added_commenters.append(commenters)
+    for commenters in removed_commenters:
+        commenter_videos.subtract(commenters)
+    for commenters in added_commenters:
+        commenter_videos.update(commenters)
+    for commenter in [commenter for commenter, count in commenter_videos.items() if count <= 0]:
+        del commenter_videos[commenter]
+    state.totals['product'] = update_product(state.totals.get('product'), author_ids, added_commenters, removed_commenters)
+    state.save()
+
+    # Commenters no longer in any video keep their row (all zeros); the CSVs list the rest in name order
+    all_commenters = sorted(commenter_videos)
+    order = np.array([author_ids[commenter] for commenter in all_commenters], dtype=np.int64)
+    product = state.totals['product'][order][:, order]
+    print(f"Building co-commenter edges for {len(all_commenters)} commenters on {len(state.contributions)} videos...")
+    write_csv_files(directory_path, all_commenters, None, product, min_weight, top_k)
+
+# The edges come from the incidence matrix, or from its product with itself when that is already known
+def write_csv_files(directory_path, all_commenters, incidence, product, min_weight=1, top_k=None):
     node_csv_path = os.path.join(directory_path, 'cocommenter_nodes.csv')
     edge_csv_path = os.path.join(directory_path, 'cocommenter_edges.csv')
-    
-    files_processed = 0
-    for filename in os.listdir(directory_path):
-        if filename.endswith(".txt"):
-            file_path = os.path.join(directory_path, filename)
-            if files_processed < num_videos:
-                files_processed += 1
-                comments_data = parse_comments(file_path)
-                for comment in comments_data:
-                    author = comment.get('author')
-                    if author:
-                        all_commenters.add(author)
-                commenter_list = [comment.get('author') for comment in comments_data if 'author' in comment]
-                video_id = comments_data[0].get('video_id') if comments_data else None
-                for pair in combinations(set(commenter_list), 2):
-                    edge_data.append((*pair, video_id))
-                print(f"Processing file {files_processed}/{num_videos}: {filename}")
-            else:
-                break
-    
+
     # Write node CSV file
     with open(node_csv_path, 'w', newline='', encoding='utf-8') as node_file:
         writer = csv.writer(node_file)
@@ -62,15 +122,20 @@ def process_files(directory_path, num_videos):
         for commenter in all_commenters:
             writer.writerow([commenter, commenter])
     
-    # Write edge CSV file
-    with open(edge_csv_path, 'w', newline='', encoding='utf-8') as edge_file:
-        writer = csv.writer(edge_file)
-        writer.writerow(['Source', 'Target', 'VideoID'])
-        for edge in edge_data:
-            writer.writerow(edge)
+    # Write edge CSV file, a block of commenters at a time
+    edge_count = write_cocommenter_edges(edge_csv_path, incidence, all_commenters, min_weight, top_k, product=product)
+    print(f"Wrote {edge_count} edges to {edge_csv_path}")
 
 # Get the directory where the script is located
 if __name__ == '__main__':
     directory_path = os.path.dirname(os.path.abspath(__file__))
     num_videos = 5
-    process_files(directory_path, num_videos)
+    min_weight = 1  # Minimum number of shared videos for an edge
+    top_k = None  # Keep only each commenter's top_k heaviest edges (None = keep all)
+    incremental = False  # True = only parse files added or changed since the last run
+    workers = 1  # Processes to parse the files in (None = one per CPU core)
+    selection = None  # e.g. {'search_phrase': 'Russia Ukraine', 'top_n': 50} (None = every comment file)
+    if incremental:
+        process_files_incremental(directory_path, num_videos, min_weight, top_k, selection)
+    else:
+        process_files(directory_path, num_videos, min_weight, top_k, workers, selection)
@@ -2,125 +2,316 @@
 
 # This script is to build a graph with 2 types of nodes: comments and commenters; edges connect a commenter to their comment
 # Will detect bot-like and spam behaviors and print the results in the terminal
+# Bot-like: the same comment posted by more than BOT_LIKE_THRESHOLD commenters
+# Spam: the same comment posted more than SPAM_THRESHOLD times by one commenter
+# With near_duplicate_threshold set, comments that are near-duplicates of each other (see near_duplicates.py) count as
+# one comment, shown as the variant most commenters posted with the similarity of the group in its Behavior label
 # Refer to Figure 6 and 7 in the "Analyzing Disinformation and Crowd Manipulation Tactics on YouTube" Article
 # Produces 2 csv files 'commentercomment_nodes.csv' and 'commentercomment_edges.csv' to import into Gephi
 # csv files will save to the same location as the code
 
 # You can edit the following:
-# Line 125: Number of videos to process
+# Line 305: Number of videos to process
+# Lines 306-308: Bot-like, spam and near-duplicate thresholds
+# Line 309: incremental = True to only parse files added or changed since the last run (see graph_state.py)
+# Line 310: workers = number of processes to parse the files in (see parallel_parse.py)
+# Line 311: selection = which videos to build the graph from (see corpus_index.py)
+# Or call process_store(store_path, output_directory, search_phrase) to build the graph from a comment_store.py database
 
 import os
 import csv
-from collections import defaultdict
+from collections import Counter, defaultdict
+import numpy as np
+from comment_parser import load_comment_author_texts
+from comment_store import CommentStore
+from corpus_index import select_comment_files
+from graph_state import GraphState
+from near_duplicates import near_duplicate_clusters  # Needs numpy
+from parallel_parse import map_shards
+from string_table import PairCounts, StringTable, TextTable
 
+BOT_LIKE_THRESHOLD = 5  # A comment is bot-like when more than this many commenters posted it
+SPAM_THRESHOLD = 5  # A comment is spam when one commenter posted it more than this many times
+NEAR_DUPLICATE_THRESHOLD = 0.8  # Suggested similarity for grouping near-duplicate comments (0 to 1)
+
+# Replies are included alongside top-level comments, with their full (possibly multi-line) text
 def parse_comments(file_path):
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        author = None  # Initialize author variable
-        for line in file:
-            line = line.strip()
-            if line.startswith('Author:') and '@' in line:
-                author = line.split('@')[1].strip()
-            elif line.startswith('Comment:') and author:
-                comment = line[len('Comment:'):].strip()
-                data.append((author, comment))
-    return data
-
-def process_files(directory_path, num_videos):
+    return load_comment_author_texts(file_path)
+
+# workers > 1 parses the files in that many processes (None = one per CPU core); the graph is the same
+# selection picks the videos by search phrase, publish date, comment count or a seeded sample (see corpus_index.py)
+def process_files(directory_path, num_videos, bot_like_threshold=BOT_LIKE_THRESHOLD, spam_threshold=SPAM_THRESHOLD,
+                  near_duplicate_threshold=None, workers=1, selection=None):
     print(f"Processing {num_videos} videos...")
-    author_comments = defaultdict(list)
-    comment_authors = defaultdict(set)
-
-    files_processed = 0
-    total_bot_like = 0
-    total_spam = 0
-    txt_files = [f for f in os.listdir(directory_path) if f.endswith('.txt')]
-    txt_files = txt_files[:num_videos]  # Limit to the number of videos specified
+    txt_files = select_comment_files(directory_path, num_videos, selection)  # Limit to the number of videos specified
     total_files = len(txt_files)
 
-    for filename in txt_files:
-        files_processed += 1
-        print(f"Processing file {files_processed}/{total_files}: {filename}")
-        file_path = os.path.join(directory_path, filename)
-        comments_data = parse_comments(file_path)
-        
+    def video_comments():
+        files_processed = 0
+        for filename in txt_files:
+            files_processed += 1
+            print(f"Processing file {files_processed}/{total_files}: {filename}")
+            yield parse_comments(os.path.join(directory_path, filename))
+
+    if workers == 1:
+        build_graph(video_comments(), directory_path, bot_like_threshold, spam_threshold, near_duplicate_threshold)
+    else:
+        pair_counts = map_shards(parse_shard, directory_path, txt_files, workers)
+        build_graph_from_counts(pair_counts, directory_path, bot_like_threshold, spam_threshold, near_duplicate_threshold)
+
+# Worker side of process_files(..., workers): how many times each (author, comment) pair appears in a shard of files
+# A Counter keeps the pairs in the order they first appear, so merging the shards in order gives the same graph
+def parse_shard(directory_path, filenames):
+    pair_counts = Counter()
+    for filename in filenames:
+        pair_counts.update(parse_comments(os.path.join(directory_path, filename)))
+    return pair_counts
+
+# Same graph from a comment_store.py database, optionally only the videos returned for one search phrase
+def process_store(store_path, output_directory, search_phrase=None,
+                  bot_like_threshold=BOT_LIKE_THRESHOLD, spam_threshold=SPAM_THRESHOLD, near_duplicate_threshold=None):
+    store = CommentStore(store_path)
+    video_comments = ([(record.author, record.comment) for record in records]
+                      for _, records in store.iter_video_comments(search_phrase))
+    build_graph(video_comments, output_directory, bot_like_threshold, spam_threshold, near_duplicate_threshold)
+    store.close()
+
+# Every (author, comment) pair with how many times it was posted; commenters and comment texts are interned and the
+# pairs counted in integer arrays (see string_table.py), so each text is kept once however often it was posted, and
+# only becomes a Python string again when it is printed or written as a CSV label
+class CommentCounts:
+    def __init__(self):
+        self.authors = StringTable()
+        self.comments = TextTable()
+        self.pairs = PairCounts()
+
+    def add(self, author, comment, count=1):
+        self.pairs.add(self.authors.intern(author), self.comments.intern(comment), count)
+
+    # (authors, comments, counts) arrays of the distinct pairs grouped by commenter: commenters in the order they were
+    # first seen, each one's comments in the order they first posted them
+    def grouped_pairs(self):
+        authors, comments, counts = self.pairs.pairs()
+        order = np.argsort(authors, kind='stable')
+        return authors[order], comments[order], counts[order]
+
+    # The names of the commenters who posted each of comment_ids, as a set built in the order they first posted it
+    def author_sets(self, comment_ids):
+        authors, comments, _ = self.pairs.pairs()
+        author_sets = {comment_id: set() for comment_id in comment_ids}
+        wanted = np.isin(comments, np.fromiter(author_sets, dtype=np.int64, count=len(author_sets)))
+        for author, comment in zip(authors[wanted].tolist(), comments[wanted].tolist()):
+            author_sets[comment].add(self.authors[author])
+        return author_sets
+
+# video_comments yields one list of (author, comment) pairs per video
+# Every count is taken in one pass: how many times each commenter posted each comment
+def build_graph(video_comments, directory_path, bot_like_threshold=BOT_LIKE_THRESHOLD, spam_threshold=SPAM_THRESHOLD,
+                near_duplicate_threshold=None):
+    comment_counts = CommentCounts()
+    for comments_data in video_comments:
         for author, comment in comments_data:
-            author_comments[author].append(comment)
-            comment_authors[comment].add(author)
+            comment_counts.add(author, comment)
+
+    detect_and_write(directory_path, comment_counts, bot_like_threshold, spam_threshold, near_duplicate_threshold)
+
+# Same as build_graph, from Counters of (author, comment) pairs (e.g. one per shard from parse_shard)
+def build_graph_from_counts(pair_counts, directory_path, bot_like_threshold=BOT_LIKE_THRESHOLD,
+                            spam_threshold=SPAM_THRESHOLD, near_duplicate_threshold=None):
+    comment_counts = CommentCounts()
+    for counts in pair_counts:
+        for (author, comment), count in counts.items():
+            comment_counts.add(author, comment, count)
 
-    total_bot_like += detect_bot_like_behavior(comment_authors)
-    total_spam += detect_spam_comments(author_comments)
+    detect_and_write(directory_path, comment_counts, bot_like_threshold, spam_threshold, near_duplicate_threshold)
+
+# Same graph as process_files, but keeps the comment counts in commentercomment_state.pickle and only parses the files
+# that are new or changed since the last run; the CSVs are rewritten in full and match a full rebuild
+def process_files_incremental(directory_path, num_videos, bot_like_threshold=BOT_LIKE_THRESHOLD,
+                              spam_threshold=SPAM_THRESHOLD, near_duplicate_threshold=None, selection=None):
+    txt_files = select_comment_files(directory_path, num_videos, selection)  # Limit to the number of videos specified
+    state = GraphState(os.path.join(directory_path, 'commentercomment_state.pickle'), 'commentercomment')
+    author_comment_counts = state.totals.setdefault('author_comment_counts', defaultdict(Counter))
+    changed, removed = state.file_changes(directory_path, txt_files)
+    print(f"Processing {len(changed)} new or changed videos, removing {len(removed)}, {len(txt_files) - len(changed)} unchanged...")
+
+    # A file's contribution is how many times each (author, comment) pair appears in it
+    for filename in removed + changed:
+        for (author, comment), count in (state.forget(filename) or Counter()).items():
+            author_comment_counts[author][comment] -= count
+            if author_comment_counts[author][comment] <= 0:
+                del author_comment_counts[author][comment]
+                if not author_comment_counts[author]:
+                    del author_comment_counts[author]
+    for filename in changed:
+        print(f"Processing file: {filename}")
+        pair_counts = Counter(parse_comments(os.path.join(directory_path, filename)))
+        for (author, comment), count in pair_counts.items():
+            author_comment_counts[author][comment] += count
+        state.remember(directory_path, filename, pair_counts)
+    state.save()
+
+    comment_counts = CommentCounts()
+    for author, comment_count in author_comment_counts.items():
+        for comment, count in comment_count.items():
+            comment_counts.add(author, comment, count)
+    detect_and_write(directory_path, comment_counts, bot_like_threshold, spam_threshold, near_duplicate_threshold)
+
+# Comments are numbered by comment_counts.comments; pairs are the grouped (authors, comments, counts) arrays and
+# comment_order the comments in the order they are listed, which near-duplicate grouping changes
+def detect_and_write(directory_path, comment_counts, bot_like_threshold=BOT_LIKE_THRESHOLD,
+                     spam_threshold=SPAM_THRESHOLD, near_duplicate_threshold=None):
+    pairs = comment_counts.grouped_pairs()
+    comment_order = np.arange(len(comment_counts.comments))
+    members = None
+    cluster_similarity = {}
+    if near_duplicate_threshold is not None:
+        pairs, comment_order, members, cluster_similarity = merge_near_duplicates(comment_counts, pairs,
+                                                                                  near_duplicate_threshold)
+
+    total_bot_like, bot_like_comments = detect_bot_like_behavior(comment_counts, pairs, comment_order, bot_like_threshold)
+    total_spam, spam_comments = detect_spam_comments(comment_counts, pairs, spam_threshold)
     
     print("Detected behaviors:")
     print(f"Total bot-like comments detected: {total_bot_like}")
     print(f"Total spam comments detected: {total_spam}")
+    if near_duplicate_threshold is not None:
+        print(f"Total near-duplicate groups detected: {len(cluster_similarity)}")
 
     # Write nodes and edges to CSV files
-    write_csv_files(directory_path, author_comments, comment_authors)
+    write_csv_files(directory_path, comment_counts, pairs, comment_order, members, bot_like_comments, spam_comments,
+                    spam_threshold, cluster_similarity)
 
 
-def detect_bot_like_behavior(comment_authors):
-    bot_like_count = 0
+# Folds every group of near-duplicate comments into the variant posted by the most commenters
+# Returns the merged pairs, the merged comments in order, the comments folded into each one (None if nothing was
+# merged) and the similarity of each group, keyed by that variant
+def merge_near_duplicates(comment_counts, pairs, near_duplicate_threshold=NEAR_DUPLICATE_THRESHOLD):
+    print("Checking for near-duplicate comments...")
+    authors, comments, counts = pairs
+    comment_total = len(comment_counts.comments)
+    texts = [comment_counts.comments[comment] for comment in range(comment_total)]  # Every text is compared
+    clusters = near_duplicate_clusters(texts, np.bincount(comments, minlength=comment_total).tolist(),
+                                       near_duplicate_threshold)
+    canonical = np.arange(comment_total)
+    cluster_similarity = {}
+    for representative, members, similarity in clusters:
+        print(f"Near-duplicate comments detected: {len(members)} variants of '{texts[representative]}' (similarity {similarity:.2f}).")
+        cluster_similarity[representative] = similarity
+        canonical[members] = representative
+    if not clusters:
+        return pairs, np.arange(comment_total), None, cluster_similarity
+
+    # Each commenter's merged comments stay in the order the commenter first posted one of their variants, and
+    # the merged comments in the order the first of their variants was seen
+    keys = authors << 32 | canonical[comments]
+    merged_keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    merged_counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(merged_keys)).astype(np.int64)
+    order = np.argsort(first_index, kind='stable')
+    merged_pairs = (merged_keys[order] >> 32, merged_keys[order] & 0xFFFFFFFF, merged_counts[order])
+    _, first_variant = np.unique(canonical, return_index=True)
+    members = defaultdict(list)
+    for comment, shown in enumerate(canonical.tolist()):
+        members[shown].append(comment)
+    return merged_pairs, canonical[np.sort(first_variant)], members, cluster_similarity
+
+# Returns the number of bot-like comments and which comments are bot-like (a boolean array)
+def detect_bot_like_behavior(comment_counts, pairs, comment_order, bot_like_threshold=BOT_LIKE_THRESHOLD):
+    _, comments, _ = pairs
+    author_totals = np.bincount(comments, minlength=len(comment_counts.comments))
+    bot_like_comments = author_totals > bot_like_threshold
     print("Checking for bot-like behavior...")
-    for comment, authors in comment_authors.items():
-        if len(authors) > 5:  # Updated threshold for bot-like behavior
-            print(f"Bot-like behavior detected for comment: '{comment}' posted by {len(authors)} authors.")
-            bot_like_count += 1
-    return bot_like_count
-
-def detect_spam_comments(author_comments):
-    spam_count = 0
+    for comment in comment_order[bot_like_comments[comment_order]].tolist():
+        print(f"Bot-like behavior detected for comment: '{comment_counts.comments[comment]}' posted by {author_totals[comment]} authors.")
+    return int(bot_like_comments.sum()), bot_like_comments
+
+# Returns the number of (commenter, comment) pairs over the threshold and which comments they posted (a boolean array)
+def detect_spam_comments(comment_counts, pairs, spam_threshold=SPAM_THRESHOLD):
+    authors, comments, counts = pairs
+    spam = counts > spam_threshold
+    spam_comments = np.zeros(len(comment_counts.comments), dtype=bool)
+    spam_comments[comments[spam]] = True
     print("Checking for spam comments...")
-    for author, comments in author_comments.items():
-        comment_count = defaultdict(int)
-        for comment in comments:
-            comment_count[comment] += 1
-        for comment, count in comment_count.items():
-            if count > 5:  # Updated threshold for spam comments
-                print(f"Spam comment detected: '{comment}' posted {count} times by {author}.")
-                spam_count += 1
-    return spam_count
+    for author, comment, count in zip(authors[spam].tolist(), comments[spam].tolist(), counts[spam].tolist()):
+        print(f"Spam comment detected: '{comment_counts.comments[comment]}' posted {count} times by {comment_counts.authors[author]}.")
+    return int(spam.sum()), spam_comments
 
 
-def write_csv_files(directory_path, author_comments, comment_authors):
+def write_csv_files(directory_path, comment_counts, pairs, comment_order, members, bot_like_comments, spam_comments,
+                    spam_threshold=SPAM_THRESHOLD, cluster_similarity=None):
     node_csv_path = os.path.join(directory_path, 'commentercomment_nodes.csv')
     edge_csv_path = os.path.join(directory_path, 'commentercomment_edges.csv')
+    authors, comments, counts = pairs
+    flagged_pairs = bot_like_comments[comments] | (counts > spam_threshold)
+    flagged_comments = comment_order[(bot_like_comments | spam_comments)[comment_order]].tolist()
 
     with open(node_csv_path, 'w', newline='', encoding='utf-8') as node_file:
         writer = csv.writer(node_file)
         writer.writerow(['Id', 'Label', 'Type', 'Behavior'])
-        for author, comments in author_comments.items():
+        author_behaviors = {}
+        for author, comment, count in zip(authors[flagged_pairs].tolist(), comments[flagged_pairs].tolist(),
+                                          counts[flagged_pairs].tolist()):
+            behaviors = author_behaviors.setdefault(author, set())
+            if bot_like_comments[comment]:
+                behaviors.add('Bot-like')
+            if count > spam_threshold:
+                behaviors.add('Spam')
+        for author, behaviors in author_behaviors.items():
+            behavior_label = ' & '.join(behaviors)  # Join behaviors like 'Bot-like & Spam'
+            author_name = comment_counts.authors[author]
+            writer.writerow([author_name, author_name, 'Commenter', behavior_label])
+
+        for comment in flagged_comments:
             behaviors = set()
-            for comment in comments:
-                if len(comment_authors[comment]) > 5:
-                    behaviors.add('Bot-like')
-                if comments.count(comment) > 5:
-                    behaviors.add('Spam')
-            if behaviors:  # If there are any behaviors detected
-                behavior_label = ' & '.join(behaviors)  # Join behaviors like 'Bot-like & Spam'
-                writer.writerow([author, author, 'Commenter', behavior_label])
-
-        for comment, authors in comment_authors.items():
-            if len(authors) > 5 or any(author_comments[author].count(comment) > 5 for author in authors):
-                behaviors = set()
-                if len(authors) > 5:
-                    behaviors.add('Bot-like')
-                if any(author_comments[author].count(comment) > 5 for author in authors):
-                    behaviors.add('Spam')
-                behavior_label = ' & '.join(behaviors)
-                writer.writerow([comment, comment, 'Comment', behavior_label])
+            if bot_like_comments[comment]:
+                behaviors.add('Bot-like')
+            if spam_comments[comment]:
+                behaviors.add('Spam')
+            behavior_label = ' & '.join(behaviors)
+            if cluster_similarity and comment in cluster_similarity:
+                behavior_label += f" (near-duplicates, similarity {cluster_similarity[comment]:.2f})"
+            text = comment_counts.comments[comment]
+            writer.writerow([text, text, 'Comment', behavior_label])
+
+    # The commenters of a comment are listed in the same order as a set of their names would be; a merged comment
+    # collects the commenters of each of its variants in turn
+    if members is None:
+        comment_authors = comment_counts.author_sets(flagged_comments)
+    else:
+        variant_authors = comment_counts.author_sets([variant for comment in flagged_comments for variant in members[comment]])
+        comment_authors = {}
+        for comment in flagged_comments:
+            comment_authors[comment] = set()
+            for variant in members[comment]:
+                comment_authors[comment].update(variant_authors[variant])
+    flagged = np.isin(comments, np.array(flagged_comments, dtype=np.int64))
+    weights = {(author, comment): count for author, comment, count
+               in zip(authors[flagged].tolist(), comments[flagged].tolist(), counts[flagged].tolist())}
 
     with open(edge_csv_path, 'w', newline='', encoding='utf-8') as edge_file:
         writer = csv.writer(edge_file)
         writer.writerow(['Source', 'Target', 'Weight'])
-        for comment, authors in comment_authors.items():
-            for author in authors:
-                if len(authors) > 5 or author_comments[author].count(comment) > 5:
-                    weight = author_comments[author].count(comment)
-                    writer.writerow([author, comment, weight])
+        for comment in flagged_comments:
+            bot_like = bot_like_comments[comment]
+            text = comment_counts.comments[comment]
+            for author in comment_authors[comment]:
+                weight = weights[comment_counts.authors.ids[author], comment]
+                if bot_like or weight > spam_threshold:
+                    writer.writerow([author, text, weight])
 
 # Example usage
 if __name__ == '__main__':
     directory_path = os.path.dirname(os.path.abspath(__file__))
     num_videos = 1000
-    process_files(directory_path, num_videos)
+    bot_like_threshold = BOT_LIKE_THRESHOLD  # Flag comments posted by more than this many commenters
+    spam_threshold = SPAM_THRESHOLD  # Flag comments one commenter posted more than this many times
+    near_duplicate_threshold = None  # Set to e.g. NEAR_DUPLICATE_THRESHOLD to group near-duplicate comments (None = exact text only)
+    incremental = False  # True = only parse files added or changed since the last run
+    workers = 1  # Processes to parse the files in (None = one per CPU core)
+    selection = None  # e.g. {'search_phrase': 'Russia Ukraine', 'top_n': 50} (None = every comment file)
+    if incremental:
+        process_files_incremental(directory_path, num_videos, bot_like_threshold, spam_threshold, near_duplicate_threshold,
+                                  selection)
+    else:
+        process_files(directory_path, num_videos, bot_like_threshold, spam_threshold, near_duplicate_threshold, workers,
+                      selection)
@@ -6,47 +6,102 @@
 # csv files will save to the same location as the code
 
 # You can edit the following:
-# Line 71: Number of videos to process
+# Line 126: Number of videos to process
+# Or call process_store(store_path, output_directory, search_phrase) to build the graph from a comment_store.py database
+# Line 127: incremental = True to only parse files added or changed since the last run (see graph_state.py)
+# Line 128: workers = number of processes to parse the files in (see parallel_parse.py)
+# Line 129: selection = which videos to build the graph from (see corpus_index.py)
 
 import os
 import csv
+from collections import Counter
+from comment_parser import load_comment_authors
+from comment_store import CommentStore
+from corpus_index import select_comment_files
+from graph_state import GraphState
+from parallel_parse import map_shards
 
 def parse_comments(file_path):
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        for line in file:
-            line = line.strip()
-            if line.startswith('Author:') and '@' in line:
-                author = line.split('@')[1].strip()
-                if author:
-                    data.append(author)  # Collect only author name
-    return data
-
-def process_files(directory_path, num_videos):
+    return load_comment_authors(file_path)  # Collect only author name
+
+# workers > 1 parses the files in that many processes (None = one per CPU core); the graph is the same
+# selection picks the videos by search phrase, publish date, comment count or a seeded sample (see corpus_index.py)
+def process_files(directory_path, num_videos, workers=1, selection=None):
     print(f"Processing {num_videos} videos...")
+    txt_files = select_comment_files(directory_path, num_videos, selection)  # Limit to the number of videos specified
+    total_files = len(txt_files)
+
+    def video_commenters():
+        files_processed = 0
+        for filename in txt_files:
+            files_processed += 1
+            print(f"Processing file {files_processed}/{total_files}: {filename}")
+            video_id = filename.replace('.txt', '')
+            yield video_id, parse_comments(os.path.join(directory_path, filename))
+
+    if workers == 1:
+        build_graph(video_commenters(), directory_path)
+    else:
+        shards = map_shards(parse_shard, directory_path, txt_files, workers)
+        build_graph((video for shard in shards for video in shard), directory_path)
+
+# Worker side of process_files(..., workers): (video_id, [commenter, ...]) for each file of a shard, with each
+# commenter listed once, in the order they first commented
+def parse_shard(directory_path, filenames):
+    return [(filename.replace('.txt', ''), list(dict.fromkeys(parse_comments(os.path.join(directory_path, filename)))))
+            for filename in filenames]
+
+# Same graph from a comment_store.py database, optionally only the videos returned for one search phrase
+def process_store(store_path, output_directory, search_phrase=None):
+    store = CommentStore(store_path)
+    video_commenters = ((video_id, [record.author for record in records])
+                        for video_id, records in store.iter_video_comments(search_phrase))
+    build_graph(video_commenters, output_directory)
+    store.close()
+
+# video_commenters yields (video_id, [commenter, ...]) for each video
+def build_graph(video_commenters, directory_path):
     all_commenters = set()
     all_videos = set()
     edges = set()  # Using a set to avoid duplicate edges
 
-    txt_files = [f for f in os.listdir(directory_path) if f.endswith('.txt')]
-    txt_files = txt_files[:num_videos]  # Limit to the number of videos specified
-    total_files = len(txt_files)
-    files_processed = 0
-
-    for filename in txt_files:
-        files_processed += 1
-        print(f"Processing file {files_processed}/{total_files}: {filename}")
-        
-        video_id = filename.replace('.txt', '')
+    for video_id, commenters in video_commenters:
         all_videos.add(video_id)  # Add video ID to set
-        file_path = os.path.join(directory_path, filename)
-        commenters = parse_comments(file_path)
-        
         for commenter in commenters:
             all_commenters.add(commenter)
             edges.add((commenter, video_id))  # Create an edge from commenter to video
 
+    write_csv_files(directory_path, all_videos, all_commenters, edges)
+
+# Same graph as process_files, but keeps its state in videocommenter_state.pickle and only parses the files
+# that are new or changed since the last run; the CSVs are rewritten in full and match a full rebuild
+def process_files_incremental(directory_path, num_videos, selection=None):
+    txt_files = select_comment_files(directory_path, num_videos, selection)  # Limit to the number of videos specified
+    state = GraphState(os.path.join(directory_path, 'videocommenter_state.pickle'), 'videocommenter')
+    commenter_videos = state.totals.setdefault('commenter_videos', Counter())  # Videos each commenter is linked to
+    changed, removed = state.file_changes(directory_path, txt_files)
+    print(f"Processing {len(changed)} new or changed videos, removing {len(removed)}, {len(txt_files) - len(changed)} unchanged...")
+
+    for filename in removed + changed:
+        commenter_videos.subtract(state.forget(filename) or [])
+    for filename in changed:
+        print(f"Processing file: {filename}")
+        commenters = sorted(set(parse_comments(os.path.join(directory_path, filename))))
+        commenter_videos.update(commenters)
+        state.remember(directory_path, filename, commenters)
+    for commenter in [commenter for commenter, count in commenter_videos.items() if count <= 0]:
+        del commenter_videos[commenter]
+    state.save()
+
+    all_videos = set()
+    edges = set()
+    for filename, commenters in state.contributions.items():
+        video_id = filename.replace('.txt', '')
+        all_videos.add(video_id)
+        edges.update((commenter, video_id) for commenter in commenters)
+    write_csv_files(directory_path, all_videos, set(commenter_videos), edges)
 
+def write_csv_files(directory_path, all_videos, all_commenters, edges):
     # Write nodes and edges to CSV files
     node_csv_path = os.path.join(directory_path, 'videocommenter_nodes.csv')
     edge_csv_path = os.path.join(directory_path, 'videocommenter_edges.csv')
@@ -69,4 +124,10 @@ def process_files(directory_path, num_videos):
 if __name__ == '__main__':
     directory_path = os.path.dirname(os.path.abspath(__file__))
     num_videos = 10
-    process_files(directory_path, num_videos)
+    incremental = False  # True = only parse files added or changed since the last run
+    workers = 1  # Processes to parse the files in (None = one per CPU core)
+    selection = None  # e.g. {'search_phrase': 'Russia Ukraine', 'top_n': 50} (None = every comment file)
+    if incremental:
+        process_files_incremental(directory_path, num_videos, selection)
+    else:
+        process_files(directory_path, num_videos, workers, selection)
@@ -0,0 +1,248 @@
+# Headless community detection and layout for the co-commenter graph, used by NetworkX_makeGraph.py
+# The graph is kept as a compact edge list: commenters are numbered, and the edges are three numpy arrays
+# (source, target, weight) rather than a networkx graph of Python objects; it can be saved to and loaded from
+# a .npz file, and weak edges pruned by minimum weight and top_k per commenter before the analysis
+# Communities and the layout use igraph (Leiden through leidenalg, otherwise igraph's Louvain) when they are
+# installed, which handles graphs far larger than networkx can, and fall back to networkx otherwise
+# The results are written to CSV files keyed by commenter name: <name>_partition.csv (Id, Community) and
+# <name>_layout.csv (Id, X, Y), which Gephi can import as node tables
+# Commenters left without edges (after pruning, or who shared no video with anyone) are left out of the analysis,
+# where each would only be a community of its own, and their number is printed
+# Each stage reports its wall time; with trace_memory also its peak memory (traced Python and numpy allocations,
+# which slows every stage down; memory allocated inside igraph's C library is not traced, so the process peak is
+# printed at the end as well)
+# Needs numpy, scipy and networkx; igraph and leidenalg are optional (pip install igraph leidenalg)
+
+import contextlib
+import csv
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+import numpy as np
+import networkx as nx
+from comment_parser import COLUMN_SEPARATOR
+from cocommenter_matrix import build_incidence, iter_cocommenter_edges
+
+try:
+    import igraph
+except ImportError:
+    igraph = None
+
+try:
+    import leidenalg
+except ImportError:
+    leidenalg = None
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows
+
+# names[i] is the commenter numbered i; edge e joins sources[e] and targets[e] with weight weights[e]
+EdgeList = namedtuple('EdgeList', ['names', 'sources', 'targets', 'weights'])
+
+# Records the wall time of each stage of an analysis and the peak memory allocated during it
+class StageReport:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []  # (stage, seconds, peak bytes or None)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+            if started_tracing:
+                tracemalloc.stop()
+            self.stages.append((name, seconds, peak))
+            memory = f", peak {peak / 2**20:.1f} MB" if peak is not None else ""
+            print(f"Stage '{name}' took {seconds:.2f} s{memory}")
+
+    def print_summary(self):
+        print("Stage                     Seconds" + ("   Peak MB" if self.trace_memory else ""))
+        for name, seconds, peak in self.stages:
+            memory = f" {peak / 2**20 if peak is not None else float('nan'):>9.1f}" if self.trace_memory else ""
+            print(f"{name:<24} {seconds:>8.2f}{memory}")
+        if resource is not None:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            max_rss /= 2**20 if sys.platform == 'darwin' else 2**10  # Bytes on macOS, kilobytes on Linux
+            print(f"Process peak resident memory: {max_rss:.1f} MB")
+
+# Co-commenter edge list from (video_id, [commenter, ...]) pairs; every commenter is a node, even without edges
+def cocommenter_edges(video_commenters, min_weight=1, top_k=None):
+    incidence, authors, _ = build_incidence(video_commenters)
+    blocks = list(iter_cocommenter_edges(incidence, min_weight, top_k))
+    if not blocks:
+        empty = np.zeros(0, dtype=np.int64)
+        return EdgeList(authors, empty, empty, empty)
+    sources, targets, weights = (np.concatenate(column) for column in zip(*blocks))
+    return EdgeList(authors, sources.astype(np.int64), targets.astype(np.int64), weights.astype(np.int64))
+
+# Names are stored as one UTF-8 blob, like the parse cache, so the file loads without pickle
+def save_edge_list(path, edges):
+    names = COLUMN_SEPARATOR.join(edges.names).encode('utf-8')
+    np.savez_compressed(path, names=np.frombuffer(names, dtype=np.uint8), sources=edges.sources,
+                        targets=edges.targets, weights=edges.weights)
+
+def load_edge_list(path):
+    with np.load(path, allow_pickle=False) as saved:
+        names = saved['names'].tobytes().decode('utf-8')
+        return EdgeList(names.split(COLUMN_SEPARATOR) if names else [], saved['sources'], saved['targets'], saved['weights'])
+
+# Drops edges lighter than min_weight and, with top_k set, keeps an edge only if it is among the top_k heaviest
+# edges of either of its commenters (ties with the top_k-th are kept), the same rule as cocommenter_matrix.py
+def prune_edges(edges, min_weight=1, top_k=None):
+    keep = edges.weights >= min_weight
+    sources, targets, weights = edges.sources[keep], edges.targets[keep], edges.weights[keep]
+    if top_k and len(weights):
+        # Every edge is listed once for each of its commenters, heaviest first per commenter
+        nodes = np.concatenate((sources, targets))
+        both_weights = np.concatenate((weights, weights))
+        order = np.lexsort((-both_weights, nodes))
+        sorted_nodes = nodes[order]
+        node_ids, first, counts = np.unique(sorted_nodes, return_index=True, return_counts=True)
+        full = counts >= top_k
+        thresholds = np.zeros(len(edges.names), dtype=both_weights.dtype)
+        thresholds[node_ids[full]] = both_weights[order][first[full] + top_k - 1]
+        keep = (weights >= thresholds[sources]) | (weights >= thresholds[targets])
+        sources, targets, weights = sources[keep], targets[keep], weights[keep]
+    return EdgeList(edges.names, sources, targets, weights)
+
+# The edge list without the commenters that have no edges, renumbered; returns (edges, number of commenters dropped)
+def drop_isolated_nodes(edges):
+    connected = np.zeros(len(edges.names), dtype=bool)
+    connected[edges.sources] = True
+    connected[edges.targets] = True
+    new_ids = np.cumsum(connected) - 1
+    names = [name for name, keep in zip(edges.names, connected.tolist()) if keep]
+    return EdgeList(names, new_ids[edges.sources], new_ids[edges.targets], edges.weights), len(edges.names) - len(names)
+
+def to_networkx(edges):
+    graph = nx.Graph()
+    graph.add_nodes_from(range(len(edges.names)))
+    graph.add_weighted_edges_from(zip(edges.sources.tolist(), edges.targets.tolist(), edges.weights.tolist()))
+    return graph
+
+def to_igraph(edges):
+    graph = igraph.Graph(n=len(edges.names), edges=list(zip(edges.sources.tolist(), edges.targets.tolist())))
+    graph.es['weight'] = edges.weights.tolist()
+    return graph
+
+# 'auto' picks the fastest installed backend: leidenalg, then igraph, then networkx
+def pick_backend(backend):
+    if backend != 'auto':
+        return backend
+    if igraph is not None and leidenalg is not None:
+        return 'leidenalg'
+    return 'igraph' if igraph is not None else 'networkx'
+
+# Numbers communities by size, largest first (ties by their lowest commenter number), so runs are comparable
+def renumber_communities(membership):
+    membership = np.asarray(membership, dtype=np.int64)
+    if not len(membership):
+        return membership
+    sizes = np.bincount(membership)
+    first_node = np.full(len(sizes), len(membership), dtype=np.int64)
+    np.minimum.at(first_node, membership, np.arange(len(membership)))
+    present = np.flatnonzero(sizes)
+    ranked = present[np.lexsort((first_node[present], -sizes[present]))]
+    new_ids = np.empty(len(sizes), dtype=np.int64)
+    new_ids[ranked] = np.arange(len(ranked))
+    return new_ids[membership]
+
+# Community number of every commenter; returns (membership array, backend used)
+def detect_communities(edges, backend='auto', seed=1):
+    backend = pick_backend(backend)
+    if backend == 'leidenalg':
+        partition = leidenalg.find_partition(to_igraph(edges), leidenalg.ModularityVertexPartition,
+                                             weights='weight', seed=seed)
+        membership = partition.membership
+    elif backend == 'igraph':
+        random.seed(seed)  # igraph draws its random numbers from Python's random module
+        membership = to_igraph(edges).community_multilevel(weights='weight').membership
+    else:
+        membership = np.zeros(len(edges.names), dtype=np.int64)
+        communities = nx.community.louvain_communities(to_networkx(edges), weight='weight', seed=seed)
+        for community_id, nodes in enumerate(communities):
+            membership[list(nodes)] = community_id
+    return renumber_communities(membership), backend
+
+# (x, y) position of every commenter; returns (positions array, backend used)
+def compute_layout(edges, backend='auto', seed=1, iterations=50):
+    backend = 'igraph' if pick_backend(backend) in ('leidenalg', 'igraph') else 'networkx'
+    if backend == 'igraph':
+        random.seed(seed)
+        layout = to_igraph(edges).layout_fruchterman_reingold(weights='weight', niter=iterations)
+        positions = np.array(layout.coords, dtype=np.float64).reshape(-1, 2)
+    else:
+        pos = nx.spring_layout(to_networkx(edges), k=0.1, iterations=iterations, seed=seed, weight='weight')
+        positions = np.array([pos[node] for node in range(len(edges.names))], dtype=np.float64).reshape(-1, 2)
+    return positions, backend
+
+def write_partition(csv_path, edges, membership):
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['Id', 'Community'])
+        writer.writerows(zip(edges.names, membership.tolist()))
+
+def write_layout(csv_path, edges, positions):
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['Id', 'X', 'Y'])
+        writer.writerows((name, f"{x:.6g}", f"{y:.6g}") for name, (x, y) in zip(edges.names, positions.tolist()))
+
+# Prunes the edge list, drops the commenters left without edges (unless drop_isolated is False), finds communities
+# and (optionally) a layout, and writes them next to each other in output_directory as <name>_partition.csv and
+# <name>_layout.csv
+# Returns (pruned edges, membership, positions or None, report)
+def analyze_edges(edges, output_directory, name='networkx', min_weight=1, top_k=None, backend='auto', layout=True,
+                  seed=1, iterations=50, report=None, drop_isolated=True):
+    report = report or StageReport()
+    if min_weight > 1 or top_k:
+        with report.stage('prune edges'):
+            edges = prune_edges(edges, min_weight, top_k)
+    if drop_isolated:
+        edges, isolated = drop_isolated_nodes(edges)
+        if isolated:
+            print(f"Left out {isolated} commenters without edges")
+    print(f"Analyzing {len(edges.names)} commenters and {len(edges.weights)} edges...")
+
+    with report.stage('communities'):
+        membership, used = detect_communities(edges, backend, seed)
+    print(f"Found {int(membership.max()) + 1 if len(membership) else 0} communities with {used}")
+    positions = None
+    if layout:
+        with report.stage('layout'):
+            positions, used = compute_layout(edges, backend, seed, iterations)
+        print(f"Computed the layout with {used}")
+
+    with report.stage('write files'):
+        partition_path = os.path.join(output_directory, f'{name}_partition.csv')
+        write_partition(partition_path, edges, membership)
+        print(f"Partition saved to: {partition_path}")
+        if positions is not None:
+            layout_path = os.path.join(output_directory, f'{name}_layout.csv')
+            write_layout(layout_path, edges, positions)
+            print(f"Layout saved to: {layout_path}")
+    report.print_summary()
+    return edges, membership, positions, report
+
+# The whole headless analysis from (video_id, [commenter, ...]) pairs, with the edge list as its first stage
+def analyze_video_commenters(video_commenters, output_directory, name='networkx', min_weight=1, top_k=None,
+                             backend='auto', layout=True, seed=1, iterations=50, trace_memory=False,
+                             drop_isolated=True):
+    report = StageReport(trace_memory)
+    with report.stage('edge list'):
+        edges = cocommenter_edges(video_commenters, min_weight, top_k)
+    return analyze_edges(edges, output_directory, name, 1, None, backend, layout, seed, iterations, report, drop_isolated)
@@ -0,0 +1,58 @@
+# Saved graph state for the gephi scripts' incremental mode (process_files_incremental)
+# Remembers which comment files went into the graph (by modification time and size), what each file contributed,
+# and the script's running totals (commenter counts, edge weights, comment counters)
+# On the next run only files that are new or changed are parsed: the old contribution of a changed or removed
+# file is taken back out of the totals and the new one added, so the CSVs come out the same as a full rebuild
+# The state is a pickle file next to the CSVs; it is rebuilt from scratch if it is missing or from another version
+
+import os
+import pickle
+
+STATE_VERSION = 1
+
+class GraphState:
+    def __init__(self, state_path, graph_name):
+        self.state_path = state_path
+        self.graph_name = graph_name
+        self.files = {}  # filename -> [mtime_ns, size]
+        self.contributions = {}  # filename -> what the file added to the totals
+        self.totals = {}
+        try:
+            with open(state_path, 'rb') as file:
+                saved = pickle.load(file)
+            if saved.get('version') == STATE_VERSION and saved.get('graph_name') == graph_name:
+                self.files = saved['files']
+                self.contributions = saved['contributions']
+                self.totals = saved['totals']
+        except FileNotFoundError:
+            pass
+
+    # Splits the files that make up the graph now into those that need parsing (new or changed since the last run)
+    # and returns them with the files that were in the last run but are not any more
+    def file_changes(self, directory_path, filenames):
+        changed = []
+        for filename in filenames:
+            stat = os.stat(os.path.join(directory_path, filename))
+            if self.files.get(filename) != [stat.st_mtime_ns, stat.st_size]:
+                changed.append(filename)
+        current = set(filenames)
+        removed = [filename for filename in self.files if filename not in current]
+        return changed, removed
+
+    # Takes a file out of the state and returns its old contribution (None if it was not in the state)
+    def forget(self, filename):
+        self.files.pop(filename, None)
+        return self.contributions.pop(filename, None)
+
+    def remember(self, directory_path, filename, contribution):
+        stat = os.stat(os.path.join(directory_path, filename))
+        self.files[filename] = [stat.st_mtime_ns, stat.st_size]
+        self.contributions[filename] = contribution
+
+    # Written to a temporary file first so a crash never leaves half a state behind
+    def save(self):
+        temporary_path = self.state_path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump({'version': STATE_VERSION, 'graph_name': self.graph_name, 'files': self.files,
+                         'contributions': self.contributions, 'totals': self.totals}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.state_path)
@@ -0,0 +1,130 @@
+# Page-level checkpoints for the comment harvester
+# While a video is being harvested, every finished comment thread (the comment and its replies) is appended to
+# <video_id>.txt.partial in the final file layout, and <video_id>.checkpoint.json records the commentThreads page
+# token being worked on, the ID of the last thread of that page already saved and how long the partial file was then
+# After a crash or a quota stop the harvest continues from that page and thread instead of page one (the harvester
+# also uses this to harvest a long video a few pages at a time);
+# the partial file only becomes <video_id>.txt (by adding the comment count trailer and renaming it) once the
+# whole video is done, so no more than one page of comments is ever held in memory
+# The pages can shift between runs (comments added or deleted since), so after a resume the threads already saved are
+# skipped by ID rather than by position: those up to the last thread saved, or, while that thread is not on the page,
+# every thread whose comment is already in the partial file (threads can have moved a page or more either way)
+
+import json
+import os
+from comment_format import write_comment_count, write_comment_record
+from comment_parser import parse_comment_file
+
+class VideoCheckpoint:
+    def __init__(self, directory, video_id):
+        self.video_id = video_id
+        self.final_path = os.path.join(directory, f'{video_id}.txt')
+        self.partial_path = self.final_path + '.partial'
+        self.state_path = os.path.join(directory, f'{video_id}.checkpoint.json')
+        self.page_token = None  # Token of the page in progress (None is the first page)
+        self.threads_done = 0  # Threads of that page already in the partial file
+        self.last_thread_id = None  # ID of the last thread saved, on this page or an earlier one
+        self.pages_done = 0
+        self.record_count = 0
+        self.units = 0  # Quota units spent on the video so far, reply pages included
+        self.reply_threads = 0  # Threads saved that have replies
+        self.embedded_reply_threads = 0  # Those of them whose replies were all embedded in the commentThreads page
+        self.partial_size = 0
+        self.complete = False  # Set once the last page is saved
+        self.resumed = self.load()
+        self.check_saved = self.resumed and self.record_count > 0  # The pages fetched next may hold saved threads
+        self.saved_ids = None  # Comment IDs in the partial file, read when first needed
+        # Anything written after the last checkpoint is from a thread that did not finish saving
+        with open(self.partial_path, 'a', encoding='utf-8') as partial_file:
+            partial_file.truncate(self.partial_size)
+
+    def load(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        if not os.path.exists(self.partial_path):
+            return False
+        self.page_token = state['page_token']
+        self.threads_done = state['threads_done']
+        self.last_thread_id = state.get('last_thread_id')  # Older checkpoints only counted threads
+        self.pages_done = state['pages_done']
+        self.record_count = state['record_count']
+        self.units = state.get('units', self.pages_done)  # Older checkpoints only counted pages
+        self.reply_threads = state.get('reply_threads', 0)
+        self.embedded_reply_threads = state.get('embedded_reply_threads', 0)
+        self.partial_size = state['partial_size']
+        return True
+
+    def save(self):
+        state = {
+            'video_id': self.video_id,
+            'page_token': self.page_token,
+            'threads_done': self.threads_done,
+            'last_thread_id': self.last_thread_id,
+            'pages_done': self.pages_done,
+            'record_count': self.record_count,
+            'units': self.units,
+            'reply_threads': self.reply_threads,
+            'embedded_reply_threads': self.embedded_reply_threads,
+            'partial_size': self.partial_size,
+        }
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)  # Never leaves a half-written checkpoint behind
+
+    # The items of a commentThreads page that are not saved yet; pages are checked after a resume until one has the
+    # last thread saved, or ends with a thread not saved (the saved threads are all before it)
+    def unsaved_threads(self, items):
+        if not self.check_saved:
+            return items
+        thread_ids = [item['id'] for item in items]
+        if self.last_thread_id in thread_ids:
+            self.check_saved = False
+            return items[thread_ids.index(self.last_thread_id) + 1:]
+        if self.saved_ids is None:
+            self.saved_ids = {record.comment_id for record in parse_comment_file(self.partial_path)}
+        unsaved = [item for item in items if item['snippet']['topLevelComment']['id'] not in self.saved_ids]
+        if not items or (unsaved and unsaved[-1] is items[-1]):
+            self.check_saved = False
+        return unsaved
+
+    # Appends one finished thread (its comment followed by its replies) and moves the checkpoint past it
+    # embedded is whether its replies were all embedded in the page, or None for a thread without replies
+    def write_thread(self, records, thread_id=None, embedded=None):
+        with open(self.partial_path, 'a', encoding='utf-8') as partial_file:
+            for record in records:
+                write_comment_record(partial_file, record)
+            partial_file.flush()
+            self.partial_size = partial_file.tell()
+        self.record_count += len(records)
+        self.threads_done += 1
+        self.last_thread_id = thread_id
+        if embedded is not None:
+            self.reply_threads += 1
+            self.embedded_reply_threads += embedded
+        if self.saved_ids is not None:
+            self.saved_ids.add(records[0]['comment_id'])
+        self.save()
+
+    def next_page(self, page_token):
+        self.page_token = page_token
+        self.threads_done = 0
+        self.pages_done += 1
+        self.save()
+
+    # Turns the partial file into <video_id>.txt and removes the checkpoint
+    def promote(self):
+        with open(self.partial_path, 'a', encoding='utf-8') as partial_file:
+            write_comment_count(partial_file, self.record_count)
+        os.replace(self.partial_path, self.final_path)
+        if os.path.exists(self.state_path):  # Videos with no comments never save a checkpoint
+            os.remove(self.state_path)
+        return self.final_path
+
+    def discard(self):
+        for path in (self.partial_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
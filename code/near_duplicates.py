@@ -0,0 +1,104 @@
+# Near-duplicate comment detection with MinHash and locality-sensitive hashing (LSH)
+# Copy-pasted campaign comments often differ by punctuation, emoji or a word or two, so exact text matching misses them
+# Each comment is lower-cased with punctuation and emoji removed, cut into overlapping character shingles,
+# and summarised by a MinHash signature; two signatures agree in about the same share of positions as the
+# Jaccard similarity of the shingle sets. LSH buckets the signatures band by band, so only comments that share
+# a bucket are compared instead of every pair, and matches are confirmed against the similarity threshold
+# Used by gephi_commentercomment_network.py; needs numpy
+
+import re
+import numpy as np
+
+NON_WORD = re.compile(r'[^\w\s]+')
+WHITESPACE = re.compile(r'\s+')
+
+def normalize_text(text):
+    return WHITESPACE.sub(' ', NON_WORD.sub('', text.lower())).strip()
+
+# MinHash signatures (one row per text, uint32) of the character shingles of already-normalized texts
+# All shingles are hashed at once over one buffer holding every text; every text needs at least shingle_size bytes
+def minhash_signatures(normalized_texts, num_perm=64, shingle_size=5, seed=1):
+    encoded = [text.encode('utf-8') for text in normalized_texts]
+    lengths = np.array([len(data) for data in encoded], dtype=np.int64)
+    buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+    text_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # Polynomial hash of every shingle_size-byte window (uint64 arithmetic wraps around)
+    window_count = len(buffer) - shingle_size + 1
+    hashes = np.zeros(window_count, dtype=np.uint64)
+    for offset in range(shingle_size):
+        hashes = hashes * np.uint64(1099511628211) + buffer[offset:offset + window_count]
+
+    # Keep only the windows that lie inside one text; each text's windows are contiguous
+    window_counts = lengths - shingle_size + 1
+    window_starts = np.concatenate(([0], np.cumsum(window_counts)[:-1]))
+    inside = np.repeat(text_starts, window_counts) + np.arange(window_counts.sum()) - np.repeat(window_starts, window_counts)
+    hashes = hashes[inside]
+
+    # One multiply-shift hash function per signature position; each text keeps the minimum over its shingles
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(normalized_texts), num_perm), dtype=np.uint32)
+    permuted = np.empty_like(hashes)
+    for position in range(num_perm):
+        np.multiply(hashes, multipliers[position], out=permuted)
+        np.add(permuted, offsets[position], out=permuted)
+        np.right_shift(permuted, np.uint64(32), out=permuted)
+        signatures[:, position] = np.minimum.reduceat(permuted, window_starts)
+    return signatures
+
+# Yields (i, j) pairs of rows that land in the same bucket in at least one band (each pair at most once per band)
+def lsh_candidate_pairs(signatures, bands):
+    rows_per_band = signatures.shape[1] // bands
+    for band in range(bands):
+        keys = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * rows_per_band))).ravel()
+        _, buckets = np.unique(keys, return_inverse=True)
+        order = np.argsort(buckets, kind='stable')
+        sorted_buckets = buckets[order]
+        # Pair every bucket member with the first member of its bucket
+        first = np.concatenate(([True], sorted_buckets[1:] != sorted_buckets[:-1]))
+        bucket_first = order[first][np.cumsum(first) - 1]
+        members = ~first
+        yield bucket_first[members], order[members]
+
+def find(parents, item):
+    while parents[item] != item:
+        parents[item] = parents[parents[item]]
+        item = parents[item]
+    return item
+
+# Groups texts that are near-duplicates of each other (estimated Jaccard similarity of their shingles >= threshold)
+# Returns (representative, members, similarity) for each group of two or more texts, where members are indexes into
+# texts, the representative is the member with the highest weight (e.g. number of authors), and similarity is the
+# mean estimated similarity of the members to it
+# Texts shorter than min_length characters after normalizing are left out; they are too short to tell apart
+def near_duplicate_clusters(texts, weights=None, threshold=0.8, num_perm=64, bands=16, shingle_size=5, min_length=20, seed=1):
+    normalized = [normalize_text(text) for text in texts]
+    candidates = [index for index, text in enumerate(normalized) if len(text) >= max(min_length, shingle_size)]
+    if len(candidates) < 2:
+        return []
+    signatures = minhash_signatures([normalized[index] for index in candidates], num_perm, shingle_size, seed)
+
+    parents = list(range(len(candidates)))
+    for left, right in lsh_candidate_pairs(signatures, bands):
+        similar = (signatures[left] == signatures[right]).mean(axis=1) >= threshold
+        for i, j in zip(left[similar].tolist(), right[similar].tolist()):
+            root_i, root_j = find(parents, i), find(parents, j)
+            if root_i != root_j:
+                parents[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for row in range(len(candidates)):
+        groups.setdefault(find(parents, row), []).append(row)
+
+    clusters = []
+    for rows in groups.values():
+        if len(rows) < 2:
+            continue
+        representative_row = max(rows, key=lambda row: weights[candidates[row]]) if weights is not None else rows[0]
+        others = [row for row in rows if row != representative_row]
+        similarity = float((signatures[others] == signatures[representative_row]).mean())
+        clusters.append((candidates[representative_row], [candidates[row] for row in rows], similarity))
+    return clusters
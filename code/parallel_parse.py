@@ -0,0 +1,38 @@
+# Map-reduce parsing of the comment files for the gephi scripts' process_files(..., workers=N)
+# The file list is cut into contiguous shards in file order and the shards are parsed in a process pool; each worker
+# parses its shard and returns a compact partial result (e.g. the distinct commenters of each video, or a count of
+# (author, comment) pairs) instead of every parsed comment, and the parent merges the partial results
+# Results come back in shard order whichever worker finishes first, so the graph is the same as a one-process run
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+SHARDS_PER_WORKER = 4  # More shards than workers so a shard of long files does not hold up the others
+
+# Splits filenames into shard_count contiguous runs of (almost) equal length, keeping their order
+def shard_files(filenames, shard_count):
+    size, extra = divmod(len(filenames), shard_count)
+    shards = []
+    start = 0
+    for shard in range(shard_count):
+        end = start + size + (shard < extra)
+        shards.append(filenames[start:end])
+        start = end
+    return shards
+
+# Yields parse_shard(directory_path, shard) for each shard of filenames, in file order
+# parse_shard must be a module-level function so it can be sent to the worker processes
+# workers=None uses one process per CPU core
+def map_shards(parse_shard, directory_path, filenames, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if not filenames:
+        return
+    shards = shard_files(filenames, min(len(filenames), workers * SHARDS_PER_WORKER))
+    print(f"Parsing {len(filenames)} files in {len(shards)} shards with {workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        files_processed = 0
+        for shard, result in zip(shards, executor.map(partial(parse_shard, directory_path), shards)):
+            files_processed += len(shard)
+            print(f"Processed files {files_processed}/{len(filenames)}: {shard[0]} to {shard[-1]}")
+            yield result
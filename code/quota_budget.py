@@ -0,0 +1,146 @@
+# Daily YouTube Data API quota tracking for the comment harvester
+# Counts quota units instead of calls: each endpoint has its own unit cost (a search page costs 100 units,
+# a comment or reply page costs 1), see https://developers.google.com/youtube/v3/determine_quota_cost
+# The usage file is written in batches instead of on every call, and the count rolls over on its own
+# when the Pacific-time day changes (that is when YouTube resets the quota)
+# QuotaWorkScheduler orders pending work (e.g. the next few comment pages of each video) so the remaining units go
+# to the work with the most comments per unit
+
+import atexit
+import heapq
+import itertools
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+import pytz
+
+ENDPOINT_QUOTA_COSTS = {
+    'search.list': 100,
+    'commentThreads.list': 1,
+    'comments.list': 1,
+    'videos.list': 1,
+}
+
+quota_timezone = pytz.timezone('US/Pacific')
+
+def current_quota_day():
+    return datetime.now(quota_timezone).strftime("%Y-%m-%d")
+
+def seconds_until_quota_reset():
+    now = datetime.now(quota_timezone)
+    tomorrow = now + timedelta(days=1)
+    reset_time = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
+    return (reset_time - now).total_seconds() + 60  # Adding a 1-minute buffer
+
+class QuotaBudget:
+    def __init__(self, usage_path, daily_limit=10000, flush_every_units=100, flush_interval=30.0):
+        self.usage_path = usage_path
+        self.daily_limit = daily_limit
+        self.flush_every_units = flush_every_units
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.used, self.quota_day = self.load()
+        self.unsaved_units = 0
+        self.last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def load(self):
+        try:
+            with open(self.usage_path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0, current_quota_day()
+        if 'quota_used' not in data:
+            # Older files counted calls, not units, and had no day stamp, so their count is not carried over
+            return 0, current_quota_day()
+        if data.get('quota_day') != current_quota_day():
+            return 0, current_quota_day()
+        return data['quota_used'], data['quota_day']
+
+    def flush(self):
+        with self.lock:
+            with open(self.usage_path, 'w') as f:
+                json.dump({'quota_used': self.used, 'quota_day': self.quota_day}, f)
+            self.unsaved_units = 0
+            self.last_flush = time.monotonic()
+
+    def roll_over_if_new_day(self):
+        today = current_quota_day()
+        if today != self.quota_day:
+            self.quota_day = today
+            self.used = 0
+            self.flush()
+
+    def remaining(self):
+        with self.lock:
+            self.roll_over_if_new_day()
+            return max(self.daily_limit - self.used, 0)
+
+    def can_afford(self, units):
+        return units <= self.remaining()
+
+    def charge(self, endpoint, calls=1):
+        units = ENDPOINT_QUOTA_COSTS[endpoint] * calls
+        with self.lock:
+            self.roll_over_if_new_day()
+            self.used += units
+            self.unsaved_units += units
+            if self.unsaved_units >= self.flush_every_units or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+        return units
+
+    # Charges calls to the endpoint, first blocking until they fit in today's budget; the check and the charge are
+    # one step under the lock, so threads reserving at the same time can't pass the limit together (the others
+    # wait on the lock while one sleeps until the reset)
+    # Callers holding other work should ask QuotaWorkScheduler for something cheaper first and only wait when
+    # nothing fits
+    def reserve(self, endpoint, calls=1):
+        units = ENDPOINT_QUOTA_COSTS[endpoint] * calls
+        with self.lock:
+            while not self.can_afford(units):
+                self.flush()
+                sleep_time = seconds_until_quota_reset()
+                print(f"API quota used up ({self.used}/{self.daily_limit} units), sleeping for {sleep_time} seconds until reset...")
+                time.sleep(sleep_time)
+                self.roll_over_if_new_day()
+            return self.charge(endpoint, calls)
+
+class QuotaWorkScheduler:
+    def __init__(self, budget):
+        self.budget = budget
+        self.heap = []
+        self.order = itertools.count()  # Keeps equally good items in the order they were added
+
+    def __len__(self):
+        return len(self.heap)
+
+    # units is the estimated quota cost of the whole item, expected_comments what it should yield
+    def add(self, item, units, expected_comments):
+        units = max(units, 1)
+        heapq.heappush(self.heap, (-expected_comments / units, next(self.order), units, item))
+
+    # Returns (item, units) for the best-yielding item that fits in the remaining budget after the
+    # units already reserved by running work, or None if nothing fits right now
+    def next_affordable(self, reserved_units=0):
+        available = self.budget.remaining() - reserved_units
+        skipped = []
+        found = None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[2] <= available:
+                found = (entry[3], entry[2])
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+        return found
+
+    # Like next_affordable, but when nothing fits it returns the best item anyway so a caller
+    # with nothing left running can wait for the reset and carry on with it
+    def next_item(self, reserved_units=0):
+        found = self.next_affordable(reserved_units)
+        if found is None and self.heap and reserved_units == 0:
+            entry = heapq.heappop(self.heap)
+            found = (entry[3], entry[2])
+        return found
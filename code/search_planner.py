@@ -0,0 +1,199 @@
+# Date-sliced search planner for the comment harvester
+# One search returns at most about 500 videos however many pages are requested, so a phrase is searched in
+# publishedAfter/publishedBefore windows instead: a window whose first page reports more results than that cap is
+# split into as many equal windows as its reported total needs (at most max_split; its first page is still kept)
+# and those are searched, down to min_window; smaller windows are paged through to the end
+# Several windows are searched at the same time, newest first; their results are merged with duplicates dropped,
+# and no new page is started once max_results videos are collected or max_units quota units are spent
+# The merged results keep the order the API gave them in (order="relevance", "rating", ...): a window's own pages
+# come first, then its smaller windows newest first; with order="date" they are sorted by publish date instead
+# Each window prints its pages, quota units and videos when it is done
+# A page that fails with a server error (5xx) is retried up to retries times, waiting retry_delay seconds and twice
+# as long each time after; a window whose page still fails keeps the pages it already has and is reported as failed,
+# and any other error (e.g. quotaExceeded) also stops the windows not yet searched; search then returns the videos
+# found so far, and failed_windows lists the windows left to search, which a later search can be given to continue
+
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from googleapiclient.errors import HttpError
+from quota_budget import ENDPOINT_QUOTA_COSTS
+
+SEARCH_RESULT_CAP = 500  # About the most results the API returns for one query
+YOUTUBE_START = datetime(2005, 4, 23, tzinfo=timezone.utc)  # Nothing was published before this
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def format_window_time(moment):
+    return moment.astimezone(timezone.utc).strftime(TIME_FORMAT)
+
+# Accepts "2024-02-24" or "2024-02-24T10:00:00Z"; None stays None
+def parse_window_time(text):
+    if text is None:
+        return None
+    if isinstance(text, datetime):
+        return text if text.tzinfo else text.replace(tzinfo=timezone.utc)
+    for time_format in (TIME_FORMAT, '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, time_format).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    raise ValueError(f"Not a date: {text}")
+
+# The saved search result for one search.list item
+def search_result_entry(search_result):
+    return {
+        'video_id': search_result["id"]["videoId"],
+        'title': search_result["snippet"]["title"],
+        'channelTitle': search_result["snippet"]["channelTitle"],
+        'publishedAt': search_result["snippet"]["publishedAt"]
+    }
+
+class SearchPlanner:
+    # search_page(published_after, published_before, page_token) runs one search.list call for a window and
+    # returns its response; it is called from several threads at once
+    def __init__(self, search_page, max_results, workers=4, max_units=None, result_cap=SEARCH_RESULT_CAP,
+                 min_window=timedelta(hours=1), max_split=8, order="relevance", retries=3, retry_delay=1.0):
+        self.search_page = search_page
+        self.max_results = max_results
+        self.order = order
+        self.workers = workers
+        self.max_units = max_units
+        self.result_cap = result_cap
+        self.min_window = min_window
+        self.max_split = max_split
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.page_units = ENDPOINT_QUOTA_COSTS['search.list']
+        self.lock = threading.Lock()
+        self.results = {}  # video_id -> (rank, search result), the best ranked kept
+        self.units = 0
+        self.windows = 0
+        self.failed_windows = []  # (start, end, error) of each window left unfinished by an error
+        self.stopped = None  # The error that stopped every window, if any
+
+    def done(self):
+        return len(self.results) >= self.max_results
+
+    # Claims the units of one more page; False once the limit would be passed or enough videos are collected
+    def claim_page(self):
+        with self.lock:
+            if self.done() or self.stopped is not None or (self.max_units is not None and self.units + self.page_units > self.max_units):
+                return False
+            self.units += self.page_units
+            return True
+
+    # One search page; a server error is retried with a growing wait, each retry claiming its units like a new page
+    # Returns None if a retry is no longer needed or affordable (see claim_page)
+    def fetch_page(self, published_after, published_before, page_token):
+        for attempt in range(self.retries + 1):
+            if attempt and not self.claim_page():
+                return None
+            try:
+                return self.search_page(published_after, published_before, page_token)
+            except HttpError as error:
+                if error.resp.status < 500 or attempt == self.retries:
+                    raise
+                print(f"Search page failed ({error.resp.status}), retrying in {self.retry_delay * 2 ** attempt:g} s")
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    # Searches one window; returns the smaller windows to search instead if it has more results than one query returns
+    # path places the window among the others (a smaller window's path is its parent's plus its own position), and
+    # a result's rank is (path, page, position on the page), so sorting by rank gives the API's order
+    def search_window(self, start, end, path=()):
+        pages = videos = new_videos = 0
+        subwindows = []
+        page_token = None
+        error = None
+        finished = False
+        while self.claim_page():
+            try:
+                response = self.fetch_page(format_window_time(start), format_window_time(end), page_token)
+            except HttpError as page_error:
+                error = page_error
+                with self.lock:
+                    self.failed_windows.append((start, end, error))
+                    if error.resp.status < 500 and self.stopped is None:
+                        self.stopped = error
+                break
+            if response is None:
+                break
+            pages += 1
+            items = [item for item in response.get("items", []) if item["id"]["kind"] == "youtube#video"]
+            with self.lock:
+                for position, item in enumerate(items):
+                    entry = search_result_entry(item)
+                    rank = (path, pages, position)
+                    videos += 1
+                    if entry['video_id'] not in self.results:
+                        new_videos += 1
+                    elif self.results[entry['video_id']][0] < rank:
+                        continue
+                    self.results[entry['video_id']] = (rank, entry)
+
+            total_results = response.get('pageInfo', {}).get('totalResults', 0)
+            if pages == 1 and total_results > self.result_cap and end - start > self.min_window:
+                # The reported total is only an estimate (and can be huge), hence the max_split
+                parts = min(self.max_split, math.ceil(total_results / self.result_cap))
+                step = (end - start) / parts
+                bounds = [start + step * part for part in range(parts)] + [end]
+                subwindows = [(bounds[part], bounds[part + 1], path + (position,))  # Newest first
+                              for position, part in enumerate(reversed(range(parts)))]
+                finished = True
+                break
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                finished = True
+                break
+        if error is None and not finished and self.stopped is not None:
+            error = self.stopped  # Another window's error stopped this one
+            with self.lock:
+                self.failed_windows.append((start, end, error))
+        if error is not None:
+            print(f"Search window {format_window_time(start)} to {format_window_time(end)} failed after {pages} pages "
+                  f"({videos} videos kept): {error}")
+            return subwindows
+        if not pages:
+            return subwindows
+        with self.lock:
+            self.windows += 1
+        split = f", split in {len(subwindows)} ({total_results} results reported)" if subwindows else ""
+        print(f"Search window {format_window_time(start)} to {format_window_time(end)}: {pages} pages, "
+              f"{pages * self.page_units} quota units, {videos} videos ({new_videos} new){split}")
+        return subwindows
+
+    # Returns up to max_results unique search results published between published_after and published_before
+    # (defaults: since YouTube started, until now), in the API's order; if a window failed, the videos found anyway
+    # windows, a list of (start, end), searches only those windows instead, e.g. the failed_windows of an earlier search
+    def search(self, published_after=None, published_before=None, windows=None):
+        if windows is None:
+            start = parse_window_time(published_after) or YOUTUBE_START
+            end = parse_window_time(published_before) or datetime.now(timezone.utc).replace(microsecond=0)
+            pending = [(start, end, ())]
+        else:
+            pending = [(parse_window_time(start), parse_window_time(end), (position,))
+                       for position, (start, end) in enumerate(windows)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            running = {}
+            while pending or running:
+                while pending and len(running) < self.workers and not self.done() and self.stopped is None:
+                    window = pending.pop(0)
+                    running[executor.submit(self.search_window, *window)] = window
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del running[future]
+                    pending.extend(future.result())
+                pending.sort(key=lambda window: window[1], reverse=True)  # Newest windows first
+        if self.stopped is not None:
+            self.failed_windows.extend((start, end, self.stopped) for start, end, _ in pending)
+
+        results = [entry for _, entry in sorted(self.results.values(), key=lambda result: result[0])]
+        if self.order == "date":
+            results.sort(key=lambda result: result['publishedAt'], reverse=True)
+        print(f"Searched {self.windows} windows: {len(results)} unique videos for {self.units} quota units"
+              + (f", keeping the first {self.max_results}" if len(results) > self.max_results else "")
+              + (f", {len(self.failed_windows)} windows failed" if self.failed_windows else ""))
+        return results[:self.max_results]
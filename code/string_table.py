@@ -0,0 +1,116 @@
+# Interned keys for the graph builders, so a large corpus is counted in integers instead of repeated Python strings
+# StringTable numbers short strings such as commenter names and video IDs 0, 1, 2, ... in the order they are first
+# seen, keeping each string once; TextTable does the same for comment texts, looked up by a 64-bit hash of the text
+# and kept once as UTF-8 bytes in one buffer, so a text only becomes a Python string again when it is asked for
+# (e.g. to print it or write it as a CSV label)
+# PairCounts counts (first ID, second ID) pairs, such as (commenter, comment), in integer arrays; the pairs are
+# merged with numpy every so often, so memory grows with the distinct pairs rather than with every comment
+# Needs numpy
+
+from array import array
+from hashlib import blake2b
+import numpy as np
+
+COMPACT_EVERY = 1 << 20  # Pairs added between merges in PairCounts
+
+# 64-bit hash of some bytes, the same in every run
+def content_hash(data):
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'little')
+
+# Strings -> dense IDs in the order they are first seen
+class StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, string):
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings)
+
+# Texts -> dense IDs in the order they are first seen, looked up by a 64-bit BLAKE2b hash of the text's UTF-8 bytes
+# (the same in every run); the bytes kept for that hash are compared with the text, so two texts whose hashes
+# collide still get IDs of their own
+class TextTable:
+    def __init__(self):
+        self.ids = {}  # hash -> ID of the first text with that hash
+        self.collided = {}  # text -> ID, for the rare texts whose hash belongs to another text
+        self.buffer = bytearray()  # Every text's UTF-8 bytes, one after another
+        self.ends = array('q')  # Where each text ends in buffer
+
+    def intern(self, text):
+        data = text.encode('utf-8')
+        text_hash = content_hash(data)
+        text_id = self.ids.get(text_hash)
+        if text_id is not None and self.holds(text_id, data):
+            return text_id
+        if text_id is None:
+            text_id = self.ids[text_hash] = self.append(data)
+        else:
+            text_id = self.collided.get(text)
+            if text_id is None:
+                text_id = self.collided[text] = self.append(data)
+        return text_id
+
+    def append(self, data):
+        self.buffer += data
+        self.ends.append(len(self.buffer))
+        return len(self.ends) - 1
+
+    # Whether text_id's bytes are data, compared in place
+    def holds(self, text_id, data):
+        start = self.ends[text_id - 1] if text_id else 0
+        return self.ends[text_id] - start == len(data) and self.buffer.startswith(data, start)
+
+    def __getitem__(self, text_id):
+        start = self.ends[text_id - 1] if text_id else 0
+        return self.buffer[start:self.ends[text_id]].decode('utf-8')
+
+    def __len__(self):
+        return len(self.ends)
+
+# Counts of (first, second) pairs of IDs below 2^31, kept in the order each pair was first added
+class PairCounts:
+    def __init__(self, compact_every=COMPACT_EVERY):
+        self.compact_every = compact_every
+        self.keys = np.empty(0, dtype=np.int64)  # first << 32 | second of each merged pair
+        self.counts = np.empty(0, dtype=np.int64)
+        self.new_keys = array('q')
+        self.new_counts = array('q')
+
+    def add(self, first, second, count=1):
+        self.new_keys.append(first << 32 | second)
+        self.new_counts.append(count)
+        if len(self.new_keys) >= self.compact_every:
+            self.compact()
+
+    # Merges the pairs added since the last merge into the distinct pairs, keeping first-seen order
+    def compact(self):
+        if not self.new_keys:
+            return
+        keys = np.concatenate((self.keys, np.frombuffer(self.new_keys, dtype=np.int64)))
+        counts = np.concatenate((self.counts, np.frombuffer(self.new_counts, dtype=np.int64)))
+        self.new_keys = array('q')
+        self.new_counts = array('q')
+        unique_keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=counts, minlength=len(unique_keys)).astype(np.int64)
+        order = np.argsort(first_index, kind='stable')
+        self.keys = unique_keys[order]
+        self.counts = totals[order]
+
+    # (firsts, seconds, counts) arrays of the distinct pairs in the order they were first added
+    def pairs(self):
+        self.compact()
+        return self.keys >> 32, self.keys & 0xFFFFFFFF, self.counts
+
+    def __len__(self):
+        self.compact()
+        return len(self.keys)
@@ -0,0 +1,160 @@
+# Generates a synthetic corpus of <video_id>.txt comment files for benchmarks and checks, in exactly the layout
+# the harvester writes (records through comment_format.write_comment_record, then the count line), together with a
+# <phrase>_search_results.txt file listing the videos, so every script and corpus_index.py can read it
+# The shape of the corpus is set with:
+#   num_videos, mean_comments and comment_spread: comments per video follow a lognormal distribution with that mean
+#     (comment_spread is its sigma; 0 gives every video mean_comments)
+#   shared_authors and author_overlap: each comment's author comes from a pool of shared_authors commenters active
+#     across videos with probability author_overlap (popular commenters more often), otherwise it is a one-off author
+#   reply_ratio: the share of records that are replies to an earlier comment on the same video
+#   campaign_ratio: the share of comments copied, with small changes, from a few campaign texts (so the bot-like,
+#     spam and near-duplicate detection have something to find)
+# The same seed always gives the same corpus
+# Run: python synthetic_corpus.py <folder> [num_videos] [mean_comments]
+
+import itertools
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from comment_format import write_comment_count, write_comment_record
+
+CORPUS_SETTINGS = {
+    'num_videos': 50,
+    'mean_comments': 200,
+    'comment_spread': 1.0,
+    'shared_authors': 2000,
+    'author_overlap': 0.5,
+    'reply_ratio': 0.2,
+    'campaign_ratio': 0.05,
+    'search_phrase': 'synthetic corpus',
+    'seed': 1,
+}
+
+WORDS = ("the war news today people government army city report video update support peace truth world "
+         "country president attack border week time million help again never always think right wrong").split()
+CAMPAIGN_TEXTS = [
+    "Share this video before it gets deleted, the media will not show you the truth about what is happening",
+    "Everyone needs to see this, the real story is being hidden from all of us and nobody is talking about it",
+    "Subscribe and turn on notifications, this channel is the only one telling the truth right now",
+    "This is exactly what they do not want you to know, wake up people and share with everyone you know",
+]
+ID_CHARACTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+START_TIME = datetime(2024, 1, 1)
+
+def random_id(rng, length):
+    return ''.join(rng.choice(ID_CHARACTERS) for _ in range(length))
+
+def format_time(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+# A copy of a campaign text with the small changes copy-paste campaigns make: punctuation, emoji, case
+def campaign_variant(rng):
+    text = rng.choice(CAMPAIGN_TEXTS)
+    change = rng.random()
+    if change < 0.25:
+        text += rng.choice(['!', '!!', ' 🙏', ' 👇👇', '.'])
+    elif change < 0.5:
+        text = text.upper()
+    elif change < 0.6:
+        text = text.replace(',', '')
+    return text
+
+class SyntheticCorpus:
+    def __init__(self, settings=CORPUS_SETTINGS):
+        self.settings = dict(CORPUS_SETTINGS, **settings)
+        self.rng = random.Random(self.settings['seed'])
+        self.shared_authors = [f"@user{index}" for index in range(self.settings['shared_authors'])]
+        # Zipf-like popularity: the commenter at rank r is picked with weight 1 / (r + 1)
+        self.author_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(self.shared_authors))))
+        self.one_off_authors = 0
+
+    def comment_count(self):
+        mean, sigma = self.settings['mean_comments'], self.settings['comment_spread']
+        if sigma <= 0:
+            return int(mean)
+        # The lognormal's mean is exp(mu + sigma^2 / 2), so mu is chosen to make it mean_comments
+        return max(1, int(round(self.rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma))))
+
+    def author(self):
+        if self.shared_authors and self.rng.random() < self.settings['author_overlap']:
+            return self.rng.choices(self.shared_authors, cum_weights=self.author_weights)[0]
+        self.one_off_authors += 1
+        return f"@visitor{self.one_off_authors}"
+
+    def text(self):
+        if self.rng.random() < self.settings['campaign_ratio']:
+            return campaign_variant(self.rng)
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(3, 25))).capitalize()
+
+    # The comment and reply entries of one video, as the harvester builds them
+    def video_comments(self, published_at):
+        comments = []
+        top_level_ids = []
+        moment = published_at
+        for _ in range(self.comment_count()):
+            moment += timedelta(seconds=int(self.rng.expovariate(1 / 120)))
+            entry = {'author': self.author(), 'comment': self.text(), 'like_count': int(self.rng.paretovariate(1.5)) - 1,
+                     'published_at': format_time(moment)}
+            if top_level_ids and self.rng.random() < self.settings['reply_ratio']:
+                parent_id = self.rng.choice(top_level_ids)
+                entry.update(type='reply', comment_id=f"{parent_id}.{random_id(self.rng, 22)}", reply_to=parent_id)
+            else:
+                entry.update(type='comment', comment_id='Ug' + random_id(self.rng, 24))
+                top_level_ids.append(entry['comment_id'])
+            comments.append(entry)
+        return comments
+
+    # (search result, comment and reply entries) for every video, generated one video at a time
+    def iter_videos(self):
+        for index in range(self.settings['num_videos']):
+            video_id = random_id(self.rng, 11)
+            published_at = START_TIME + timedelta(minutes=self.rng.randrange(60 * 24 * 90))
+            comments = self.video_comments(published_at)
+            yield ({'video_id': video_id, 'title': f"Synthetic video {index}", 'channelTitle': f"Channel {index % 17}",
+                    'publishedAt': format_time(published_at)}, comments)
+
+    # Writes the corpus into directory_path; returns the search results (video_id, title, channelTitle, publishedAt)
+    def write(self, directory_path):
+        os.makedirs(directory_path, exist_ok=True)
+        search_results = []
+        total_comments = 0
+        for video, comments in self.iter_videos():
+            total_comments += len(comments)
+            with open(os.path.join(directory_path, f"{video['video_id']}.txt"), 'w', encoding='utf-8') as file:
+                for comment in comments:
+                    write_comment_record(file, comment)
+                write_comment_count(file, len(comments))
+            search_results.append(video)
+        self.write_search_results(directory_path, search_results)
+        print(f"Wrote {len(search_results)} videos with {total_comments} comments to {directory_path}")
+        return search_results
+
+    # Same layout as the harvester's save_search_results_to_file
+    def write_search_results(self, directory_path, search_results):
+        keyword = self.settings['search_phrase']
+        file_path = os.path.join(directory_path, f"{keyword.replace(' ', '_')}_search_results.txt")
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write(f"Search Timestamp: {START_TIME.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            file.write(f"Search Phrase: {keyword}\n")
+            file.write(f"Number of Videos: {len(search_results)}\n\n")
+            for video in search_results:
+                file.write(f"Video ID: {video['video_id']}\n")
+                file.write(f"Video Title: {video['title']}\n")
+                file.write(f"Channel Title: {video['channelTitle']}\n")
+                file.write(f"Published At: {video['publishedAt']}\n\n")
+
+def write_corpus(directory_path, **settings):
+    return SyntheticCorpus(settings).write(directory_path)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python synthetic_corpus.py <folder> [num_videos] [mean_comments]")
+        sys.exit(1)
+    settings = {}
+    if len(sys.argv) > 2:
+        settings['num_videos'] = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        settings['mean_comments'] = int(sys.argv[3])
+    write_corpus(sys.argv[1], **settings)
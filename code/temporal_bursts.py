@@ -0,0 +1,118 @@
+# Posting-time analysis for coordinated behavior, used by gephi_burst_network.py
+# Bursts: many comments on one video (or from one commenter) inside a short sliding window
+# Synchronized pairs: two commenters posting in the same short time bucket on the same videos again and again
+# Timestamps are sorted once per group (video or commenter) and every window is counted at the same time with
+# numpy searchsorted, so no timestamps are compared pairwise; synchronized pairs come from the sparse
+# commenter x time-bucket matrix in cocommenter_matrix.py
+# Needs numpy and scipy
+
+import numpy as np
+from cocommenter_matrix import build_incidence, iter_cocommenter_edges
+
+# 'YYYY-MM-DDTHH:MM:SSZ' strings (as the API returns them) to seconds since 1970
+def parse_timestamps(published_at):
+    return np.array([value.rstrip('Z') for value in published_at], dtype='datetime64[s]').astype(np.int64)
+
+def format_timestamp(seconds):
+    return str(np.datetime64(int(seconds), 's'))
+
+# Gephi interval list for a time set column, e.g. "<[2024-01-01T10:00:00, 2024-01-01T10:05:00]; [...]>"
+def format_intervals(intervals):
+    return '<' + '; '.join(f"[{format_timestamp(start)}, {format_timestamp(end)}]" for start, end in intervals) + '>'
+
+# Merges (start, end) intervals (in whole seconds) that overlap or follow on from each other
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+# Finds bursts of at least min_comments timestamps within window_seconds, for every group at once
+# groups and timestamps are parallel int arrays; returns (order, burst_groups, first, last) where order sorts the
+# input by group and time, and each burst covers order[first:last + 1]; overlapping windows are merged into one burst
+def find_bursts(groups, timestamps, window_seconds, min_comments):
+    order = np.lexsort((timestamps, groups))
+    if not len(order):
+        empty = np.zeros(0, dtype=np.int64)
+        return order, empty, empty, empty
+    sorted_groups = groups[order]
+    sorted_times = timestamps[order] - timestamps.min()
+    # Spread the groups far enough apart on one time axis that no window reaches into the next group
+    keys = sorted_groups.astype(np.int64) * (int(sorted_times.max()) + window_seconds + 1) + sorted_times
+    window_ends = np.searchsorted(keys, keys + window_seconds, side='right')  # One past the last timestamp in each window
+    starts = np.flatnonzero(window_ends - np.arange(len(keys)) >= min_comments)
+    if not len(starts):
+        empty = np.zeros(0, dtype=np.int64)
+        return order, empty, empty, empty
+    ends = window_ends[starts] - 1
+    reach = np.maximum.accumulate(ends)
+    new_burst = np.ones(len(starts), dtype=bool)
+    new_burst[1:] = starts[1:] > reach[:-1]
+    first = starts[new_burst]
+    last = np.maximum.reduceat(ends, np.flatnonzero(new_burst))
+    return order, sorted_groups[first], first, last
+
+# Comments (video_id, author, published_at) as a table of parallel arrays with videos and authors numbered
+class CommentTimes:
+    def __init__(self, comments):
+        video_ids = {}
+        authors = {}
+        video_column = []
+        author_column = []
+        published_at = []
+        for video_id, author, timestamp in comments:
+            if not author or not timestamp:
+                continue
+            video_column.append(video_ids.setdefault(video_id, len(video_ids)))
+            author_column.append(authors.setdefault(author, len(authors)))
+            published_at.append(timestamp)
+        self.video_ids = list(video_ids)
+        self.authors = list(authors)
+        self.videos = np.array(video_column, dtype=np.int64)
+        self.commenters = np.array(author_column, dtype=np.int64)
+        self.timestamps = parse_timestamps(published_at) if published_at else np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+# Bursts on each video: yields (video_id, start, end, {author: comments in the burst})
+def video_bursts(times, window_seconds=60, min_comments=20):
+    order, groups, first, last = find_bursts(times.videos, times.timestamps, window_seconds, min_comments)
+    for video, start, end in zip(groups.tolist(), first.tolist(), last.tolist()):
+        rows = order[start:end + 1]
+        authors, counts = np.unique(times.commenters[rows], return_counts=True)
+        yield (times.video_ids[video], int(times.timestamps[rows[0]]), int(times.timestamps[rows[-1]]),
+               {times.authors[author]: int(count) for author, count in zip(authors.tolist(), counts.tolist())})
+
+# Rapid posting by one commenter across all videos: yields (author, start, end, number of comments)
+def author_bursts(times, window_seconds=300, min_comments=10):
+    order, groups, first, last = find_bursts(times.commenters, times.timestamps, window_seconds, min_comments)
+    for author, start, end in zip(groups.tolist(), first.tolist(), last.tolist()):
+        rows = order[start:end + 1]
+        yield times.authors[author], int(times.timestamps[rows[0]]), int(times.timestamps[rows[-1]]), end - start + 1
+
+# Pairs of commenters who posted in the same sync_seconds bucket of the same video at least min_windows times
+# Yields (author, author, number of shared buckets, [(start, end), ...] merged bucket intervals)
+def synchronized_pairs(times, sync_seconds=60, min_windows=3):
+    buckets = times.timestamps // sync_seconds
+    order = np.lexsort((buckets, times.videos))
+    keys = np.stack((times.videos[order], buckets[order]), axis=1)
+    if not len(keys):
+        return
+    boundaries = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+    bucket_rows = np.split(order, boundaries)
+    bucket_starts = [int(buckets[rows[0]]) * sync_seconds for rows in bucket_rows]
+    incidence, authors, _ = build_incidence(
+        (column, [times.authors[author] for author in times.commenters[rows].tolist()])
+        for column, rows in enumerate(bucket_rows))
+    for rows, columns, weights in iter_cocommenter_edges(incidence, min_weight=min_windows):
+        for i, j, weight in zip(rows.tolist(), columns.tolist(), weights.tolist()):
+            # Only the pairs that are kept are looked at bucket by bucket, to find when they were in sync
+            shared = np.intersect1d(incidence.indices[incidence.indptr[i]:incidence.indptr[i + 1]],
+                                    incidence.indices[incidence.indptr[j]:incidence.indptr[j + 1]], assume_unique=True)
+            intervals = merge_intervals(
+                (bucket_starts[column], bucket_starts[column] + sync_seconds - 1) for column in shared.tolist())
+            yield authors[i], authors[j], weight, intervals
@@ -0,0 +1,197 @@
+# Processed-video ledger for the comment harvester
+# Replaces rescanning and rewriting "Video List.txt" for every video: the ledger is a SQLite table keyed by video ID
+# plus an in-memory set of the IDs, so checking a video and adding one no longer depend on how many videos are listed
+# An existing "Video List.txt" is imported the first time the ledger is opened, and the ledger can write
+# "Video List.txt" back out in the same format whenever the human-readable list is needed
+# Hand edits to "Video List.txt" are kept: whenever the file changed since the ledger last read or wrote it, videos
+# added to it are added to the ledger and videos deleted from it are removed (so they are harvested again)
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+VIDEO_COUNT_LINE = "Number of Videos: "
+
+# Reads the video entries of a "Video List.txt" file in the order they were added
+def read_video_list(video_list_path):
+    videos = []
+    entry = {}
+    fields = {
+        "Added Timestamp:": 'added_timestamp',
+        "Search Phrase:": 'search_phrase',
+        "Video ID:": 'video_id',
+        "Video Title:": 'title',
+        "Channel Title:": 'channelTitle',
+        "Published At:": 'publishedAt',
+    }
+    with open(video_list_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.rstrip('\n')
+            for prefix, key in fields.items():
+                if line.startswith(prefix):
+                    # A new entry starts at its timestamp, or at a repeated field if an entry is missing one
+                    if key == 'added_timestamp' or key in entry:
+                        if 'video_id' in entry:
+                            videos.append(entry)
+                        entry = {}
+                    entry[key] = line[len(prefix):].strip()
+                    break
+    if 'video_id' in entry:
+        videos.append(entry)
+    return videos
+
+# Modification time and size of a file, or None if it does not exist
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns} {stat.st_size}"
+
+class VideoLedger:
+    def __init__(self, db_path, video_list_path=None):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS processed_videos ("
+            " position INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " video_id TEXT NOT NULL UNIQUE,"
+            " added_timestamp TEXT, search_phrase TEXT, title TEXT, channel_title TEXT, published_at TEXT)"
+        )
+        # What "Video List.txt" looked like when the ledger last read or wrote it
+        self.connection.execute("CREATE TABLE IF NOT EXISTS ledger_state (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.commit()
+        self.video_ids = {row[0] for row in self.connection.execute("SELECT video_id FROM processed_videos")}
+        self.last_id = self.find_last_id()
+
+        self.video_list_path = video_list_path
+        if video_list_path is not None:
+            self.sync_video_list()
+
+    def __contains__(self, video_id):
+        return video_id in self.video_ids
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    def last_video_id(self):
+        return self.last_id
+
+    def find_last_id(self):
+        last_row = self.connection.execute(
+            "SELECT video_id FROM processed_videos ORDER BY position DESC LIMIT 1").fetchone()
+        return last_row[0] if last_row else None
+
+    def get_state(self, key):
+        row = self.connection.execute("SELECT value FROM ledger_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO ledger_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # Returns False if the video was already in the ledger
+    def add(self, video, keyword, added_timestamp=None, commit=True):
+        video_id = video['video_id']
+        if added_timestamp is None:
+            added_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            if video_id in self.video_ids:
+                return False
+            self.connection.execute(
+                "INSERT INTO processed_videos (video_id, added_timestamp, search_phrase, title, channel_title, published_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, added_timestamp, keyword, video.get('title'), video.get('channelTitle'), video.get('publishedAt'))
+            )
+            if commit:
+                self.connection.commit()
+            self.video_ids.add(video_id)
+            self.last_id = video_id
+        return True
+
+    # Removes videos so they are harvested again; returns how many were in the ledger
+    def remove(self, video_ids):
+        removed = 0
+        with self.lock:
+            for video_id in video_ids:
+                if video_id in self.video_ids:
+                    self.connection.execute("DELETE FROM processed_videos WHERE video_id = ?", (video_id,))
+                    self.video_ids.discard(video_id)
+                    removed += 1
+            self.connection.commit()
+            self.last_id = self.find_last_id()
+        return removed
+
+    def import_video_list(self, video_list_path):
+        imported = 0
+        for entry in read_video_list(video_list_path):
+            if self.add(entry, entry.get('search_phrase'), entry.get('added_timestamp'), commit=False):
+                imported += 1
+        self.connection.commit()
+        return imported
+
+    # Records the ledger's "Video List.txt" as matching the ledger up to the last video added; needs the lock
+    def mark_synced(self):
+        self.set_state('video_list_stamp', file_stamp(self.video_list_path))
+        self.set_state('synced_position', self.connection.execute(
+            "SELECT COALESCE(MAX(position), 0) FROM processed_videos").fetchone()[0])
+        self.connection.commit()
+
+    # Takes in hand edits to the ledger's "Video List.txt" if the file changed since the ledger last read or wrote it
+    # Only videos that were in the file then can have been deleted from it; a ledger that has never seen the file
+    # (e.g. one made before the file was tracked) only imports from it
+    def sync_video_list(self):
+        stamp = file_stamp(self.video_list_path)
+        if stamp is None or stamp == self.get_state('video_list_stamp'):
+            return
+        listed_ids = {entry['video_id'] for entry in read_video_list(self.video_list_path)}
+        synced_position = int(self.get_state('synced_position') or 0)
+        deleted_ids = [row[0] for row in self.connection.execute(
+            "SELECT video_id FROM processed_videos WHERE position <= ?", (synced_position,)) if row[0] not in listed_ids]
+        removed = self.remove(deleted_ids)
+        imported = self.import_video_list(self.video_list_path)
+        with self.lock:
+            self.mark_synced()
+        if imported or removed:
+            print(f"{self.video_list_path} was changed: imported {imported} videos into the video ledger "
+                  f"and removed {removed} to be harvested again.")
+
+    def videos(self):
+        rows = self.connection.execute(
+            "SELECT added_timestamp, search_phrase, video_id, title, channel_title, published_at"
+            " FROM processed_videos ORDER BY position")
+        for added_timestamp, search_phrase, video_id, title, channel_title, published_at in rows:
+            yield {
+                'added_timestamp': added_timestamp,
+                'search_phrase': search_phrase,
+                'video_id': video_id,
+                'title': title,
+                'channelTitle': channel_title,
+                'publishedAt': published_at,
+            }
+
+    # Writes the ledger in the "Video List.txt" format (by default to the ledger's own file, after taking in any
+    # hand edits made to it meanwhile); the file is replaced in one step, so it is never left half-written
+    def export_video_list(self, video_list_path=None):
+        own_file = video_list_path is None or video_list_path == self.video_list_path
+        if video_list_path is None:
+            video_list_path = self.video_list_path
+        if own_file:
+            self.sync_video_list()
+        temp_path = video_list_path + '.tmp'
+        with self.lock:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(f"{VIDEO_COUNT_LINE}{len(self.video_ids)}\n")
+                for video in self.videos():
+                    file.write(f"Added Timestamp: {video['added_timestamp']}\n")
+                    file.write(f"Search Phrase: {video['search_phrase']}\n")
+                    file.write(f"Video ID: {video['video_id']}\n")
+                    file.write(f"Video Title: {video['title']}\n")
+                    file.write(f"Channel Title: {video['channelTitle']}\n")
+                    file.write(f"Published At: {video['publishedAt']}\n\n")
+            os.replace(temp_path, video_list_path)
+            if own_file:
+                self.mark_synced()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,64 @@
+# Shared YouTube Data API client for the comment harvester
+# The discovery client is built once; every worker thread gets its own HTTP connection from it,
+# so several videos and reply threads can be fetched at the same time without rebuilding the client per video
+# Each worker thread can be capped to a number of API calls per second
+# A fake service object (anything with commentThreads()/comments()/search() returning requests with execute()) can be
+# passed in instead of an API key to run the harvester offline
+
+import threading
+import time
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+
+class RateLimiter:
+    def __init__(self, calls_per_second=None):
+        self.min_interval = 1.0 / calls_per_second if calls_per_second else 0.0
+        self.next_call_time = 0.0
+
+    # Blocks until the next call is allowed; one limiter belongs to one worker thread
+    def wait(self):
+        if not self.min_interval:
+            return
+        now = time.monotonic()
+        if now < self.next_call_time:
+            time.sleep(self.next_call_time - now)
+            now = self.next_call_time
+        self.next_call_time = now + self.min_interval
+
+class YouTubeClientPool:
+    def __init__(self, api_key=None, service=None, calls_per_second=None):
+        if service is None:
+            self.service = build('youtube', 'v3', developerKey=api_key)
+            self.http_factory = build_http
+        else:
+            self.service = service
+            self.http_factory = None  # Fakes execute without a transport
+        self.calls_per_second = calls_per_second
+        self.local = threading.local()
+
+    # Per-thread state: the worker's own HTTP connection and rate limiter
+    def worker_state(self):
+        state = self.local
+        if not hasattr(state, 'limiter'):
+            state.limiter = RateLimiter(self.calls_per_second)
+            state.http = self.http_factory() if self.http_factory else None
+        return state
+
+    def execute(self, request):
+        state = self.worker_state()
+        state.limiter.wait()
+        if state.http is None:
+            return request.execute()
+        return request.execute(http=state.http)
+
+    def search(self):
+        return self.service.search()
+
+    def comment_threads(self):
+        return self.service.commentThreads()
+
+    def comments(self):
+        return self.service.comments()
+
+    def videos(self):
+        return self.service.videos()